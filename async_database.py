@@ -0,0 +1,274 @@
+"""
+Asynchroniczna warstwa dostępu do bazy danych.
+
+Każda funkcja z modułu `database` ma tu swój odpowiednik do użycia przez `await`,
+więc handlery zdarzeń i zadania `tasks.loop` nie blokują pętli zdarzeń discord.py.
+Zapisy trafiają do jednego dedykowanego wątku pisarza (SQLite i tak serializuje zapisy,
+a jeden pisarz eliminuje czekanie na blokadę), odczyty do kilku wątków czytelników,
+które dzięki trybowi WAL działają równolegle z pisarzem.
+"""
+import asyncio
+import functools
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client
+
+import database
+import metrics
+from utils.word_filter import BannedWordMatcher
+
+READER_THREADS = 4
+
+# Tryb wieloprocesowy (launcher.py): zapisy wszystkich procesów bota wykonuje jeden proces pisarza (db_writer.py).
+# Odczyty zostają lokalne - WAL pozwala czytać z wielu procesów równolegle z pisarzem.
+DB_WRITER_ADDRESS = os.getenv('DB_WRITER_ADDRESS') # "host:port"
+DB_WRITER_AUTHKEY = bytes.fromhex(os.getenv('DB_WRITER_AUTHKEY', ''))
+
+_writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_reader_executor = ThreadPoolExecutor(max_workers=READER_THREADS, thread_name_prefix="db-reader")
+WRITER_FUNCTIONS = set() # Nazwy funkcji database, które proces pisarza może wykonać na zlecenie
+_writer_connection = None # Połączenie z procesem pisarza; używane tylko z wątku _writer_executor
+
+def _run_in(executor: ThreadPoolExecutor, func):
+    # Czas mierzony w pętli zdarzeń: wykonanie zapytania plus czekanie w kolejce wątku - tyle, ile czeka handler
+    @metrics.timed("db_call")
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+def _reader(func):
+    return _run_in(_reader_executor, func)
+
+def _call_writer_process(name: str, args: tuple, kwargs: dict):
+    global _writer_connection
+    for attempt in range(2):
+        if _writer_connection is None:
+            host, port = DB_WRITER_ADDRESS.rsplit(":", 1)
+            _writer_connection = Client((host, int(port)), authkey=DB_WRITER_AUTHKEY)
+        try:
+            _writer_connection.send((name, args, kwargs))
+            ok, result = _writer_connection.recv()
+            break
+        except (EOFError, OSError):
+            # Pisarz zrestartowany - jedno ponowienie na nowym połączeniu
+            _writer_connection = None
+            if attempt:
+                raise
+    if not ok:
+        raise result
+    return result
+
+def _guild_id_argument(args: tuple, kwargs: dict):
+    return kwargs["guild_id"] if "guild_id" in kwargs else (args[0] if args else None)
+
+# Cache w pamięci tego procesu, które database unieważnia przy zapisie. Przy zdalnym zapisie robi to proces
+# pisarza we własnej pamięci, więc tu unieważniamy je sami (serwer jest obsługiwany tylko przez jeden proces bota).
+_LOCAL_CACHE_EFFECTS = {
+    "update_server_config": database.server_config_cache,
+    "add_banned_word": database.banned_word_matcher_cache,
+    "remove_banned_word": database.banned_word_matcher_cache,
+    "add_custom_command": database.custom_command_index_cache,
+    "edit_custom_command": database.custom_command_index_cache,
+    "remove_custom_command": database.custom_command_index_cache,
+}
+
+def _remote_writer(func):
+    name = func.__name__
+    cache = _LOCAL_CACHE_EFFECTS.get(name)
+
+    @metrics.timed("db_call")
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_writer_executor, _call_writer_process, name, args, kwargs)
+        if cache is not None:
+            cache.invalidate(_guild_id_argument(args, kwargs))
+        return result
+    return wrapper
+
+def _writer(func):
+    WRITER_FUNCTIONS.add(func.__name__)
+    if DB_WRITER_ADDRESS:
+        return _remote_writer(func)
+    return _run_in(_writer_executor, func)
+
+_expiry_scheduler = None # schedule(rodzaj, termin) silnika wygasania; ustawia main.py (set_expiry_scheduler)
+
+def set_expiry_scheduler(schedule):
+    global _expiry_scheduler
+    _expiry_scheduler = schedule
+
+def _expiring_writer(func, kind: str, deadline_parameter: str):
+    """
+    _writer dla wpisów z terminem wygaśnięcia: po zapisie dokłada termin do silnika wygasania
+    (expiry_engine.ExpiryEngine.schedule). Silnik nie odpytuje bazy między terminami, więc wpis dodany
+    z pominięciem tego kroku wygasłby dopiero po restarcie.
+    """
+    write = _writer(func)
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        result = await write(*args, **kwargs)
+        deadline = signature.bind(*args, **kwargs).arguments.get(deadline_parameter)
+        if deadline is not None and _expiry_scheduler is not None:
+            _expiry_scheduler(kind, deadline)
+        return result
+    return wrapper
+
+def shutdown():
+    """Czeka na dokończenie zleconych operacji i zamyka pulę połączeń. Wywoływać po zatrzymaniu bota."""
+    _writer_executor.shutdown(wait=True)
+    _reader_executor.shutdown(wait=True)
+    if _writer_connection is not None:
+        _writer_connection.close()
+    database.close_pool()
+
+init_db = _writer(database.init_db)
+get_bot_state = _reader(database.get_bot_state)
+set_bot_state = _writer(database.set_bot_state)
+
+# --- Konfiguracja Serwera ---
+update_server_config = _writer(database.update_server_config)
+_get_server_config_from_db = _reader(database.get_server_config)
+
+async def get_server_config(guild_id: int) -> database.ServerConfig | None:
+    # Trafienie w cache to zwykły odczyt ze słownika - bez przeskoku do wątku czytelnika.
+    config = database.server_config_cache.get(guild_id, database.NOT_CACHED)
+    if config is not database.NOT_CACHED:
+        metrics.inc("db_cache_hit", "get_server_config")
+        return config
+    return await _get_server_config_from_db(guild_id)
+
+# --- Kary ---
+add_punishment = _expiring_writer(database.add_punishment, "punishments", "expires_at")
+deactivate_punishment = _writer(database.deactivate_punishment)
+deactivate_punishments = _writer(database.deactivate_punishments)
+get_active_user_punishment = _reader(database.get_active_user_punishment)
+get_expired_active_punishments = _reader(database.get_expired_active_punishments)
+get_user_punishments = _reader(database.get_user_punishments)
+
+# --- Czarna Lista Słów ---
+add_banned_word = _writer(database.add_banned_word)
+remove_banned_word = _writer(database.remove_banned_word)
+get_banned_words = _reader(database.get_banned_words)
+_get_banned_word_matcher_from_db = _reader(database.get_banned_word_matcher)
+
+async def get_banned_word_matcher(guild_id: int) -> BannedWordMatcher:
+    matcher = database.banned_word_matcher_cache.get(guild_id)
+    if matcher is not None:
+        metrics.inc("db_cache_hit", "get_banned_word_matcher")
+        return matcher
+    return await _get_banned_word_matcher_from_db(guild_id)
+
+# --- Quiz Weryfikacyjny ---
+add_quiz_question = _writer(database.add_quiz_question)
+remove_quiz_question = _writer(database.remove_quiz_question)
+get_quiz_questions = _reader(database.get_quiz_questions)
+
+# --- Role Czasowe ---
+add_timed_role = _expiring_writer(database.add_timed_role, "timed_roles", "expiration_timestamp")
+get_expired_roles = _reader(database.get_expired_roles)
+remove_timed_role = _writer(database.remove_timed_role)
+remove_timed_roles = _writer(database.remove_timed_roles)
+get_active_timed_role = _reader(database.get_active_timed_role)
+
+# --- Terminy wygasania ---
+get_pending_expiry_deadlines = _reader(database.get_pending_expiry_deadlines)
+
+# --- Aktywność Użytkownika (XP, Poziomy) ---
+# get_user_stats tworzy brakujący wiersz (INSERT OR IGNORE), więc idzie przez pisarza.
+ensure_user_activity_entry = _writer(database.ensure_user_activity_entry)
+increment_message_count = _writer(database.increment_message_count)
+add_xp = _writer(database.add_xp)
+grant_xp = _writer(database.grant_xp)
+get_user_stats = _writer(database.get_user_stats)
+get_user_activity = _reader(database.get_user_activity)
+apply_user_activity_deltas = _writer(database.apply_user_activity_deltas)
+set_user_level = _writer(database.set_user_level)
+
+# --- Role za Aktywność ---
+add_activity_role_config = _writer(database.add_activity_role_config)
+remove_activity_role_config = _writer(database.remove_activity_role_config)
+get_activity_role_configs = _reader(database.get_activity_role_configs)
+get_highest_eligible_role = _reader(database.get_highest_eligible_role)
+
+# --- Nagrody za Poziomy ---
+add_level_reward = _writer(database.add_level_reward)
+remove_level_reward = _writer(database.remove_level_reward)
+get_rewards_for_level = _reader(database.get_rewards_for_level)
+get_all_level_rewards_config = _reader(database.get_all_level_rewards_config)
+
+# --- Ranking ---
+get_server_leaderboard = _reader(database.get_server_leaderboard)
+get_user_rank_in_server = _reader(database.get_user_rank_in_server)
+get_guild_xp_rows = _reader(database.get_guild_xp_rows)
+
+# --- Ankiety ---
+create_poll = _expiring_writer(database.create_poll, "polls", "ends_at")
+add_poll_option = _writer(database.add_poll_option)
+set_poll_message_id = _writer(database.set_poll_message_id)
+get_poll_by_message_id = _reader(database.get_poll_by_message_id)
+get_active_polls_to_close = _reader(database.get_active_polls_to_close)
+close_poll = _writer(database.close_poll)
+get_poll_options = _reader(database.get_poll_options)
+get_poll_details = _reader(database.get_poll_details)
+
+# --- Niestandardowe Komendy ---
+add_custom_command = _writer(database.add_custom_command)
+edit_custom_command = _writer(database.edit_custom_command)
+remove_custom_command = _writer(database.remove_custom_command)
+get_custom_command = _reader(database.get_custom_command)
+get_all_custom_commands = _reader(database.get_all_custom_commands)
+_get_custom_command_index_from_db = _reader(database.get_custom_command_index)
+
+async def get_custom_command_index(guild_id: int) -> dict[str, database.CustomCommand]:
+    index = database.custom_command_index_cache.get(guild_id)
+    if index is not None:
+        metrics.inc("db_cache_hit", "get_custom_command_index")
+        return index
+    return await _get_custom_command_index_from_db(guild_id)
+
+# --- Konkursy (Giveaways) ---
+create_giveaway = _expiring_writer(database.create_giveaway, "giveaways", "ends_at")
+set_giveaway_message_id = _writer(database.set_giveaway_message_id)
+get_active_giveaways_to_end = _reader(database.get_active_giveaways_to_end)
+end_giveaway = _writer(database.end_giveaway)
+get_giveaway_details = _reader(database.get_giveaway_details)
+
+# --- Tickety ---
+create_ticket = _writer(database.create_ticket)
+set_ticket_channel_id = _writer(database.set_ticket_channel_id)
+get_open_ticket_by_user = _reader(database.get_open_ticket_by_user)
+get_ticket_by_channel = _reader(database.get_ticket_by_channel)
+close_ticket = _writer(database.close_ticket)
+
+# --- Monitorowanie Produktów ---
+subscribe_to_product = _writer(database.subscribe_to_product)
+get_watched_product_by_url = _reader(database.get_watched_product_by_url)
+unsubscribe_from_product = _writer(database.unsubscribe_from_product)
+get_user_watched_products = _reader(database.get_user_watched_products)
+get_guild_watched_products = _reader(database.get_guild_watched_products)
+get_product_subscribers = _reader(database.get_product_subscribers)
+get_all_active_watched_products = _reader(database.get_all_active_watched_products)
+get_watched_products_due_between = _reader(database.get_watched_products_due_between)
+get_watched_products_by_ids = _reader(database.get_watched_products_by_ids)
+update_watched_product_data = _writer(database.update_watched_product_data)
+add_price_history_entry = _writer(database.add_price_history_entry)
+record_product_scan_results = _writer(database.record_product_scan_results)
+downsample_price_history = _writer(database.downsample_price_history)
+get_all_guilds_with_product_report_config = _reader(database.get_all_guilds_with_product_report_config)
+get_unscheduled_product_report_configs = _reader(database.get_unscheduled_product_report_configs)
+set_product_report_schedule = _writer(database.set_product_report_schedule)
+remove_product_report_schedule = _writer(database.remove_product_report_schedule)
+get_next_product_report_attempt = _reader(database.get_next_product_report_attempt)
+get_due_product_reports = _writer(database.get_due_product_reports) # Usuwa terminy wyłączonych raportów
+mark_product_report_attempt = _writer(database.mark_product_report_attempt)
+retry_product_report = _writer(database.retry_product_report)
+advance_product_report = _writer(database.advance_product_report)
+get_product_changes_for_report = _reader(database.get_product_changes_for_report)
+get_top_price_drops = _reader(database.get_top_price_drops)
+get_price_history = _reader(database.get_price_history)
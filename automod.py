@@ -0,0 +1,175 @@
+"""
+Auto-moderacja wiadomości jako jeden potok reguł.
+
+Reguły są sprawdzane od najtańszej: najpierw te, które nie czytają treści (liczba wzmianek), potem
+wykrywanie powtórzeń (skrót treści), a na końcu jedno przejście wyrażenia regularnego po treści.
+Wszystkie reguły oparte o wzorce (zakazane słowa serwera, zaproszenia Discord, ...) są sklejane w jedno
+skompilowane wyrażenie z grupami nazwanymi - nowa reguła-wzorzec nie dodaje kolejnego przejścia po wiadomości.
+Pierwsza trafiona reguła kończy sprawdzanie i zwraca Verdict; usunięcie, powiadomienie autora i log
+są wspólne dla wszystkich reguł (AutoModPipeline.enforce).
+
+Każda reguła (i jedno wspólne przejście po treści) ma licznik trafień i histogram czasu z metrics.REGISTRY.
+"""
+import re
+import time
+
+import discord
+
+import metrics
+from utils.lru_cache import LRUCache
+
+SCANNER_CACHE_SIZE = 5000
+MAX_MENTIONS = 5
+
+class Verdict:
+    __slots__ = ("rule", "reason", "detail")
+
+    def __init__(self, rule: str, reason: str, detail: str):
+        self.rule = rule # Nazwa reguły
+        self.reason = reason # Dla autora wiadomości ("spam", "linki zapraszające", ...)
+        self.detail = detail # Do logu moderacji
+
+    def __repr__(self) -> str:
+        return f"Verdict({self.rule!r}, {self.detail!r})"
+
+class Rule:
+    """Reguła niezależna od treści (albo z własnym, tanim odczytem treści). check() zwraca opis do logu albo None."""
+    __slots__ = ("name", "config_flag", "reason", "hits", "latency")
+
+    def __init__(self, name: str, config_flag: str, reason: str):
+        self.name = name
+        self.config_flag = config_flag # Atrybut ServerConfig włączający regułę
+        self.reason = reason
+        self.hits = 0
+        self.latency = metrics.histogram("automod_rule", name) # Wspólny z eksportem metryk
+
+    def check(self, message: discord.Message) -> str | None:
+        raise NotImplementedError
+
+class MentionFloodRule(Rule):
+    __slots__ = ("max_mentions",)
+
+    def __init__(self, max_mentions: int = MAX_MENTIONS):
+        super().__init__("mention_flood", "filter_spam_enabled", "nadmierne wzmianki")
+        self.max_mentions = max_mentions
+
+    def check(self, message: discord.Message) -> str | None:
+        if len(message.mentions) + len(message.role_mentions) > self.max_mentions:
+            return "Wykryto nadmierną liczbę wzmianek (spam)."
+        return None
+
+class RepeatRule(Rule):
+    __slots__ = ("ring",)
+
+    def __init__(self, ring):
+        super().__init__("repeat", "filter_spam_enabled", "spam")
+        self.ring = ring # utils.state_store.SpamRing
+
+    def check(self, message: discord.Message) -> str | None:
+        if self.ring.push((message.guild.id, message.author.id), message.content):
+            return "Wykryto powtarzające się wiadomości (spam)."
+        return None
+
+class PatternRule:
+    """
+    Reguła-wzorzec. `pattern` stały albo None - wtedy wzorzec jest per serwer (np. czarna lista słów)
+    i przekazywany do evaluate() w `guild_patterns`. Wzorzec nie może mieć grup przechwytujących.
+    """
+    __slots__ = ("name", "config_flag", "reason", "pattern", "describe", "hits")
+
+    def __init__(self, name: str, config_flag: str, reason: str, describe, pattern: str | None = None):
+        self.name = name
+        self.config_flag = config_flag
+        self.reason = reason
+        self.describe = describe # describe(dopasowany_tekst) -> opis do logu
+        self.pattern = pattern
+        self.hits = 0
+
+class AutoModPipeline:
+    def __init__(self, rules: list[Rule], pattern_rules: list[PatternRule], log_action=None):
+        self.rules = rules # W kolejności kosztu, od najtańszej
+        self.pattern_rules = {rule.name: rule for rule in pattern_rules}
+        self.log_action = log_action # async log_action(message, verdict, server_config)
+        self.scan_latency = metrics.histogram("automod_rule", "pattern_scan")
+        self.evaluated = 0
+        self._scanners = LRUCache(SCANNER_CACHE_SIZE) # guild_id -> (klucz, skompilowane wyrażenie)
+
+    def _scanner(self, guild_id: int, server_config, guild_patterns: dict[str, str | None]):
+        """Jedno wyrażenie z włączonych reguł-wzorców serwera; przebudowywane tylko po zmianie ustawień lub wzorców."""
+        active = []
+        for name, rule in self.pattern_rules.items():
+            pattern = rule.pattern if rule.pattern is not None else guild_patterns.get(name)
+            if pattern and getattr(server_config, rule.config_flag, False):
+                active.append((name, pattern))
+        key = tuple(active)
+        cached = self._scanners.get(guild_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        regex = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in active), re.IGNORECASE) if active else None
+        self._scanners.put(guild_id, (key, regex))
+        return regex
+
+    def evaluate(self, message: discord.Message, server_config, guild_patterns: dict[str, str | None] | None = None) -> Verdict | None:
+        """Zwraca werdykt pierwszej trafionej reguły albo None. Nie wykonuje żadnych akcji."""
+        self.evaluated += 1
+        for rule in self.rules:
+            if not getattr(server_config, rule.config_flag, False):
+                continue
+            started_at = time.perf_counter()
+            detail = rule.check(message)
+            rule.latency.record(time.perf_counter() - started_at)
+            if detail:
+                rule.hits += 1
+                return Verdict(rule.name, rule.reason, detail)
+
+        if not message.content:
+            return None
+        started_at = time.perf_counter()
+        regex = self._scanner(message.guild.id, server_config, guild_patterns or {})
+        match = regex.search(message.content) if regex is not None else None
+        self.scan_latency.record(time.perf_counter() - started_at)
+        if match is None:
+            return None
+        rule = self.pattern_rules[match.lastgroup]
+        rule.hits += 1
+        return Verdict(rule.name, rule.reason, rule.describe(match.group(0)))
+
+    async def enforce(self, message: discord.Message, verdict: Verdict, server_config) -> bool:
+        """Wspólna ścieżka dla każdej reguły: usunięcie, informacja dla autora (DM), log moderacji. True = usunięto."""
+        try:
+            await message.delete()
+        except discord.HTTPException as e:
+            print(f"Błąd auto-moderacji ({verdict.rule}): {e}")
+            return False
+        try:
+            await message.author.send(f"Twoja wiadomość na **{message.guild.name}** została usunięta ({verdict.reason}).")
+        except discord.HTTPException:
+            pass # Zamknięte DM
+        if self.log_action is not None:
+            try:
+                await self.log_action(message, verdict, server_config)
+            except Exception as e:
+                print(f"Błąd logowania akcji auto-moderacji ({verdict.rule}): {e}")
+        return True
+
+    def stats(self) -> list[dict]:
+        """Trafienia i czasy per reguła; reguły-wzorce dzielą jedno przejście po treści (scan_latency)."""
+        rows = [{"rule": rule.name, "hits": rule.hits, **rule.latency.summary()} for rule in self.rules]
+        scan = self.scan_latency.summary()
+        for rule in self.pattern_rules.values():
+            rows.append({"rule": rule.name, "hits": rule.hits, **scan})
+        return rows
+
+INVITE_PATTERN = r"discord\.(?:gg|me|io|com/invite)/[a-zA-Z0-9]+"
+
+def default_pipeline(spam_ring, log_action=None) -> AutoModPipeline:
+    return AutoModPipeline(
+        rules=[MentionFloodRule(), RepeatRule(spam_ring)],
+        pattern_rules=[
+            PatternRule("invites", "filter_invites_enabled", "linki zapraszające",
+                        lambda text: "Wykryto link zapraszający Discord.", INVITE_PATTERN),
+            PatternRule("profanity", "filter_profanity_enabled", "niedozwolone słownictwo",
+                        lambda text: f"Wykryto zakazane słowo: '{text.lower()}'"), # Wzorzec: czarna lista serwera
+        ],
+        log_action=log_action,
+    )
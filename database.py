@@ -1,13 +1,126 @@
 import sqlite3
 import time
 import json
+import queue
+import leveling
+from utils.lru_cache import LRUCache
+from utils.word_filter import BannedWordMatcher
 
 DB_NAME = 'bot_config.db'
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+# --- Pula Połączeń ---
+# Zamiast otwierać nowe połączenie (i płacić za open + odczyt schematu) w każdej funkcji,
+# trzymamy kilka otwartych połączeń w trybie WAL. Funkcje nadal wołają conn.close(),
+# ale dla połączenia z puli oznacza to tylko: cofnij niezatwierdzoną transakcję i oddaj do puli.
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",      # czytelnicy nie blokują pisarza i odwrotnie
+    "PRAGMA synchronous = NORMAL",    # w trybie WAL fsync tylko przy checkpointach
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",     # ~16 MB cache stron na połączenie
+    "PRAGMA mmap_size = 268435456",   # 256 MB
+)
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE) # LIFO - najczęściej używamy "ciepłych" połączeń
+
+class PooledConnection:
+    """Cienka nakładka na sqlite3.Connection; close() oddaje połączenie do puli zamiast je zamykać."""
+    __slots__ = ("_conn", "_db_name")
+
+    def __init__(self, conn: sqlite3.Connection, db_name: str):
+        self._conn = conn
+        self._db_name = db_name
+
+    def cursor(self) -> sqlite3.Cursor:
+        return self._conn.cursor()
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self._conn.execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params) -> sqlite3.Cursor:
+        return self._conn.executemany(sql, seq_of_params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            _release_connection(conn, self._db_name)
+
+def _open_connection() -> sqlite3.Connection:
+    # check_same_thread=False: połączenie może trafić do innego wątku (np. z puli wykonawców),
+    # ale w danym momencie używa go zawsze tylko jeden wątek.
+    conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    # Pozwala przeliczać poziom bezpośrednio w zapytaniu (grant_xp)
+    conn.create_function("level_for_xp", 1, leveling.get_level_from_xp, deterministic=True)
+    return conn
+
+def get_connection() -> PooledConnection:
+    """Pobiera połączenie z puli (lub otwiera nowe, jeśli pula jest pusta)."""
+    while True:
+        try:
+            conn, db_name = _pool.get_nowait()
+        except queue.Empty:
+            return PooledConnection(_open_connection(), DB_NAME)
+        if db_name == DB_NAME:
+            return PooledConnection(conn, db_name)
+        conn.close() # DB_NAME zmieniono w trakcie działania (np. testy) - stare połączenie do wyrzucenia
+
+def _release_connection(conn: sqlite3.Connection, db_name: str):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool.put_nowait((conn, db_name))
+    except (queue.Full, sqlite3.Error):
+        conn.close()
+
+def close_pool():
+    """Zamyka wszystkie bezczynne połączenia z puli (wywoływane przy zamykaniu bota)."""
+    while True:
+        try:
+            conn, _ = _pool.get_nowait()
+        except queue.Empty:
+            return
+        conn.close()
 
+def _shard_filter(shard: tuple[int, tuple[int, ...]] | None, column: str = "guild_id") -> tuple[str, tuple]:
+    """
+    Warunek SQL ograniczający wiersze do serwerów obsługiwanych przez dany proces (tryb wieloprocesowy, launcher.py).
+    `shard` = (liczba_shardów, identyfikatory_shardów_procesu); shard serwera to (guild_id >> 22) % liczba_shardów - wzór Discorda.
+    Dla None (jeden proces) warunek zawsze prawdziwy.
+    """
+    if shard is None:
+        return "1", ()
+    shard_count, shard_ids = shard
+    return f"(({column} >> 22) % ?) IN ({', '.join('?' * len(shard_ids))})", (shard_count, *shard_ids)
+
+def _ensure_columns(cursor, table: str, columns: dict[str, str]):
+    """Dodaje brakujące kolumny (ALTER TABLE) do istniejącej tabeli - dla baz utworzonych starszą wersją bota."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+# --- Schemat i migracje ---
+# Każda migracja to funkcja(cursor) wykonywana raz, w jednej transakcji razem z podbiciem PRAGMA user_version.
+# Zmiany schematu dopisujemy jako kolejną migrację na końcu MIGRATIONS - wydanych migracji nie zmieniamy.
+# Bazy sprzed wersjonowania (user_version = 0) mogą mieć schemat z dowolnej starszej wersji bota,
+# dlatego migracje 1-6 są idempotentne (IF NOT EXISTS, _ensure_columns, INSERT OR IGNORE).
+
+def _migration_base_tables(cursor):
     # server_configs
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS server_configs (
@@ -57,7 +170,10 @@ def init_db():
         PRIMARY KEY (guild_id, user_id)
     )
     """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_activity_xp_level ON user_activity (guild_id, xp DESC, level DESC)")
+    # Indeks rankingu pokrywa cały porządek (xp DESC, level DESC, user_id ASC), więc strona rankingu
+    # i liczenie pozycji (get_user_rank_in_server) czytają tylko indeks.
+    cursor.execute("DROP INDEX IF EXISTS idx_user_activity_xp_level")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_activity_leaderboard ON user_activity (guild_id, xp DESC, level DESC, user_id)")
 
     # activity_role_configs
     cursor.execute("""
@@ -242,27 +358,327 @@ def init_db():
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_watched_products_url ON watched_products (product_url)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_watched_products_active_shop ON watched_products (is_active, shop_name)")
 
-    # price_history
+def _migration_product_scan_columns(cursor):
+    # Walidatory HTTP (zapytania warunkowe) i skrót istotnego fragmentu strony z ostatniego udanego skanu
+    _ensure_columns(cursor, "watched_products", {"etag": "TEXT", "last_modified": "TEXT", "content_hash": "TEXT"})
+    # Harmonogram skanowania (product_scheduler.py): termin i interwał kolejnego skanu, seria błędów, ostatnia zmiana ceny/dostępności
+    _ensure_columns(cursor, "watched_products", {"next_scan_at": "INTEGER", "scan_interval_seconds": "INTEGER",
+                                                 "consecutive_failures": "INTEGER DEFAULT 0", "last_changed_at": "INTEGER"})
+
+def _migration_price_history_change_points(cursor) -> bool:
+    # availability_states - słownik tekstów dostępności ("Dostępny", "Na zamówienie"...), żeby historia trzymała tylko ID
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS availability_states (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        label TEXT NOT NULL UNIQUE
+    )
+    """)
+
+    # price_history - tylko punkty zmiany: wiersz to stan (cena, dostępność) obowiązujący od scan_date do last_seen_at.
+    # Skan bez zmian przesuwa last_seen_at ostatniego wiersza zamiast dopisywać nowy.
+    cursor.execute("PRAGMA table_info(price_history)")
+    legacy_price_history = "availability_str" in {row[1] for row in cursor.fetchall()}
+    if legacy_price_history:
+        cursor.execute("ALTER TABLE price_history RENAME TO price_history_legacy")
+        cursor.execute("DROP INDEX IF EXISTS idx_price_history_product_date")
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS price_history (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         watched_product_id INTEGER NOT NULL,
-        scan_date INTEGER NOT NULL,
+        scan_date INTEGER NOT NULL, -- Od kiedy obowiązuje ten stan (pierwszy skan z tą ceną/dostępnością)
+        last_seen_at INTEGER NOT NULL, -- Ostatni skan, który go potwierdził
         price_cents INTEGER,
-        availability_str TEXT,
-        FOREIGN KEY(watched_product_id) REFERENCES watched_products(id) ON DELETE CASCADE
+        availability_id INTEGER,
+        FOREIGN KEY(watched_product_id) REFERENCES watched_products(id) ON DELETE CASCADE,
+        FOREIGN KEY(availability_id) REFERENCES availability_states(id)
     )
     """)
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_price_history_product_date ON price_history (watched_product_id, scan_date DESC)")
+    if legacy_price_history:
+        _migrate_legacy_price_history(cursor)
+
+    # price_history_rollup - starsza historia zagregowana do godzin, a potem dni (downsample_price_history)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS price_history_rollup (
+        watched_product_id INTEGER NOT NULL,
+        bucket_seconds INTEGER NOT NULL, -- 3600 (godzina) lub 86400 (dzień)
+        bucket_start INTEGER NOT NULL,
+        min_price_cents INTEGER,
+        max_price_cents INTEGER,
+        last_price_cents INTEGER,
+        last_availability_id INTEGER,
+        last_seen_at INTEGER NOT NULL,
+        PRIMARY KEY (watched_product_id, bucket_seconds, bucket_start),
+        FOREIGN KEY(watched_product_id) REFERENCES watched_products(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    return legacy_price_history # Po przepisaniu starej historii warto zrobić VACUUM
+
+def _migration_product_subscriptions(cursor):
+    # product_subscriptions - kto (użytkownik na serwerze) śledzi produkt z watched_products.
+    # watched_products to jeden wiersz na (kanoniczny) URL, skanowany raz na cykl niezależnie od liczby subskrybentów.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS product_subscriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        watched_product_id INTEGER NOT NULL,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        target_price_cents INTEGER, -- Powiadom, gdy cena spadnie do tej wartości lub niżej (NULL = bez progu)
+        created_at INTEGER NOT NULL,
+        is_active BOOLEAN DEFAULT TRUE,
+        UNIQUE (watched_product_id, guild_id, user_id),
+        FOREIGN KEY(watched_product_id) REFERENCES watched_products(id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_subscriptions_guild_user ON product_subscriptions (guild_id, user_id, is_active)")
+    # Migracja: dotychczasowy "właściciel" produktu (guild_id, user_id_who_added) staje się jego pierwszym subskrybentem
+    cursor.execute("""
+    INSERT OR IGNORE INTO product_subscriptions (watched_product_id, guild_id, user_id, created_at, is_active)
+    SELECT id, guild_id, user_id_who_added, COALESCE(last_scanned_at, CAST(strftime('%s', 'now') AS INTEGER)), is_active
+    FROM watched_products WHERE guild_id IS NOT NULL
+    """)
+    _merge_duplicate_watched_products(cursor)
 
+def _migration_product_report_summary(cursor):
+    # product_report_summary - gotowe podsumowanie 24h dla raportów, jeden wiersz na produkt (wspólny dla wszystkich serwerów).
+    # Aktualizowane przy zapisie wyników skanu: stan sprzed ~24h (open_*) i bieżący (last_*).
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS product_report_summary (
+        watched_product_id INTEGER PRIMARY KEY,
+        open_at INTEGER NOT NULL, -- Początek okna (ok. 24h przed ostatnim skanem)
+        open_price_cents INTEGER,
+        open_availability_id INTEGER,
+        last_price_cents INTEGER,
+        last_availability_id INTEGER,
+        last_changed_at INTEGER, -- Ostatnia zmiana ceny lub dostępności
+        updated_at INTEGER NOT NULL,
+        FOREIGN KEY(watched_product_id) REFERENCES watched_products(id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_report_summary_changed ON product_report_summary (last_changed_at)")
+
+    # Podsumowania dla produktów, które mają historię, a nie mają jeszcze wiersza (pierwsze uruchomienie po aktualizacji)
+    cursor.execute("""
+    INSERT OR IGNORE INTO product_report_summary (watched_product_id, open_at, open_price_cents, open_availability_id,
+                                                  last_price_cents, last_availability_id, last_changed_at, updated_at)
+    SELECT latest.watched_product_id, latest.last_seen_at - ?, opening.price_cents, opening.availability_id,
+           latest.price_cents, latest.availability_id, latest.scan_date, latest.last_seen_at
+    FROM price_history latest
+    JOIN price_history opening ON opening.id = COALESCE(
+        (SELECT id FROM price_history p WHERE p.watched_product_id = latest.watched_product_id AND p.scan_date <= latest.last_seen_at - ?
+         ORDER BY p.scan_date DESC, p.id DESC LIMIT 1),
+        (SELECT id FROM price_history p WHERE p.watched_product_id = latest.watched_product_id ORDER BY p.scan_date, p.id LIMIT 1))
+    WHERE latest.id = (SELECT id FROM price_history p WHERE p.watched_product_id = latest.watched_product_id ORDER BY p.scan_date DESC, p.id DESC LIMIT 1)
+    """, (REPORT_WINDOW_SECONDS, REPORT_WINDOW_SECONDS))
+
+def _migration_product_report_schedule(cursor):
+    # product_report_schedule - termin kolejnego raportu produktowego serwera i stan jego wysyłki (report_scheduler.py).
+    # Termin liczymy raz (po zmianie ustawień i po wysłaniu), więc restart nie gubi ani nie dubluje raportu.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS product_report_schedule (
+        guild_id INTEGER PRIMARY KEY,
+        scheduled_for INTEGER NOT NULL, -- Planowana godzina raportu (timestamp UTC)
+        next_attempt_at INTEGER NOT NULL, -- Kiedy obudzić harmonogram (= scheduled_for albo później przy ponowieniu)
+        attempt_started_for INTEGER, -- scheduled_for, dla którego rozpoczęto wysyłkę (wykrywa przerwaną wysyłkę)
+        last_sent_for INTEGER,
+        last_sent_at INTEGER,
+        FOREIGN KEY(guild_id) REFERENCES server_configs(guild_id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_report_schedule_next ON product_report_schedule (next_attempt_at)")
+
+def _migration_bot_state(cursor):
+    # bot_state - drobny stan procesu bota, który ma przetrwać restart (np. skrót zsynchronizowanych komend)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at INTEGER NOT NULL
+    )
+    """)
+
+def _migration_watched_products_next_scan_index(cursor):
+    # Dociąganie nowych/przyspieszonych terminów skanu z bazy (get_watched_products_due_between)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_watched_products_active_next_scan ON watched_products (is_active, next_scan_at)")
+
+MIGRATIONS = (
+    _migration_base_tables,                  # 1
+    _migration_product_scan_columns,         # 2
+    _migration_price_history_change_points,  # 3
+    _migration_product_subscriptions,        # 4
+    _migration_product_report_summary,       # 5
+    _migration_product_report_schedule,      # 6
+    _migration_bot_state,                    # 7
+    _migration_watched_products_next_scan_index, # 8
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def init_db() -> tuple[int, int]:
+    """
+    Doprowadza schemat bazy do SCHEMA_VERSION, wykonując tylko brakujące migracje. Zwraca (wersja_przed, wersja_po).
+    Dla aktualnej bazy to jedno PRAGMA, więc wywołanie przy każdym starcie procesu nic nie kosztuje.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    start_version = version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        print(f"[DB] Schemat bazy jest w wersji {version}, nowszej niż obsługiwana ({SCHEMA_VERSION}) - pomijam migracje.")
+    needs_vacuum = False
+    try:
+        while version < SCHEMA_VERSION:
+            cursor.execute("BEGIN IMMEDIATE")
+            version = cursor.execute("PRAGMA user_version").fetchone()[0] # Inny proces mógł zdążyć przed nami
+            if version >= SCHEMA_VERSION:
+                conn.rollback()
+                break
+            started_at = time.perf_counter()
+            needs_vacuum |= bool(MIGRATIONS[version](cursor))
+            version += 1
+            cursor.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+            print(f"[DB] Schemat bazy: migracja {version}/{SCHEMA_VERSION} ({MIGRATIONS[version - 1].__name__}) w {(time.perf_counter() - started_at) * 1000:.0f} ms")
+        if needs_vacuum:
+            cursor.execute("VACUUM") # Jednorazowo oddajemy miejsce po starej historii
+    finally:
+        conn.close()
+    return start_version, version
+
+def get_bot_state(key: str) -> str | None:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM bot_state WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def set_bot_state(key: str, value: str):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+    INSERT INTO bot_state (key, value, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """, (key, value, int(time.time())))
     conn.commit()
     conn.close()
 
-if __name__ == '__main__':
-    init_db()
-    print(f"Baza danych '{DB_NAME}' zainicjalizowana ze wszystkimi tabelami i zaktualizowanymi indeksami.")
+def _migrate_legacy_price_history(cursor):
+    """
+    Przepisuje historię z wiersza-na-skan do punktów zmiany: kolejne skany z tą samą ceną
+    i dostępnością łączymy w jeden wiersz (scan_date = pierwszy, last_seen_at = ostatni).
+    Wpisy "Błąd skanowania" to stan skanera, a nie produktu - pomijamy je.
+    """
+    cursor.execute("""
+    INSERT OR IGNORE INTO availability_states (label)
+    SELECT DISTINCT availability_str FROM price_history_legacy
+    WHERE availability_str IS NOT NULL AND availability_str != 'Błąd skanowania'
+    """)
+    cursor.execute("""
+    WITH scans AS (
+        SELECT id, watched_product_id, scan_date, price_cents, availability_str,
+               CASE WHEN LAG(price_cents) OVER product_scans IS price_cents
+                     AND LAG(availability_str) OVER product_scans IS availability_str
+                     AND LAG(id) OVER product_scans IS NOT NULL THEN 0 ELSE 1 END AS is_change
+        FROM price_history_legacy
+        WHERE availability_str IS NOT 'Błąd skanowania'
+        WINDOW product_scans AS (PARTITION BY watched_product_id ORDER BY scan_date, id)
+    ), runs AS (
+        SELECT *, SUM(is_change) OVER (PARTITION BY watched_product_id ORDER BY scan_date, id ROWS UNBOUNDED PRECEDING) AS run
+        FROM scans
+    )
+    INSERT INTO price_history (watched_product_id, scan_date, last_seen_at, price_cents, availability_id)
+    SELECT runs.watched_product_id, MIN(runs.scan_date), MAX(runs.scan_date), runs.price_cents, availability_states.id
+    FROM runs LEFT JOIN availability_states ON availability_states.label = runs.availability_str
+    GROUP BY runs.watched_product_id, runs.run
+    ORDER BY MIN(runs.scan_date)
+    """)
+    cursor.execute("DROP TABLE price_history_legacy")
+
+def _merge_duplicate_watched_products(cursor):
+    """
+    Sprowadza product_url istniejących produktów do postaci kanonicznej (tej samej, której używa /watch_product).
+    Produkty, które po tym wskazują ten sam URL, łączymy w jeden (najstarszy): subskrypcje przenosimy,
+    a historię duplikatów usuwamy - to skany tej samej strony, zostaje historia produktu, który przetrwał.
+    """
+    # Import dopiero tutaj: rejestr sklepów ciągnie zależności scraperów, potrzebne tylko tej migracji
+    from scrapers import registry as shop_registry
+
+    groups = {}
+    for product_id, url in cursor.execute("SELECT id, product_url FROM watched_products ORDER BY id").fetchall():
+        shop = shop_registry.match_url(url)
+        if shop:
+            groups.setdefault(shop.canonical_url(url), []).append(product_id)
+    for canonical_url, product_ids in groups.items():
+        survivor_id, duplicate_ids = product_ids[0], product_ids[1:]
+        if duplicate_ids:
+            placeholders = ",".join("?" * len(duplicate_ids))
+            # Ta sama osoba mogła śledzić oba warianty linku - zostaje jedna subskrypcja, aktywna, jeśli któraś była
+            cursor.execute(f"""
+            UPDATE product_subscriptions SET is_active = TRUE
+            WHERE watched_product_id = ? AND (guild_id, user_id) IN (
+                SELECT guild_id, user_id FROM product_subscriptions WHERE watched_product_id IN ({placeholders}) AND is_active)
+            """, (survivor_id, *duplicate_ids))
+            cursor.execute(f"UPDATE OR IGNORE product_subscriptions SET watched_product_id = ? WHERE watched_product_id IN ({placeholders})",
+                           (survivor_id, *duplicate_ids))
+            cursor.execute(f"""
+            UPDATE watched_products SET is_active = (SELECT MAX(is_active) FROM watched_products WHERE id IN (?, {placeholders}))
+            WHERE id = ?
+            """, (survivor_id, *duplicate_ids, survivor_id))
+            for table in ("product_subscriptions", "price_history", "price_history_rollup", "watched_products"):
+                column = "id" if table == "watched_products" else "watched_product_id"
+                cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", duplicate_ids)
+        cursor.execute("UPDATE watched_products SET product_url = ? WHERE id = ?", (canonical_url, survivor_id))
 
 # --- Funkcje Konfiguracji Serwera ---
+SERVER_CONFIG_CACHE_SIZE = 5000 # Ile serwerów trzymamy w pamięci (LRU)
+
+class ServerConfig:
+    """
+    Konfiguracja serwera z tabeli server_configs, z uzupełnionymi wartościami domyślnymi.
+    Obiekty są współdzielone przez cache - traktuj je jako tylko do odczytu.
+    """
+    DEFAULTS = {
+        "welcome_message_content": None, "reaction_role_id": None, "reaction_message_id": None,
+        "unverified_role_id": None, "verified_role_id": None,
+        "moderation_log_channel_id": None,
+        "filter_profanity_enabled": True, "filter_spam_enabled": True, "filter_invites_enabled": True,
+        "muted_role_id": None, "moderator_actions_log_channel_id": None,
+        "custom_command_prefix": "!",
+        "ticket_category_id": None, "ticket_log_channel_id": None, "ticket_support_role_ids_json": "[]",
+        "feedback_channel_id": None,
+        "product_report_channel_id": None, "product_report_time_utc": None
+    }
+    BOOLEAN_FIELDS = ("filter_profanity_enabled", "filter_spam_enabled", "filter_invites_enabled")
+    __slots__ = ("guild_id",) + tuple(DEFAULTS)
+
+    def __init__(self, guild_id: int, **values):
+        self.guild_id = guild_id
+        for key, default in self.DEFAULTS.items():
+            setattr(self, key, values.get(key, default))
+
+    @classmethod
+    def from_row(cls, row: dict) -> "ServerConfig":
+        values = {}
+        for key in cls.DEFAULTS:
+            value = row.get(key)
+            if value is None:
+                continue # Zostaje wartość domyślna
+            if key in cls.BOOLEAN_FIELDS:
+                value = bool(value)
+            elif key == "ticket_support_role_ids_json" and not value: # Pusty string zamiast NULL
+                value = "[]"
+            values[key] = value
+        return cls(row["guild_id"], **values)
+
+    def get(self, key: str, default=None):
+        """Zgodność ze starszym kodem, który traktował konfigurację jak słownik."""
+        return getattr(self, key, default)
+
+    def __repr__(self) -> str:
+        return f"ServerConfig(guild_id={self.guild_id})"
+
+NOT_CACHED = object()
+server_config_cache = LRUCache(SERVER_CONFIG_CACHE_SIZE)
+
 def update_server_config(guild_id: int, welcome_message_content: str = None,
                          reaction_role_id: int = None, reaction_message_id: int = None,
                          unverified_role_id: int = None, verified_role_id: int = None,
@@ -280,7 +696,7 @@ def update_server_config(guild_id: int, welcome_message_content: str = None,
                          product_report_channel_id: int = None,
                          product_report_time_utc: str = None
                          ):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("INSERT OR IGNORE INTO server_configs (guild_id) VALUES (?)", (guild_id,))
 
@@ -319,56 +735,41 @@ def update_server_config(guild_id: int, welcome_message_content: str = None,
         cursor.execute(sql, tuple(params))
 
     conn.commit()
+    server_config_cache.put(guild_id, _load_server_config(cursor, guild_id)) # write-through
     conn.close()
 
-def get_server_config(guild_id: int) -> dict | None:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+def _load_server_config(cursor: sqlite3.Cursor, guild_id: int) -> "ServerConfig | None":
     cursor.execute("SELECT * FROM server_configs WHERE guild_id = ?", (guild_id,))
     row = cursor.fetchone()
-
     if not row:
-        conn.close()
-        # Jeśli nie ma konfiguracji, stwórz domyślną i ją zwróć
-        # update_server_config(guild_id) # To stworzy wiersz z samymi NULLami, które all_config_keys obsłuży
-        # Lepiej zwrócić None, a komendy same zdecydują co robić (np. prosić o konfigurację)
+        # Brak konfiguracji - zwracamy None, a komendy same zdecydują co robić (np. prosić o konfigurację)
         return None
-
-    # Pobierz nazwy kolumn z opisu kursora po wykonaniu zapytania
     column_names = [description[0] for description in cursor.description]
-    fetched_data = dict(zip(column_names, row))
+    return ServerConfig.from_row(dict(zip(column_names, row)))
+
+def get_server_config(guild_id: int) -> "ServerConfig | None":
+    """
+    Zwraca konfigurację serwera. Wywoływane przy każdej wiadomości, więc wynik
+    (także brak konfiguracji) trzymamy w cache; update_server_config aktualizuje go przy zapisie.
+    """
+    config = server_config_cache.get(guild_id, NOT_CACHED)
+    if config is not NOT_CACHED:
+        return config
+
+    # Wersja sprzed zapytania: zdalny zapis (tryb wieloprocesowy) tylko unieważnia cache, więc bez niej
+    # odczyt sprzed zapisu mógłby wstawić do cache starą konfigurację
+    version = server_config_cache.version
+    conn = get_connection()
+    cursor = conn.cursor()
+    config = _load_server_config(cursor, guild_id)
     conn.close()
-
-    all_config_keys = {
-        "guild_id": guild_id,
-        "welcome_message_content": None, "reaction_role_id": None, "reaction_message_id": None,
-        "unverified_role_id": None, "verified_role_id": None,
-        "moderation_log_channel_id": None,
-        "filter_profanity_enabled": True, "filter_spam_enabled": True, "filter_invites_enabled": True,
-        "muted_role_id": None, "moderator_actions_log_channel_id": None,
-        "custom_command_prefix": "!",
-        "ticket_category_id": None, "ticket_log_channel_id": None, "ticket_support_role_ids_json": "[]",
-        "feedback_channel_id": None,
-        "product_report_channel_id": None, "product_report_time_utc": None
-    }
-
-    # Uzupełnij wynik wartościami z bazy, zachowując domyślne jeśli czegoś brakuje
-    config_result = all_config_keys.copy()
-    for key in all_config_keys:
-        if key in fetched_data and fetched_data[key] is not None:
-            if key in ["filter_profanity_enabled", "filter_spam_enabled", "filter_invites_enabled"]:
-                config_result[key] = bool(fetched_data[key])
-            elif key == "ticket_support_role_ids_json" and not fetched_data[key]: # Jeśli jest pusty string zamiast NULL
-                 config_result[key] = "[]"
-            else:
-                config_result[key] = fetched_data[key]
-    return config_result
+    return server_config_cache.setdefault(guild_id, config, version)
 
 # --- Funkcje dla Systemu Kar (Punishments) ---
 # ... (reszta funkcji bez zmian, zakładając, że są poprawne) ...
 def add_punishment(guild_id: int, user_id: int, moderator_id: int,
                    punishment_type: str, reason: str | None, expires_at: int | None = None) -> int:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     created_at = int(time.time())
     cursor.execute("""
@@ -381,14 +782,21 @@ def add_punishment(guild_id: int, user_id: int, moderator_id: int,
     return punishment_id
 
 def deactivate_punishment(punishment_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE punishments SET active = FALSE WHERE id = ?", (punishment_id,))
     conn.commit()
     conn.close()
 
+def deactivate_punishments(punishment_ids: list[int]):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.executemany("UPDATE punishments SET active = FALSE WHERE id = ?", [(punishment_id,) for punishment_id in punishment_ids])
+    conn.commit()
+    conn.close()
+
 def get_active_user_punishment(guild_id: int, user_id: int, punishment_type: str) -> dict | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
     SELECT id, moderator_id, reason, expires_at, created_at
@@ -402,20 +810,21 @@ def get_active_user_punishment(guild_id: int, user_id: int, punishment_type: str
         return {"id": row[0], "moderator_id": row[1], "reason": row[2], "expires_at": row[3], "created_at": row[4]}
     return None
 
-def get_expired_active_punishments(current_timestamp: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+def get_expired_active_punishments(current_timestamp: int, shard: tuple[int, tuple[int, ...]] | None = None) -> list[dict]:
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("""
+    shard_sql, shard_params = _shard_filter(shard)
+    cursor.execute(f"""
     SELECT id, guild_id, user_id, type, expires_at
     FROM punishments
-    WHERE active = TRUE AND expires_at IS NOT NULL AND expires_at <= ? AND type IN ('mute', 'ban')
-    """, (current_timestamp,))
+    WHERE active = TRUE AND expires_at IS NOT NULL AND expires_at <= ? AND type IN ('mute', 'ban') AND {shard_sql}
+    """, (current_timestamp, *shard_params))
     expired = [{"id": row[0], "guild_id": row[1], "user_id": row[2], "type": row[3], "expires_at": row[4]} for row in cursor.fetchall()]
     conn.close()
     return expired
 
 def get_user_punishments(guild_id: int, user_id: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
     SELECT id, moderator_id, type, reason, expires_at, active, created_at
@@ -434,36 +843,54 @@ def get_user_punishments(guild_id: int, user_id: int) -> list[dict]:
     return cases
 
 # --- Funkcje dla Czarnej Listy Słów (Moderacja) ---
+BANNED_WORDS_CACHE_SIZE = 5000
+banned_word_matcher_cache = LRUCache(BANNED_WORDS_CACHE_SIZE)
+
 def add_banned_word(guild_id: int, word: str) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT INTO banned_words (guild_id, word) VALUES (?, ?)", (guild_id, word.lower()))
         conn.commit()
+        banned_word_matcher_cache.invalidate(guild_id)
         return True
     except sqlite3.IntegrityError: return False
     finally: conn.close()
 
 def remove_banned_word(guild_id: int, word: str) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM banned_words WHERE guild_id = ? AND word = ?", (guild_id, word.lower()))
     deleted_rows = cursor.rowcount
     conn.commit()
     conn.close()
+    if deleted_rows > 0:
+        banned_word_matcher_cache.invalidate(guild_id)
     return deleted_rows > 0
 
 def get_banned_words(guild_id: int) -> list[str]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT word FROM banned_words WHERE guild_id = ?", (guild_id,))
     words = [row[0] for row in cursor.fetchall()]
     conn.close()
     return words
 
+def get_banned_word_matcher(guild_id: int) -> BannedWordMatcher:
+    """
+    Zwraca skompilowany matcher czarnej listy serwera. Budowany raz i trzymany w cache,
+    przebudowywany dopiero po zmianie listy przez add_banned_word/remove_banned_word.
+    """
+    matcher = banned_word_matcher_cache.get(guild_id)
+    if matcher is not None:
+        return matcher
+    version = banned_word_matcher_cache.version
+    matcher = BannedWordMatcher(get_banned_words(guild_id))
+    return banned_word_matcher_cache.setdefault(guild_id, matcher, version)
+
 # --- Funkcje dla Quizu Weryfikacyjnego ---
 def add_quiz_question(guild_id: int, question: str, answer: str) -> int:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("INSERT INTO quiz_questions (guild_id, question, answer) VALUES (?, ?, ?)", (guild_id, question, answer))
     question_id = cursor.lastrowid
@@ -472,7 +899,7 @@ def add_quiz_question(guild_id: int, question: str, answer: str) -> int:
     return question_id
 
 def remove_quiz_question(question_id: int) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM quiz_questions WHERE id = ?", (question_id,))
     deleted_rows = cursor.rowcount
@@ -481,7 +908,7 @@ def remove_quiz_question(question_id: int) -> bool:
     return deleted_rows > 0
 
 def get_quiz_questions(guild_id: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, question, answer FROM quiz_questions WHERE guild_id = ?", (guild_id,))
     questions = [{"id": row[0], "question": row[1], "answer": row[2]} for row in cursor.fetchall()]
@@ -489,30 +916,40 @@ def get_quiz_questions(guild_id: int) -> list[dict]:
     return questions
 
 # --- Funkcje dla Ról Czasowych (Timed Roles) ---
-def add_timed_role(guild_id: int, user_id: int, role_id: int, expiration_timestamp: int):
-    conn = sqlite3.connect(DB_NAME)
+def add_timed_role(guild_id: int, user_id: int, role_id: int, expiration_timestamp: int) -> int:
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("INSERT INTO timed_roles (guild_id, user_id, role_id, expiration_timestamp) VALUES (?, ?, ?, ?)", (guild_id, user_id, role_id, expiration_timestamp))
+    timed_role_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    return timed_role_id
 
-def get_expired_roles(current_timestamp: int) -> list[tuple[int, int, int, int, int]]:
-    conn = sqlite3.connect(DB_NAME)
+def get_expired_roles(current_timestamp: int, shard: tuple[int, tuple[int, ...]] | None = None) -> list[tuple[int, int, int, int, int]]:
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, guild_id, user_id, role_id, expiration_timestamp FROM timed_roles WHERE expiration_timestamp <= ?", (current_timestamp,))
+    shard_sql, shard_params = _shard_filter(shard)
+    cursor.execute(f"SELECT id, guild_id, user_id, role_id, expiration_timestamp FROM timed_roles WHERE expiration_timestamp <= ? AND {shard_sql}", (current_timestamp, *shard_params))
     expired_roles = cursor.fetchall()
     conn.close()
     return expired_roles
 
 def remove_timed_role(timed_role_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM timed_roles WHERE id = ?", (timed_role_id,))
     conn.commit()
     conn.close()
 
+def remove_timed_roles(timed_role_ids: list[int]):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.executemany("DELETE FROM timed_roles WHERE id = ?", [(timed_role_id,) for timed_role_id in timed_role_ids])
+    conn.commit()
+    conn.close()
+
 def get_active_timed_role(guild_id: int, user_id: int, role_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, expiration_timestamp FROM timed_roles WHERE guild_id = ? AND user_id = ? AND role_id = ? AND expiration_timestamp > strftime('%s', 'now')", (guild_id, user_id, role_id))
     row = cursor.fetchone()
@@ -520,9 +957,30 @@ def get_active_timed_role(guild_id: int, user_id: int, role_id: int):
     if row: return {"id": row[0], "expiration_timestamp": row[1]}
     return None
 
+# --- Terminy wygasania (expiry_engine.py) ---
+def get_pending_expiry_deadlines(shard: tuple[int, tuple[int, ...]] | None = None) -> dict[str, list[int]]:
+    """
+    Wszystkie terminy (także zaległe) wpisów, które jeszcze nie wygasły: role czasowe, aktywne wyciszenia/bany
+    z czasem trwania, aktywne ankiety z terminem i aktywne losowania. Wczytywane raz przy starcie silnika wygasania.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    shard_sql, shard_params = _shard_filter(shard)
+    deadlines = {}
+    cursor.execute(f"SELECT DISTINCT expiration_timestamp FROM timed_roles WHERE {shard_sql}", shard_params)
+    deadlines["timed_roles"] = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT DISTINCT expires_at FROM punishments WHERE active = TRUE AND expires_at IS NOT NULL AND type IN ('mute', 'ban') AND {shard_sql}", shard_params)
+    deadlines["punishments"] = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT DISTINCT ends_at FROM polls WHERE is_active = TRUE AND ends_at IS NOT NULL AND {shard_sql}", shard_params)
+    deadlines["polls"] = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT DISTINCT ends_at FROM giveaways WHERE is_active = TRUE AND {shard_sql}", shard_params)
+    deadlines["giveaways"] = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return deadlines
+
 # --- Funkcje dla Aktywności Użytkownika (Wiadomości, XP, Poziomy) ---
 def ensure_user_activity_entry(guild_id: int, user_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("INSERT OR IGNORE INTO user_activity (guild_id, user_id, message_count, xp, level) VALUES (?, ?, 0, 0, 0)", (guild_id, user_id))
     conn.commit()
@@ -530,7 +988,7 @@ def ensure_user_activity_entry(guild_id: int, user_id: int):
 
 def increment_message_count(guild_id: int, user_id: int):
     ensure_user_activity_entry(guild_id, user_id)
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE user_activity SET message_count = message_count + 1 WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
     conn.commit()
@@ -538,7 +996,7 @@ def increment_message_count(guild_id: int, user_id: int):
 
 def add_xp(guild_id: int, user_id: int, xp_amount: int) -> int:
     ensure_user_activity_entry(guild_id, user_id)
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE user_activity SET xp = xp + ? WHERE guild_id = ? AND user_id = ?", (xp_amount, guild_id, user_id))
     conn.commit()
@@ -547,9 +1005,43 @@ def add_xp(guild_id: int, user_id: int, xp_amount: int) -> int:
     conn.close()
     return new_total_xp
 
+def grant_xp(guild_id: int, user_id: int, xp_amount: int) -> tuple[int, int, int, int]:
+    """
+    Przyznaje XP i przelicza poziom w jednej transakcji (jedno wywołanie i połączenie zamiast
+    add_xp + get_user_stats + set_user_level). Tworzy wiersz użytkownika, jeśli go nie ma.
+    Poziom nigdy nie spada (mógł zostać ustawiony ręcznie).
+    Zwraca krotkę: (old_xp, new_xp, old_level, new_level).
+
+    XP za wiadomości idzie przez bufor (xp_buffer.XpWriteBuffer); grant_xp to ścieżka dla pojedynczego
+    przyznania, które ma trafić do bazy od razu - potem wywołaj XpWriteBuffer.invalidate dla tego użytkownika.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        # IMMEDIATE bierze blokadę zapisu od razu, więc dwa równoległe przyznania dla tego samego
+        # użytkownika nie zobaczą tego samego "starego" stanu. RETURNING zwraca stan już po zmianie,
+        # więc stary stan (potrzebny do wykrycia awansu) czytamy w tej samej transakcji tuż przed nią.
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT xp, level FROM user_activity WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        row = cursor.fetchone()
+        old_xp, old_level = row if row else (0, 0)
+        cursor.execute("""
+        INSERT INTO user_activity (guild_id, user_id, message_count, xp, level)
+        VALUES (?, ?, 0, ?, level_for_xp(?))
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET
+            xp = xp + excluded.xp,
+            level = MAX(level, level_for_xp(xp + excluded.xp))
+        RETURNING xp, level
+        """, (guild_id, user_id, xp_amount, xp_amount))
+        new_xp, new_level = cursor.fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    return old_xp, new_xp, old_level, new_level
+
 def get_user_stats(guild_id: int, user_id: int) -> dict:
     ensure_user_activity_entry(guild_id, user_id)
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT message_count, xp, level FROM user_activity WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
     row = cursor.fetchone()
@@ -557,9 +1049,40 @@ def get_user_stats(guild_id: int, user_id: int) -> dict:
     if row: return {"message_count": row[0], "xp": row[1], "level": row[2]}
     return {"message_count": 0, "xp": 0, "level": 0}
 
+def get_user_activity(guild_id: int, user_id: int) -> dict | None:
+    """Jak get_user_stats, ale tylko odczyt - nie tworzy wiersza, zwraca None, jeśli go nie ma."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT message_count, xp, level FROM user_activity WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+    row = cursor.fetchone()
+    conn.close()
+    if row: return {"message_count": row[0], "xp": row[1], "level": row[2]}
+    return None
+
+def apply_user_activity_deltas(rows: list[tuple[int, int, int, int, int]]):
+    """
+    Zapisuje zbiorczo przyrosty aktywności w jednej transakcji.
+    rows: krotki (guild_id, user_id, message_count_delta, xp_delta, level). Poziom nigdy nie spada.
+    """
+    if not rows:
+        return
+    conn = get_connection()
+    try:
+        conn.executemany("""
+        INSERT INTO user_activity (guild_id, user_id, message_count, xp, level)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (guild_id, user_id) DO UPDATE SET
+            message_count = message_count + excluded.message_count,
+            xp = xp + excluded.xp,
+            level = MAX(level, excluded.level)
+        """, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
 def set_user_level(guild_id: int, user_id: int, new_level: int):
     ensure_user_activity_entry(guild_id, user_id)
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE user_activity SET level = ? WHERE guild_id = ? AND user_id = ?", (new_level, guild_id, user_id))
     conn.commit()
@@ -567,7 +1090,7 @@ def set_user_level(guild_id: int, user_id: int, new_level: int):
 
 # --- Funkcje dla Konfiguracji Ról za Aktywność ---
 def add_activity_role_config(guild_id: int, role_id: int, required_message_count: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT INTO activity_role_configs (guild_id, role_id, required_message_count) VALUES (?, ?, ?)", (guild_id, role_id, required_message_count))
@@ -576,7 +1099,7 @@ def add_activity_role_config(guild_id: int, role_id: int, required_message_count
     finally: conn.close()
 
 def remove_activity_role_config(guild_id: int, role_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM activity_role_configs WHERE guild_id = ? AND role_id = ?", (guild_id, role_id))
     conn.commit()
@@ -585,7 +1108,7 @@ def remove_activity_role_config(guild_id: int, role_id: int):
     return deleted_rows > 0
 
 def get_activity_role_configs(guild_id: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT role_id, required_message_count FROM activity_role_configs WHERE guild_id = ? ORDER BY required_message_count ASC", (guild_id,))
     configs = [{"role_id": row[0], "required_message_count": row[1]} for row in cursor.fetchall()]
@@ -603,7 +1126,7 @@ def get_highest_eligible_role(guild_id: int, current_message_count: int) -> dict
 # --- Funkcje dla Nagród za Poziomy (Level Rewards) ---
 def add_level_reward(guild_id: int, level: int, role_id: int = None, message: str = None) -> int | None:
     if role_id is None and message is None: return None
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT INTO level_rewards (guild_id, level, role_id_to_grant, custom_message_on_level_up) VALUES (?, ?, ?, ?)", (guild_id, level, role_id, message))
@@ -614,7 +1137,7 @@ def add_level_reward(guild_id: int, level: int, role_id: int = None, message: st
     finally: conn.close()
 
 def remove_level_reward(reward_id: int) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM level_rewards WHERE id = ?", (reward_id,))
     deleted_rows = cursor.rowcount
@@ -623,7 +1146,7 @@ def remove_level_reward(reward_id: int) -> bool:
     return deleted_rows > 0
 
 def get_rewards_for_level(guild_id: int, level: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, role_id_to_grant, custom_message_on_level_up FROM level_rewards WHERE guild_id = ? AND level = ?", (guild_id, level))
     rewards = [{"id": row[0], "role_id_to_grant": row[1], "custom_message_on_level_up": row[2]} for row in cursor.fetchall()]
@@ -631,7 +1154,7 @@ def get_rewards_for_level(guild_id: int, level: int) -> list[dict]:
     return rewards
 
 def get_all_level_rewards_config(guild_id: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, level, role_id_to_grant, custom_message_on_level_up FROM level_rewards WHERE guild_id = ? ORDER BY level ASC", (guild_id,))
     configs = [{"id": row[0], "level": row[1], "role_id_to_grant": row[2], "custom_message_on_level_up": row[3]} for row in cursor.fetchall()]
@@ -640,28 +1163,46 @@ def get_all_level_rewards_config(guild_id: int) -> list[dict]:
 
 # --- Funkcje dla Rankingu ---
 def get_server_leaderboard(guild_id: int, limit: int = 10, offset: int = 0) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    # /leaderboard korzysta z rankingu w pamięci (ranking.GuildRanking.page); to zapytanie zostaje dla skryptów i diagnostyki
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT user_id, xp, level FROM user_activity WHERE guild_id = ? AND xp > 0 ORDER BY xp DESC, level DESC LIMIT ? OFFSET ?", (guild_id, limit, offset))
+    cursor.execute("SELECT user_id, xp, level FROM user_activity WHERE guild_id = ? AND xp > 0 ORDER BY xp DESC, level DESC, user_id ASC LIMIT ? OFFSET ?", (guild_id, limit, offset))
     leaderboard = [{"user_id": row[0], "xp": row[1], "level": row[2]} for row in cursor.fetchall()]
     conn.close()
     return leaderboard
 
 def get_user_rank_in_server(guild_id: int, user_id: int) -> tuple[int, int] | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT xp FROM user_activity WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-    user_xp_row = cursor.fetchone()
-    if not user_xp_row or user_xp_row[0] == 0: conn.close(); return None
-    cursor.execute("SELECT user_id FROM user_activity WHERE guild_id = ? AND xp > 0 ORDER BY xp DESC, level DESC, user_id ASC ", (guild_id,))
-    ranked_users = [row[0] for row in cursor.fetchall()]
-    total_ranked_players = len(ranked_users)
-    try: rank = ranked_users.index(user_id) + 1; conn.close(); return rank, total_ranked_players
-    except ValueError: conn.close(); return None
+    cursor.execute("SELECT xp, level FROM user_activity WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+    user_row = cursor.fetchone()
+    if not user_row or user_row[0] == 0: conn.close(); return None
+    xp, level = user_row
+    # Zamiast wczytywać cały ranking do listy, liczymy osoby przed użytkownikiem
+    # (porządek: xp DESC, level DESC, user_id ASC) - zakres na indeksie idx_user_activity_leaderboard.
+    cursor.execute("""
+    SELECT COUNT(*) FROM user_activity
+    WHERE guild_id = ? AND xp >= ?
+      AND (xp > ? OR level > ? OR (level = ? AND user_id < ?))
+    """, (guild_id, xp, xp, level, level, user_id))
+    rank = cursor.fetchone()[0] + 1
+    cursor.execute("SELECT COUNT(*) FROM user_activity WHERE guild_id = ? AND xp > 0", (guild_id,))
+    total_ranked_players = cursor.fetchone()[0]
+    conn.close()
+    return rank, total_ranked_players
+
+def get_guild_xp_rows(guild_id: int) -> list[tuple[int, int, int]]:
+    """Zwraca (user_id, xp, level) wszystkich użytkowników serwera z XP > 0 - do zbudowania rankingu w pamięci."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, xp, level FROM user_activity WHERE guild_id = ? AND xp > 0", (guild_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
 
 # --- Funkcje dla Ankiet (Polls) ---
 def create_poll(guild_id: int, channel_id: int, question: str, created_by_id: int, ends_at: int | None = None) -> int:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     created_at_ts = int(time.time())
     cursor.execute("INSERT INTO polls (guild_id, channel_id, question, created_by_id, created_at, ends_at, is_active) VALUES (?, ?, ?, ?, ?, ?, TRUE)", (guild_id, channel_id, question, created_by_id, created_at_ts, ends_at))
@@ -671,21 +1212,21 @@ def create_poll(guild_id: int, channel_id: int, question: str, created_by_id: in
     return poll_id
 
 def add_poll_option(poll_id: int, option_text: str, reaction_emoji: str):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("INSERT INTO poll_options (poll_id, option_text, reaction_emoji) VALUES (?, ?, ?)", (poll_id, option_text, reaction_emoji))
     conn.commit()
     conn.close()
 
 def set_poll_message_id(poll_id: int, message_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE polls SET message_id = ? WHERE id = ?", (message_id, poll_id))
     conn.commit()
     conn.close()
 
 def get_poll_by_message_id(message_id: int) -> dict | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, guild_id, channel_id, question, created_by_id, created_at, ends_at, is_active, results_message_id FROM polls WHERE message_id = ?", (message_id,))
     row = cursor.fetchone()
@@ -693,16 +1234,17 @@ def get_poll_by_message_id(message_id: int) -> dict | None:
     if row: return {"id": row[0], "guild_id": row[1], "channel_id": row[2], "question": row[3], "created_by_id": row[4], "created_at": row[5], "ends_at": row[6], "is_active": bool(row[7]), "results_message_id": row[8]}
     return None
 
-def get_active_polls_to_close(current_timestamp: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+def get_active_polls_to_close(current_timestamp: int, shard: tuple[int, tuple[int, ...]] | None = None) -> list[dict]:
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, guild_id, channel_id, message_id, question, created_by_id FROM polls WHERE is_active = TRUE AND ends_at IS NOT NULL AND ends_at <= ?", (current_timestamp,))
+    shard_sql, shard_params = _shard_filter(shard)
+    cursor.execute(f"SELECT id, guild_id, channel_id, message_id, question, created_by_id FROM polls WHERE is_active = TRUE AND ends_at IS NOT NULL AND ends_at <= ? AND {shard_sql}", (current_timestamp, *shard_params))
     polls_to_close = [{"id": row[0], "guild_id": row[1], "channel_id": row[2], "message_id": row[3], "question": row[4], "created_by_id": row[5]} for row in cursor.fetchall()]
     conn.close()
     return polls_to_close
 
 def close_poll(poll_id: int, results_message_id: int | None = None):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     if results_message_id: cursor.execute("UPDATE polls SET is_active = FALSE, results_message_id = ? WHERE id = ?", (results_message_id, poll_id))
     else: cursor.execute("UPDATE polls SET is_active = FALSE WHERE id = ?", (poll_id,))
@@ -710,7 +1252,7 @@ def close_poll(poll_id: int, results_message_id: int | None = None):
     conn.close()
 
 def get_poll_options(poll_id: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, option_text, reaction_emoji FROM poll_options WHERE poll_id = ?", (poll_id,))
     options = [{"id": row[0], "option_text": row[1], "reaction_emoji": row[2]} for row in cursor.fetchall()]
@@ -719,7 +1261,7 @@ def get_poll_options(poll_id: int) -> list[dict]:
 
 def get_poll_details(poll_id: int) -> dict | None:
     poll_data = {}
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, guild_id, channel_id, message_id, question, created_by_id, created_at, ends_at, is_active, results_message_id FROM polls WHERE id = ?", (poll_id,))
     row = cursor.fetchone()
@@ -730,39 +1272,70 @@ def get_poll_details(poll_id: int) -> dict | None:
     return poll_data
 
 # --- Funkcje dla Niestandardowych Komend (Custom Commands) ---
+CUSTOM_COMMANDS_CACHE_SIZE = 5000
+custom_command_index_cache = LRUCache(CUSTOM_COMMANDS_CACHE_SIZE)
+
+class CustomCommand:
+    """
+    Komenda z indeksu serwera (get_custom_command_index). Treść embeda jest sparsowana z JSON raz, przy budowie indeksu;
+    `embed` (discord.Embed) uzupełnia przy pierwszym użyciu warstwa bota. Obiekty współdzielone przez cache - tylko do odczytu.
+    """
+    __slots__ = ("id", "name", "response_type", "response_content", "embed_data", "embed")
+
+    def __init__(self, command_id: int, name: str, response_type: str, response_content: str):
+        self.id = command_id
+        self.name = name
+        self.response_type = response_type
+        self.response_content = response_content
+        self.embed_data = None # None dla typu "text" i dla niepoprawnego JSON
+        self.embed = None
+        if response_type == "embed":
+            try:
+                embed_data = json.loads(response_content)
+            except ValueError:
+                embed_data = None
+            if isinstance(embed_data, dict):
+                embed_data.pop('timestamp', None)
+                self.embed_data = embed_data
+
 def add_custom_command(guild_id: int, name: str, response_type: str, content: str, creator_id: int) -> int | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     created_at_ts = int(time.time())
     try:
         cursor.execute("INSERT INTO custom_commands (guild_id, command_name, response_type, response_content, created_by_id, created_at) VALUES (?, ?, ?, ?, ?, ?)", (guild_id, name.lower(), response_type, content, creator_id, created_at_ts))
         command_id = cursor.lastrowid
         conn.commit()
+        custom_command_index_cache.invalidate(guild_id)
         return command_id
     except sqlite3.IntegrityError: conn.rollback(); return None
     finally: conn.close()
 
 def edit_custom_command(guild_id: int, name: str, new_response_type: str, new_content: str, editor_id: int) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     last_edited_at_ts = int(time.time())
     cursor.execute("UPDATE custom_commands SET response_type = ?, response_content = ?, last_edited_by_id = ?, last_edited_at = ? WHERE guild_id = ? AND command_name = ?", (new_response_type, new_content, editor_id, last_edited_at_ts, guild_id, name.lower()))
     updated_rows = cursor.rowcount
     conn.commit()
     conn.close()
+    if updated_rows > 0:
+        custom_command_index_cache.invalidate(guild_id)
     return updated_rows > 0
 
 def remove_custom_command(guild_id: int, name: str) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM custom_commands WHERE guild_id = ? AND command_name = ?", (guild_id, name.lower()))
     deleted_rows = cursor.rowcount
     conn.commit()
     conn.close()
+    if deleted_rows > 0:
+        custom_command_index_cache.invalidate(guild_id)
     return deleted_rows > 0
 
 def get_custom_command(guild_id: int, name: str) -> dict | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, response_type, response_content, created_by_id, created_at, last_edited_by_id, last_edited_at FROM custom_commands WHERE guild_id = ? AND command_name = ?", (guild_id, name.lower()))
     row = cursor.fetchone()
@@ -770,8 +1343,25 @@ def get_custom_command(guild_id: int, name: str) -> dict | None:
     if row: return {"id": row[0], "response_type": row[1], "response_content": row[2], "created_by_id": row[3], "created_at": row[4], "last_edited_by_id": row[5], "last_edited_at": row[6]}
     return None
 
+def get_custom_command_index(guild_id: int) -> dict[str, CustomCommand]:
+    """
+    Wszystkie komendy serwera (nazwa -> CustomCommand), wczytane jednym zapytaniem i trzymane w cache do zmiany
+    przez add/edit/remove_custom_command. Indeks jest kompletny, więc brak nazwy to od razu odpowiedź negatywna -
+    wiadomości z prefiksem i nieznaną komendą (także na serwerach bez komend) nie dotykają bazy.
+    """
+    index = custom_command_index_cache.get(guild_id)
+    if index is not None:
+        return index
+    version = custom_command_index_cache.version
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, command_name, response_type, response_content FROM custom_commands WHERE guild_id = ?", (guild_id,))
+    index = {row[1]: CustomCommand(row[0], row[1], row[2], row[3]) for row in cursor.fetchall()}
+    conn.close()
+    return custom_command_index_cache.setdefault(guild_id, index, version)
+
 def get_all_custom_commands(guild_id: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, command_name, response_type FROM custom_commands WHERE guild_id = ? ORDER BY command_name ASC", (guild_id,))
     commands_list = [{"id": row[0], "command_name": row[1], "response_type": row[2]} for row in cursor.fetchall()]
@@ -780,7 +1370,7 @@ def get_all_custom_commands(guild_id: int) -> list[dict]:
 
 # --- Funkcje dla Konkursów (Giveaways) ---
 def create_giveaway(guild_id: int, channel_id: int, prize: str, winner_count: int, created_by_id: int, ends_at: int, required_role_id: int | None = None, min_level: int | None = None) -> int:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     created_at_ts = int(time.time())
     cursor.execute("INSERT INTO giveaways (guild_id, channel_id, prize, winner_count, created_by_id, created_at, ends_at, required_role_id, min_level, is_active, winners_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, TRUE, NULL)", (guild_id, channel_id, prize, winner_count, created_by_id, created_at_ts, ends_at, required_role_id, min_level))
@@ -791,7 +1381,7 @@ def create_giveaway(guild_id: int, channel_id: int, prize: str, winner_count: in
 
 # --- Funkcje dla Ticketów ---
 def create_ticket(guild_id: int, user_id: int, topic: str | None) -> int:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     created_at_ts = int(time.time())
     cursor.execute("INSERT INTO tickets (guild_id, user_id, topic, created_at, is_open) VALUES (?, ?, ?, ?, TRUE)", (guild_id, user_id, topic, created_at_ts))
@@ -801,14 +1391,14 @@ def create_ticket(guild_id: int, user_id: int, topic: str | None) -> int:
     return ticket_id
 
 def set_ticket_channel_id(ticket_id: int, channel_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE tickets SET channel_id = ? WHERE id = ?", (channel_id, ticket_id))
     conn.commit()
     conn.close()
 
 def get_open_ticket_by_user(guild_id: int, user_id: int) -> dict | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, channel_id, topic, created_at FROM tickets WHERE guild_id = ? AND user_id = ? AND is_open = TRUE", (guild_id, user_id))
     row = cursor.fetchone()
@@ -817,7 +1407,7 @@ def get_open_ticket_by_user(guild_id: int, user_id: int) -> dict | None:
     return None
 
 def get_ticket_by_channel(guild_id: int, channel_id: int) -> dict | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, user_id, topic, created_at, is_open, closed_by_id, closed_at FROM tickets WHERE guild_id = ? AND channel_id = ?", (guild_id, channel_id))
     row = cursor.fetchone()
@@ -826,7 +1416,7 @@ def get_ticket_by_channel(guild_id: int, channel_id: int) -> dict | None:
     return None
 
 def close_ticket(ticket_id: int, closed_by_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     closed_at_ts = int(time.time())
     cursor.execute("UPDATE tickets SET is_open = FALSE, closed_by_id = ?, closed_at = ? WHERE id = ?", (closed_by_id, closed_at_ts, ticket_id))
@@ -834,22 +1424,23 @@ def close_ticket(ticket_id: int, closed_by_id: int):
     conn.close()
 
 def set_giveaway_message_id(giveaway_id: int, message_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE giveaways SET message_id = ? WHERE id = ?", (message_id, giveaway_id))
     conn.commit()
     conn.close()
 
-def get_active_giveaways_to_end(current_timestamp: int) -> list[dict]:
-    conn = sqlite3.connect(DB_NAME)
+def get_active_giveaways_to_end(current_timestamp: int, shard: tuple[int, tuple[int, ...]] | None = None) -> list[dict]:
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, guild_id, channel_id, message_id, prize, winner_count, created_by_id, ends_at, required_role_id, min_level FROM giveaways WHERE is_active = TRUE AND ends_at <= ?", (current_timestamp,))
+    shard_sql, shard_params = _shard_filter(shard)
+    cursor.execute(f"SELECT id, guild_id, channel_id, message_id, prize, winner_count, created_by_id, ends_at, required_role_id, min_level FROM giveaways WHERE is_active = TRUE AND ends_at <= ? AND {shard_sql}", (current_timestamp, *shard_params))
     giveaways = [{"id": r[0], "guild_id": r[1], "channel_id": r[2], "message_id": r[3], "prize": r[4], "winner_count": r[5], "created_by_id": r[6], "ends_at": r[7], "required_role_id": r[8], "min_level": r[9]} for r in cursor.fetchall()]
     conn.close()
     return giveaways
 
 def end_giveaway(giveaway_id: int, winners_ids: list[int]):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     winners_json_str = json.dumps(winners_ids)
     cursor.execute("UPDATE giveaways SET is_active = FALSE, winners_json = ? WHERE id = ?", (winners_json_str, giveaway_id))
@@ -857,10 +1448,585 @@ def end_giveaway(giveaway_id: int, winners_ids: list[int]):
     conn.close()
 
 def get_giveaway_details(message_id: int) -> dict | None:
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT id, guild_id, channel_id, prize, winner_count, created_by_id, created_at, ends_at, is_active, required_role_id, min_level, winners_json FROM giveaways WHERE message_id = ? ", (message_id,))
     row = cursor.fetchone()
     conn.close()
     if row: return {"id": row[0], "guild_id": row[1], "channel_id": row[2], "prize": row[3], "winner_count": row[4], "created_by_id": row[5], "created_at": row[6], "ends_at": row[7], "is_active": bool(row[8]), "required_role_id": row[9], "min_level": row[10], "winners_json": json.loads(row[11]) if row[11] else [] }
     return None
+
+# --- Funkcje dla Monitorowania Produktów (Product Watchlist) ---
+_WATCHED_PRODUCT_COLUMNS = "id, guild_id, user_id_who_added, product_url, shop_name, product_name, last_known_price_cents, last_known_availability_str, last_scanned_at, is_active, etag, last_modified, content_hash, next_scan_at, scan_interval_seconds, consecutive_failures, last_changed_at"
+
+def _watched_product_from_row(row) -> dict:
+    return {"id": row[0], "guild_id": row[1], "user_id_who_added": row[2], "product_url": row[3], "shop_name": row[4],
+            "product_name": row[5], "last_known_price_cents": row[6], "last_known_availability_str": row[7],
+            "last_scanned_at": row[8], "is_active": bool(row[9]),
+            "etag": row[10], "last_modified": row[11], "content_hash": row[12],
+            "next_scan_at": row[13], "scan_interval_seconds": row[14], "consecutive_failures": row[15], "last_changed_at": row[16]}
+
+def subscribe_to_product(guild_id: int, user_id: int, url: str, shop_name: str, target_price_cents: int | None = None) -> tuple[int, int | None]:
+    """
+    Zapisuje użytkownika na produkt (`url` powinien być już kanoniczny - scrapers.registry).
+    Produkt jest tworzony tylko, jeśli nikt go jeszcze nie śledzi; kolejne osoby dostają tylko subskrypcję.
+    Zwraca (product_id, subscription_id); subscription_id = None, jeśli użytkownik już aktywnie śledzi ten produkt.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+        INSERT INTO watched_products (guild_id, user_id_who_added, product_url, shop_name, is_active)
+        VALUES (?, ?, ?, ?, TRUE)
+        ON CONFLICT (product_url) DO UPDATE SET is_active = TRUE
+        RETURNING id
+        """, (guild_id, user_id, url, shop_name))
+        product_id = cursor.fetchone()[0]
+        cursor.execute("""
+        INSERT INTO product_subscriptions (watched_product_id, guild_id, user_id, target_price_cents, created_at, is_active)
+        VALUES (?, ?, ?, ?, ?, TRUE)
+        ON CONFLICT (watched_product_id, guild_id, user_id) DO UPDATE SET
+            target_price_cents = excluded.target_price_cents, created_at = excluded.created_at, is_active = TRUE
+        WHERE is_active = FALSE
+        RETURNING id
+        """, (product_id, guild_id, user_id, target_price_cents, int(time.time())))
+        row = cursor.fetchone()
+        if row:
+            # Nowy (albo ponownie aktywowany) produkt lub nowy subskrybent - skan przy najbliższym tyknięciu.
+            # Zapis w bazie, bo harmonogram działa tylko w jednym procesie bota (product_scheduler.merge).
+            cursor.execute("UPDATE watched_products SET next_scan_at = ? WHERE id = ?", (int(time.time()), product_id))
+        conn.commit()
+        return product_id, row[0] if row else None
+    finally:
+        conn.close()
+
+def get_watched_product_by_url(url: str) -> dict | None:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {_WATCHED_PRODUCT_COLUMNS} FROM watched_products WHERE product_url = ?", (url,))
+    row = cursor.fetchone()
+    conn.close()
+    return _watched_product_from_row(row) if row else None
+
+def unsubscribe_from_product(guild_id: int, user_id: int, product_id: int) -> bool:
+    """Wypisuje użytkownika z produktu. Produkt bez aktywnych subskrybentów przestaje być skanowany."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+        UPDATE product_subscriptions SET is_active = FALSE
+        WHERE watched_product_id = ? AND guild_id = ? AND user_id = ? AND is_active = TRUE
+        """, (product_id, guild_id, user_id))
+        updated_rows = cursor.rowcount
+        if updated_rows:
+            cursor.execute("""
+            UPDATE watched_products SET is_active = FALSE
+            WHERE id = ? AND NOT EXISTS (SELECT 1 FROM product_subscriptions WHERE watched_product_id = ? AND is_active = TRUE)
+            """, (product_id, product_id))
+        conn.commit()
+        return updated_rows > 0
+    finally:
+        conn.close()
+
+def get_user_watched_products(user_id: int, guild_id: int) -> list[dict]:
+    """Produkty śledzone przez użytkownika na serwerze (dane produktu + próg cenowy subskrypcji)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    columns = ", ".join(f"wp.{column.strip()}" for column in _WATCHED_PRODUCT_COLUMNS.split(","))
+    cursor.execute(f"""
+    SELECT {columns}, ps.target_price_cents
+    FROM product_subscriptions ps JOIN watched_products wp ON wp.id = ps.watched_product_id
+    WHERE ps.user_id = ? AND ps.guild_id = ? AND ps.is_active = TRUE
+    ORDER BY wp.id ASC
+    """, (user_id, guild_id))
+    products = []
+    for row in cursor.fetchall():
+        product = _watched_product_from_row(row)
+        product["target_price_cents"] = row[-1]
+        products.append(product)
+    conn.close()
+    return products
+
+def get_guild_watched_products(guild_id: int) -> list[dict]:
+    """Produkty śledzone przez kogokolwiek na serwerze (każdy produkt raz)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT {_WATCHED_PRODUCT_COLUMNS} FROM watched_products
+    WHERE id IN (SELECT watched_product_id FROM product_subscriptions WHERE guild_id = ? AND is_active = TRUE)
+    ORDER BY id ASC
+    """, (guild_id,))
+    products = [_watched_product_from_row(row) for row in cursor.fetchall()]
+    conn.close()
+    return products
+
+def get_product_subscribers(product_ids: list[int]) -> dict[int, list[dict]]:
+    """Aktywni subskrybenci produktów: {product_id: [{"guild_id", "user_id", "target_price_cents"}, ...]}."""
+    subscribers = {}
+    if not product_ids:
+        return subscribers
+    conn = get_connection()
+    cursor = conn.cursor()
+    # W partiach, żeby nie przekroczyć limitu parametrów SQLite
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        cursor.execute(f"""
+        SELECT watched_product_id, guild_id, user_id, target_price_cents FROM product_subscriptions
+        WHERE watched_product_id IN ({",".join("?" * len(chunk))}) AND is_active = TRUE
+        """, chunk)
+        for product_id, guild_id, user_id, target_price_cents in cursor.fetchall():
+            subscribers.setdefault(product_id, []).append(
+                {"guild_id": guild_id, "user_id": user_id, "target_price_cents": target_price_cents})
+    conn.close()
+    return subscribers
+
+def get_all_active_watched_products() -> list[dict]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {_WATCHED_PRODUCT_COLUMNS} FROM watched_products WHERE is_active = TRUE")
+    products = [_watched_product_from_row(row) for row in cursor.fetchall()]
+    conn.close()
+    return products
+
+def get_watched_products_due_between(since: int, until: int) -> list[dict]:
+    """Aktywne produkty z terminem skanu w [since, until] - to, co harmonogram dociąga z bazy przy każdym tyknięciu."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT {_WATCHED_PRODUCT_COLUMNS} FROM watched_products
+    WHERE is_active = TRUE AND next_scan_at BETWEEN ? AND ?
+    """, (since, until))
+    products = [_watched_product_from_row(row) for row in cursor.fetchall()]
+    conn.close()
+    return products
+
+def get_watched_products_by_ids(product_ids: list[int]) -> list[dict]:
+    """Aktywne produkty o podanych ID (nieaktywne są pomijane)."""
+    products = []
+    if not product_ids:
+        return products
+    conn = get_connection()
+    cursor = conn.cursor()
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        cursor.execute(f"SELECT {_WATCHED_PRODUCT_COLUMNS} FROM watched_products WHERE id IN ({','.join('?' * len(chunk))}) AND is_active = TRUE", chunk)
+        products.extend(_watched_product_from_row(row) for row in cursor.fetchall())
+    conn.close()
+    return products
+
+def update_watched_product_data(product_id: int, name: str | None, price_cents: int | None, availability_str: str | None, scanned_at: int):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+    UPDATE watched_products
+    SET product_name = COALESCE(?, product_name), last_known_price_cents = ?, last_known_availability_str = ?, last_scanned_at = ?
+    WHERE id = ?
+    """, (name, price_cents, availability_str, scanned_at, product_id))
+    conn.commit()
+    conn.close()
+
+# --- Historia cen (punkty zmiany) ---
+PRICE_HISTORY_RAW_RETENTION_DAYS = 30 # Starsze punkty zmiany -> agregaty godzinowe
+PRICE_HISTORY_HOURLY_RETENTION_DAYS = 180 # Starsze agregaty godzinowe -> dzienne (trzymane bez limitu)
+_availability_ids = {} # DB_NAME -> {label: id} zatwierdzonych wierszy availability_states (słownik jest mały i tylko rośnie)
+
+def _availability_id(cursor, label: str | None, new_ids: dict) -> int | None:
+    """
+    ID tekstu dostępności; brakujący dopisuje do availability_states. ID dopisane w bieżącej transakcji trafiają
+    do `new_ids`, a do wspólnego cache dopiero po commit (_remember_availability_ids) - po rollbacku wiersza
+    już nie ma i jego ID mógłby dostać inny tekst.
+    """
+    if label is None:
+        return None
+    availability_id = _availability_ids.get(DB_NAME, {}).get(label, new_ids.get(label))
+    if availability_id is None:
+        cursor.execute("INSERT OR IGNORE INTO availability_states (label) VALUES (?)", (label,))
+        inserted = cursor.rowcount == 1
+        cursor.execute("SELECT id FROM availability_states WHERE label = ?", (label,))
+        availability_id = cursor.fetchone()[0]
+        if inserted:
+            new_ids[label] = availability_id
+        else:
+            _availability_ids.setdefault(DB_NAME, {})[label] = availability_id
+    return availability_id
+
+def _remember_availability_ids(new_ids: dict):
+    """Wywoływane po commit transakcji, która dopisała `new_ids` (z _availability_id)."""
+    if new_ids:
+        _availability_ids.setdefault(DB_NAME, {}).update(new_ids)
+
+def _record_price_point(cursor, watched_product_id: int, scanned_at: int, price_cents: int | None, availability_str: str | None,
+                        new_availability_ids: dict) -> int | None:
+    """
+    Przedłuża ostatni stan produktu, jeśli cena i dostępność się nie zmieniły; w przeciwnym razie dopisuje punkt zmiany.
+    Zwraca ID dostępności z availability_states.
+    """
+    availability_id = _availability_id(cursor, availability_str, new_availability_ids)
+    cursor.execute("""
+    UPDATE price_history SET last_seen_at = MAX(last_seen_at, ?)
+    WHERE id = (SELECT id FROM price_history WHERE watched_product_id = ? ORDER BY scan_date DESC, id DESC LIMIT 1)
+      AND price_cents IS ? AND availability_id IS ?
+    """, (scanned_at, watched_product_id, price_cents, availability_id))
+    if cursor.rowcount == 0:
+        cursor.execute("""
+        INSERT INTO price_history (watched_product_id, scan_date, last_seen_at, price_cents, availability_id)
+        VALUES (?, ?, ?, ?, ?)
+        """, (watched_product_id, scanned_at, scanned_at, price_cents, availability_id))
+    return availability_id
+
+def add_price_history_entry(watched_product_id: int, scan_date: int, price_cents: int | None, availability_str: str | None):
+    conn = get_connection()
+    cursor = conn.cursor()
+    new_availability_ids = {}
+    _record_price_point(cursor, watched_product_id, scan_date, price_cents, availability_str, new_availability_ids)
+    conn.commit()
+    conn.close()
+    _remember_availability_ids(new_availability_ids)
+
+def record_product_scan_results(results: list[dict]):
+    """
+    Zapisuje wyniki całego cyklu skanowania w jednej transakcji.
+    Każdy wynik: {"product_id", "scanned_at", "ok", "name", "price_cents", "availability_str"}
+    oraz opcjonalnie walidatory strony {"etag", "last_modified", "content_hash"} - zapisywane tylko,
+    gdy są w wyniku (pominięty skan 304/bez zmian ich nie podaje, więc zostają poprzednie),
+    oraz harmonogram {"next_scan_at", "scan_interval_seconds", "consecutive_failures", "last_changed_at"}.
+    Nieudany skan (ok=False) zapisuje tylko czas skanowania - historia cen opisuje produkt, nie skaner.
+    """
+    if not results:
+        return
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        successful = [r for r in results if r["ok"]]
+        failed = [r for r in results if not r["ok"]]
+        cursor.executemany("""
+        UPDATE watched_products
+        SET product_name = COALESCE(?, product_name), last_known_price_cents = ?, last_known_availability_str = ?, last_scanned_at = ?
+        WHERE id = ?
+        """, [(r["name"], r["price_cents"], r["availability_str"], r["scanned_at"], r["product_id"]) for r in successful])
+        cursor.executemany("UPDATE watched_products SET etag = ?, last_modified = ?, content_hash = ? WHERE id = ?",
+                           [(r["etag"], r["last_modified"], r["content_hash"], r["product_id"]) for r in results if "content_hash" in r])
+        cursor.executemany("UPDATE watched_products SET last_scanned_at = ? WHERE id = ?", [(r["scanned_at"], r["product_id"]) for r in failed])
+        cursor.executemany("""
+        UPDATE watched_products SET next_scan_at = ?, scan_interval_seconds = ?, consecutive_failures = ?, last_changed_at = ?
+        WHERE id = ?
+        """, [(r["next_scan_at"], r["scan_interval_seconds"], r["consecutive_failures"], r["last_changed_at"], r["product_id"])
+              for r in results if "next_scan_at" in r])
+        new_availability_ids = {}
+        for r in successful:
+            availability_id = _record_price_point(cursor, r["product_id"], r["scanned_at"], r["price_cents"], r["availability_str"],
+                                                  new_availability_ids)
+            _update_report_summary(cursor, r["product_id"], r["scanned_at"], r["price_cents"], availability_id)
+        conn.commit()
+        _remember_availability_ids(new_availability_ids)
+    finally:
+        conn.close()
+
+# --- Podsumowania do dziennych raportów produktowych ---
+REPORT_WINDOW_SECONDS = 24 * 3600
+REPORT_WINDOW_SLACK_SECONDS = 3600 # Okno przesuwamy co najwyżej raz na godzinę - raport obejmuje 24-25h
+
+def _state_at(cursor, watched_product_id: int, at: int) -> tuple[int | None, int | None]:
+    """(cena, ID dostępności) obowiązujące w chwili `at`; dla produktu młodszego niż `at` - pierwszy znany stan."""
+    cursor.execute("""
+    SELECT price_cents, availability_id FROM price_history WHERE watched_product_id = ? AND scan_date <= ?
+    ORDER BY scan_date DESC, id DESC LIMIT 1
+    """, (watched_product_id, at))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("SELECT price_cents, availability_id FROM price_history WHERE watched_product_id = ? ORDER BY scan_date, id LIMIT 1", (watched_product_id,))
+        row = cursor.fetchone()
+    return row if row else (None, None)
+
+def _update_report_summary(cursor, watched_product_id: int, scanned_at: int, price_cents: int | None, availability_id: int | None):
+    """
+    Aktualizuje podsumowanie 24h produktu po zapisaniu skanu (w tej samej transakcji co price_history).
+    Zwykle to jeden UPDATE stanu bieżącego; stan otwarcia okna czytamy z historii tylko przy przesunięciu okna (max. raz na godzinę).
+    """
+    cursor.execute("""
+    SELECT open_at, last_price_cents, last_availability_id, last_changed_at FROM product_report_summary WHERE watched_product_id = ?
+    """, (watched_product_id,))
+    row = cursor.fetchone()
+    window_start = scanned_at - REPORT_WINDOW_SECONDS
+    if row is None:
+        open_price_cents, open_availability_id = _state_at(cursor, watched_product_id, window_start)
+        cursor.execute("""
+        INSERT INTO product_report_summary (watched_product_id, open_at, open_price_cents, open_availability_id,
+                                            last_price_cents, last_availability_id, last_changed_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (watched_product_id, window_start, open_price_cents, open_availability_id, price_cents, availability_id, scanned_at, scanned_at))
+        return
+
+    open_at, last_price_cents, last_availability_id, last_changed_at = row
+    if last_price_cents != price_cents or last_availability_id != availability_id:
+        last_changed_at = scanned_at
+    if open_at < window_start - REPORT_WINDOW_SLACK_SECONDS:
+        open_price_cents, open_availability_id = _state_at(cursor, watched_product_id, window_start)
+        cursor.execute("""
+        UPDATE product_report_summary SET open_at = ?, open_price_cents = ?, open_availability_id = ?,
+            last_price_cents = ?, last_availability_id = ?, last_changed_at = ?, updated_at = ?
+        WHERE watched_product_id = ?
+        """, (window_start, open_price_cents, open_availability_id, price_cents, availability_id, last_changed_at, scanned_at, watched_product_id))
+    else:
+        cursor.execute("""
+        UPDATE product_report_summary SET last_price_cents = ?, last_availability_id = ?, last_changed_at = ?, updated_at = ?
+        WHERE watched_product_id = ?
+        """, (price_cents, availability_id, last_changed_at, scanned_at, watched_product_id))
+
+def get_all_guilds_with_product_report_config() -> list[dict]:
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+    SELECT guild_id, product_report_channel_id, product_report_time_utc FROM server_configs
+    WHERE product_report_channel_id IS NOT NULL AND product_report_time_utc IS NOT NULL
+    """)
+    configs = [{"guild_id": row[0], "report_channel_id": row[1], "report_time_utc": row[2]} for row in cursor.fetchall()]
+    conn.close()
+    return configs
+
+def get_unscheduled_product_report_configs(shard: tuple[int, tuple[int, ...]] | None = None) -> list[dict]:
+    """Serwery z ustawionym raportem, które nie mają jeszcze terminu w product_report_schedule."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    shard_sql, shard_params = _shard_filter(shard, "sc.guild_id")
+    cursor.execute(f"""
+    SELECT sc.guild_id, sc.product_report_channel_id, sc.product_report_time_utc FROM server_configs sc
+    LEFT JOIN product_report_schedule rs ON rs.guild_id = sc.guild_id
+    WHERE sc.product_report_channel_id IS NOT NULL AND sc.product_report_time_utc IS NOT NULL AND rs.guild_id IS NULL AND {shard_sql}
+    """, shard_params)
+    configs = [{"guild_id": row[0], "report_channel_id": row[1], "report_time_utc": row[2]} for row in cursor.fetchall()]
+    conn.close()
+    return configs
+
+def set_product_report_schedule(guild_id: int, scheduled_for: int, replace: bool = True):
+    """Ustawia termin kolejnego raportu serwera. replace=False - tylko gdy serwer nie ma jeszcze terminu."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    on_conflict = "DO UPDATE SET scheduled_for = excluded.scheduled_for, next_attempt_at = excluded.next_attempt_at" if replace else "DO NOTHING"
+    cursor.execute(f"""
+    INSERT INTO product_report_schedule (guild_id, scheduled_for, next_attempt_at) VALUES (?, ?, ?)
+    ON CONFLICT(guild_id) {on_conflict}
+    """, (guild_id, scheduled_for, scheduled_for))
+    conn.commit()
+    conn.close()
+
+def remove_product_report_schedule(guild_id: int):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM product_report_schedule WHERE guild_id = ?", (guild_id,))
+    conn.commit()
+    conn.close()
+
+def get_next_product_report_attempt(shard: tuple[int, tuple[int, ...]] | None = None) -> int | None:
+    """Najbliższy termin w harmonogramie raportów (do kiedy może spać report_scheduler)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    shard_sql, shard_params = _shard_filter(shard)
+    cursor.execute(f"SELECT MIN(next_attempt_at) FROM product_report_schedule WHERE {shard_sql}", shard_params)
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def get_due_product_reports(current_timestamp: int, shard: tuple[int, tuple[int, ...]] | None = None) -> list[dict]:
+    """
+    Raporty, których termin minął, razem z aktualnymi ustawieniami serwera.
+    Terminy serwerów, które wyłączyły raport (brak kanału lub godziny), są usuwane.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    shard_sql, shard_params = _shard_filter(shard, "rs.guild_id")
+    cursor.execute(f"""
+    SELECT rs.guild_id, rs.scheduled_for, rs.attempt_started_for, sc.product_report_channel_id, sc.product_report_time_utc
+    FROM product_report_schedule rs
+    LEFT JOIN server_configs sc ON sc.guild_id = rs.guild_id
+    WHERE rs.next_attempt_at <= ? AND {shard_sql}
+    ORDER BY rs.next_attempt_at
+    """, (current_timestamp, *shard_params))
+    due, disabled = [], []
+    for row in cursor.fetchall():
+        if row[3] is None or row[4] is None:
+            disabled.append((row[0],))
+            continue
+        due.append({"guild_id": row[0], "scheduled_for": row[1], "attempt_started_for": row[2],
+                    "report_channel_id": row[3], "report_time_utc": row[4]})
+    if disabled:
+        cursor.executemany("DELETE FROM product_report_schedule WHERE guild_id = ?", disabled)
+        conn.commit()
+    conn.close()
+    return due
+
+def mark_product_report_attempt(guild_id: int, scheduled_for: int):
+    """Zapisywane tuż przed wysyłką - po restarcie wiadomo, że raport mógł już zostać wysłany."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE product_report_schedule SET attempt_started_for = ? WHERE guild_id = ? AND scheduled_for = ?",
+                   (scheduled_for, guild_id, scheduled_for))
+    conn.commit()
+    conn.close()
+
+def retry_product_report(guild_id: int, scheduled_for: int, next_attempt_at: int):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE product_report_schedule SET next_attempt_at = ? WHERE guild_id = ? AND scheduled_for = ?",
+                   (next_attempt_at, guild_id, scheduled_for))
+    conn.commit()
+    conn.close()
+
+def advance_product_report(guild_id: int, scheduled_for: int, next_scheduled_for: int, sent: bool, sent_at: int):
+    """
+    Przesuwa termin obsłużonego raportu (`scheduled_for`) na kolejny dzień. Jeśli w międzyczasie
+    zmieniono ustawienia (inny scheduled_for), nowy termin z set_product_report_schedule zostaje.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+    UPDATE product_report_schedule SET scheduled_for = ?, next_attempt_at = ?, attempt_started_for = NULL,
+        last_sent_for = CASE WHEN ? THEN scheduled_for ELSE last_sent_for END,
+        last_sent_at = CASE WHEN ? THEN ? ELSE last_sent_at END
+    WHERE guild_id = ? AND scheduled_for = ?
+    """, (next_scheduled_for, next_scheduled_for, sent, sent, sent_at, guild_id, scheduled_for))
+    conn.commit()
+    conn.close()
+
+_REPORT_SUMMARY_QUERY = """
+SELECT wp.id, wp.product_name, wp.product_url, s.open_price_cents, s.last_price_cents,
+       open_state.label, last_state.label, s.last_changed_at
+FROM product_report_summary s
+JOIN watched_products wp ON wp.id = s.watched_product_id
+LEFT JOIN availability_states open_state ON open_state.id = s.open_availability_id
+LEFT JOIN availability_states last_state ON last_state.id = s.last_availability_id
+WHERE s.watched_product_id IN (SELECT watched_product_id FROM product_subscriptions WHERE guild_id = ? AND is_active = TRUE)
+  AND s.last_changed_at >= ?
+"""
+
+def _report_row_to_dict(row) -> dict:
+    return {"product_id": row[0], "product_name": row[1] or "Produkt", "product_url": row[2],
+            "old_price_cents": row[3], "new_price_cents": row[4],
+            "old_availability_str": row[5], "new_availability_str": row[6], "changed_at": row[7]}
+
+def get_product_changes_for_report(guild_id: int, hours_ago: int = 24) -> list[dict]:
+    """
+    Produkty śledzone na serwerze, których cena lub dostępność zmieniła się w ciągu `hours_ago` godzin
+    (stan "przed" to początek okna z product_report_summary, maks. 24h wstecz). Najświeższe zmiany pierwsze.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(_REPORT_SUMMARY_QUERY + """
+      AND (s.open_price_cents IS NOT s.last_price_cents OR s.open_availability_id IS NOT s.last_availability_id)
+    ORDER BY s.last_changed_at DESC
+    """, (guild_id, int(time.time()) - hours_ago * 3600))
+    changes = [_report_row_to_dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return changes
+
+def get_top_price_drops(guild_id: int, hours_ago: int = 24, limit: int = 5) -> list[dict]:
+    """Największe procentowe spadki cen produktów serwera w oknie raportu."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(_REPORT_SUMMARY_QUERY + """
+      AND s.open_price_cents > 0 AND s.last_price_cents < s.open_price_cents
+    ORDER BY CAST(s.open_price_cents - s.last_price_cents AS REAL) / s.open_price_cents DESC
+    LIMIT ?
+    """, (guild_id, int(time.time()) - hours_ago * 3600, limit))
+    drops = []
+    for row in cursor.fetchall():
+        drop = _report_row_to_dict(row)
+        drop["drop_percentage"] = (drop["old_price_cents"] - drop["new_price_cents"]) / drop["old_price_cents"] * 100
+        drops.append(drop)
+    conn.close()
+    return drops
+
+def downsample_price_history(now: int | None = None) -> tuple[int, int]:
+    """
+    Zadanie retencji: punkty zmiany starsze niż PRICE_HISTORY_RAW_RETENTION_DAYS łączy w agregaty godzinowe
+    (min/max/ostatnia cena), a agregaty godzinowe starsze niż PRICE_HISTORY_HOURLY_RETENTION_DAYS w dzienne.
+    Granice są wyrównane do pełnych dni, więc żaden przedział nie jest dzielony między dwa uruchomienia.
+    Bieżący stan produktu (ostatni punkt, nawet bardzo stary, ale wciąż potwierdzany skanami) zostaje nietknięty.
+    Zwraca (liczba zagregowanych punktów, liczba zagregowanych godzin).
+    """
+    now = now or int(time.time())
+    raw_cutoff = (now - PRICE_HISTORY_RAW_RETENTION_DAYS * 86400) // 86400 * 86400
+    hourly_cutoff = (now - PRICE_HISTORY_HOURLY_RETENTION_DAYS * 86400) // 86400 * 86400
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+        WITH old_points AS (
+            SELECT watched_product_id, scan_date / 3600 * 3600 AS bucket_start, price_cents, availability_id,
+                   ROW_NUMBER() OVER bucket_points AS newest_first,
+                   MIN(price_cents) OVER bucket_all AS min_price_cents,
+                   MAX(price_cents) OVER bucket_all AS max_price_cents,
+                   MAX(last_seen_at) OVER bucket_all AS bucket_last_seen_at
+            FROM price_history
+            WHERE last_seen_at < ?
+            WINDOW bucket_all AS (PARTITION BY watched_product_id, scan_date / 3600),
+                   bucket_points AS (PARTITION BY watched_product_id, scan_date / 3600 ORDER BY scan_date DESC, id DESC)
+        )
+        INSERT INTO price_history_rollup (watched_product_id, bucket_seconds, bucket_start, min_price_cents, max_price_cents,
+                                          last_price_cents, last_availability_id, last_seen_at)
+        SELECT watched_product_id, 3600, bucket_start, min_price_cents, max_price_cents, price_cents, availability_id, bucket_last_seen_at
+        FROM old_points WHERE newest_first = 1
+        ON CONFLICT (watched_product_id, bucket_seconds, bucket_start) DO UPDATE SET
+            min_price_cents = MIN(min_price_cents, excluded.min_price_cents),
+            max_price_cents = MAX(max_price_cents, excluded.max_price_cents),
+            last_price_cents = excluded.last_price_cents, last_availability_id = excluded.last_availability_id,
+            last_seen_at = MAX(last_seen_at, excluded.last_seen_at)
+        """, (raw_cutoff,))
+        cursor.execute("DELETE FROM price_history WHERE last_seen_at < ?", (raw_cutoff,))
+        points_rolled_up = cursor.rowcount
+
+        cursor.execute("""
+        WITH old_hours AS (
+            SELECT watched_product_id, bucket_start / 86400 * 86400 AS day_start, last_price_cents, last_availability_id,
+                   ROW_NUMBER() OVER day_hours AS newest_first,
+                   MIN(min_price_cents) OVER day_all AS day_min, MAX(max_price_cents) OVER day_all AS day_max,
+                   MAX(last_seen_at) OVER day_all AS day_last_seen_at
+            FROM price_history_rollup
+            WHERE bucket_seconds = 3600 AND bucket_start < ?
+            WINDOW day_all AS (PARTITION BY watched_product_id, bucket_start / 86400),
+                   day_hours AS (PARTITION BY watched_product_id, bucket_start / 86400 ORDER BY bucket_start DESC)
+        )
+        INSERT INTO price_history_rollup (watched_product_id, bucket_seconds, bucket_start, min_price_cents, max_price_cents,
+                                          last_price_cents, last_availability_id, last_seen_at)
+        SELECT watched_product_id, 86400, day_start, day_min, day_max, last_price_cents, last_availability_id, day_last_seen_at
+        FROM old_hours WHERE newest_first = 1
+        ON CONFLICT (watched_product_id, bucket_seconds, bucket_start) DO UPDATE SET
+            min_price_cents = MIN(min_price_cents, excluded.min_price_cents),
+            max_price_cents = MAX(max_price_cents, excluded.max_price_cents),
+            last_price_cents = excluded.last_price_cents, last_availability_id = excluded.last_availability_id,
+            last_seen_at = MAX(last_seen_at, excluded.last_seen_at)
+        """, (hourly_cutoff,))
+        cursor.execute("DELETE FROM price_history_rollup WHERE bucket_seconds = 3600 AND bucket_start < ?", (hourly_cutoff,))
+        hours_rolled_up = cursor.rowcount
+        conn.commit()
+        return points_rolled_up, hours_rolled_up
+    finally:
+        conn.close()
+
+def get_price_history(watched_product_id: int, since: int) -> list[dict]:
+    """
+    Historia ceny produktu od `since` (chronologicznie): agregaty dzienne/godzinowe dla starszych okresów,
+    punkty zmiany dla ostatnich PRICE_HISTORY_RAW_RETENTION_DAYS dni. Każdy wpis:
+    {"at", "bucket_seconds" (0 = punkt zmiany), "min_price_cents", "max_price_cents", "price_cents", "availability_str", "last_seen_at"}.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+    SELECT bucket_start, bucket_seconds, min_price_cents, max_price_cents, last_price_cents, a.label, r.last_seen_at
+    FROM price_history_rollup r LEFT JOIN availability_states a ON a.id = r.last_availability_id
+    WHERE r.watched_product_id = ? AND r.bucket_seconds IN (3600, 86400) AND r.last_seen_at >= ?
+    UNION ALL
+    SELECT scan_date, 0, price_cents, price_cents, price_cents, a.label, p.last_seen_at
+    FROM price_history p LEFT JOIN availability_states a ON a.id = p.availability_id
+    WHERE p.watched_product_id = ? AND p.last_seen_at >= ?
+    ORDER BY 1
+    """, (watched_product_id, since, watched_product_id, since))
+    history = [{"at": row[0], "bucket_seconds": row[1], "min_price_cents": row[2], "max_price_cents": row[3],
+                "price_cents": row[4], "availability_str": row[5], "last_seen_at": row[6]} for row in cursor.fetchall()]
+    conn.close()
+    return history
+
+if __name__ == '__main__':
+    from_version, to_version = init_db()
+    print(f"Baza danych '{DB_NAME}' zainicjalizowana: schemat w wersji {to_version} (wcześniej {from_version}).")
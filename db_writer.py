@@ -0,0 +1,76 @@
+"""
+Proces pisarza bazy danych dla trybu wieloprocesowego (launcher.py).
+
+SQLite pozwala na jednego pisarza naraz - gdy kilka procesów bota zapisuje równolegle, czekają
+na blokadę pliku (busy_timeout) i przy większym ruchu dostają "database is locked". Dlatego w tym trybie
+wszystkie zapisy idą do jednego procesu, który wykonuje je po kolei na jednym wątku,
+tak jak async_database._writer w trybie jednoprocesowym. Odczyty procesy bota robią same (WAL).
+
+Protokół: multiprocessing.connection z kluczem (authkey). Klient wysyła (nazwa_funkcji, args, kwargs),
+dostaje (True, wynik) albo (False, wyjątek). Wykonać można tylko funkcje oznaczone w async_database jako _writer.
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+import database
+
+def _allowed_functions() -> set[str]:
+    # Import dopiero tutaj: async_database przy imporcie czyta DB_WRITER_ADDRESS, a w tym procesie
+    # zapisy mają iść lokalnie
+    os.environ.pop('DB_WRITER_ADDRESS', None)
+    import async_database
+    return set(async_database.WRITER_FUNCTIONS)
+
+def _serve_client(connection, executor: ThreadPoolExecutor, allowed: set[str]):
+    try:
+        while True:
+            try:
+                name, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                return # Proces bota zakończył się lub zerwał połączenie
+            if name not in allowed:
+                connection.send((False, ValueError(f"Funkcja '{name}' nie jest dozwolona w procesie pisarza.")))
+                continue
+            try:
+                result = executor.submit(getattr(database, name), *args, **kwargs).result()
+            except Exception as e:
+                connection.send((False, e))
+            else:
+                connection.send((True, result))
+    finally:
+        connection.close()
+
+def serve(address: tuple[str, int], authkey: bytes):
+    allowed = _allowed_functions()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+    executor.submit(database.init_db).result()
+    listener = Listener(address, authkey=authkey)
+    print(f"[DB_WRITER] Nasłuchuję na {address[0]}:{listener.address[1]} (baza: {database.DB_NAME})")
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                # Np. klient z błędnym kluczem - nie zatrzymuje pisarza
+                print(f"[DB_WRITER] Odrzucone połączenie: {e}")
+                continue
+            threading.Thread(target=_serve_client, args=(connection, executor, allowed), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        executor.shutdown(wait=True)
+        database.close_pool()
+        print("[DB_WRITER] Zamknięto.")
+
+if __name__ == "__main__":
+    address = os.getenv('DB_WRITER_ADDRESS')
+    authkey = os.getenv('DB_WRITER_AUTHKEY')
+    if not address or not authkey:
+        sys.exit("Ustaw DB_WRITER_ADDRESS (host:port) i DB_WRITER_AUTHKEY (hex) albo uruchom bota przez launcher.py.")
+    host, port = address.rsplit(":", 1)
+    serve((host, int(port)), bytes.fromhex(authkey))
@@ -0,0 +1,103 @@
+"""
+Wspólny silnik wygasania: role czasowe, kary (wyciszenia/bany), ankiety i losowania.
+
+Terminy wszystkich rodzajów trzymamy w jednym kopcu (heapq) wczytanym z bazy przy starcie
+i uzupełnianym przez schedule() przy dodaniu nowego wpisu (async_database robi to po każdym zapisie
+wpisu z terminem). Jedno zadanie w tle śpi dokładnie do najbliższego terminu - dopóki nic nie wygasa,
+nie ma żadnych zapytań do bazy.
+Po przebudzeniu zdejmujemy wszystkie minione terminy i dla każdego rodzaju wywołujemy raz
+jego handler(now), który pobiera jednym zapytaniem wszystko, co wygasło, i obsługuje to paczką.
+"""
+import asyncio
+import heapq
+import time
+
+RETRY_DELAY_SECONDS = 60 # Ponowienie rodzaju, którego handler rzucił wyjątek
+MAX_SLEEP_SECONDS = 3600 # Zabezpieczenie przed zmianą czasu systemowego (bez zapytań do bazy)
+
+class ExpiryEngine:
+    def __init__(self, loader):
+        # loader() -> {rodzaj: [terminy]} - korutyna wczytująca przyszłe i zaległe terminy z bazy
+        self._loader = loader
+        self._handlers = {} # rodzaj -> handler(now: int), korutyna obsługująca wszystkie wygasłe wpisy
+        self._heap = [] # (termin, rodzaj)
+        self._queued = set() # (termin, rodzaj) w kopcu - wiele wpisów z tym samym terminem to jedno przebudzenie
+        self._wake = asyncio.Event()
+        self._task = None
+        self.fired = {} # rodzaj -> liczba wywołań handlera
+
+    def register(self, kind: str, handler):
+        self._handlers[kind] = handler
+
+    def schedule(self, kind: str, deadline: int | float):
+        """Dodaje termin (np. zaraz po zapisaniu nowej roli czasowej lub kary)."""
+        key = (deadline, kind)
+        if key in self._queued:
+            return
+        self._queued.add(key)
+        heapq.heappush(self._heap, key)
+        if self._heap[0] == key:
+            self._wake.set() # Nowy najbliższy termin - zadanie musi skrócić sen
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    async def _load(self):
+        while True:
+            try:
+                loaded = await self._loader()
+                break
+            except Exception as e:
+                print(f"[EXPIRY] Błąd wczytywania terminów z bazy, ponowię za {RETRY_DELAY_SECONDS} s: {e}")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+        for kind, deadlines in loaded.items():
+            for deadline in deadlines:
+                self.schedule(kind, deadline)
+
+    async def _run(self):
+        await self._load()
+        while True:
+            timeout = MAX_SLEEP_SECONDS
+            if self._heap:
+                timeout = min(MAX_SLEEP_SECONDS, max(0.0, self._heap[0][0] - time.time()))
+            self._wake.clear()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            await self._fire_due()
+
+    async def _fire_due(self):
+        now = time.time()
+        due_kinds = set()
+        while self._heap and self._heap[0][0] <= now:
+            key = heapq.heappop(self._heap)
+            self._queued.discard(key)
+            due_kinds.add(key[1])
+        for kind in due_kinds:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                continue
+            try:
+                await handler(int(now))
+                self.fired[kind] = self.fired.get(kind, 0) + 1
+            except Exception as e:
+                print(f"[EXPIRY] Błąd obsługi wygasłych wpisów '{kind}', ponowię za {RETRY_DELAY_SECONDS} s: {e}")
+                self.schedule(kind, now + RETRY_DELAY_SECONDS)
+
+    def start(self):
+        if not self.is_running():
+            self._task = asyncio.create_task(self._run())
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
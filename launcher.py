@@ -0,0 +1,173 @@
+"""
+Uruchamianie bota w kilku procesach (duże instalacje, setki/tysiące serwerów).
+
+Launcher ustala liczbę shardów (SHARD_COUNT z .env albo zalecana przez Discorda), dzieli je
+między procesy bota i uruchamia:
+  1. proces pisarza bazy (db_writer.py) - jedyny, który zapisuje do SQLite,
+  2. procesy bota (main.py), każdy z własnym zakresem shardów (SHARD_COUNT, SHARD_IDS).
+Proces bota, który się zakończy, jest uruchamiany ponownie z rosnącym opóźnieniem.
+Przy zamykaniu (Ctrl+C / SIGTERM) najpierw zatrzymujemy procesy bota (zapisują bufory XP), a pisarza na końcu.
+
+Użycie: python launcher.py --processes 4 [--shards 16]
+"""
+import argparse
+import json
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from multiprocessing.connection import Client
+
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESTART_BASE_DELAY_SECONDS = 5
+RESTART_MAX_DELAY_SECONDS = 300
+STABLE_RUN_SECONDS = 600 # Proces działający dłużej niż to przy kolejnym padzie wraca do najkrótszego opóźnienia
+SHUTDOWN_TIMEOUT_SECONDS = 30
+
+def recommended_shard_count(token: str) -> int:
+    """Liczba shardów zalecana przez Discorda (GET /gateway/bot)."""
+    request = urllib.request.Request("https://discord.com/api/v10/gateway/bot",
+                                     headers={"Authorization": f"Bot {token}", "User-Agent": "AstroBot launcher"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return int(json.load(response)["shards"])
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """Kolejne zakresy shardów, możliwie równe; pierwszy proces zawsze ma shard 0."""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    groups, start = [], 0
+    for index in range(processes):
+        size = base + (1 if index < extra else 0)
+        groups.append(list(range(start, start + size)))
+        start += size
+    return groups
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_for_writer(address: tuple[str, int], authkey: bytes, writer: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if writer.poll() is not None:
+            sys.exit(f"[LAUNCHER] Proces pisarza bazy zakończył się przy starcie (kod {writer.returncode}).")
+        try:
+            Client(address, authkey=authkey).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("[LAUNCHER] Proces pisarza bazy nie zaczął nasłuchiwać.")
+
+def _interrupt(process: subprocess.Popen):
+    # SIGINT = KeyboardInterrupt: bot i pisarz kończą się tak jak po Ctrl+C (zapis buforów, zamknięcie bazy)
+    if process.poll() is None:
+        if os.name == "nt":
+            process.terminate()
+        else:
+            process.send_signal(signal.SIGINT)
+
+def _stop(process: subprocess.Popen, name: str):
+    if process.poll() is not None:
+        return
+    _interrupt(process)
+    try:
+        process.wait(timeout=SHUTDOWN_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        print(f"[LAUNCHER] {name} nie zakończył się w {SHUTDOWN_TIMEOUT_SECONDS} s - zabijam.")
+        process.kill()
+        process.wait()
+
+class _Worker:
+    def __init__(self, shard_ids: list[int], env: dict):
+        self.shard_ids = shard_ids
+        self.env = {**env, "SHARD_IDS": ",".join(map(str, shard_ids))}
+        self.process = None
+        self.started_at = 0.0
+        self.restart_at = 0.0
+        self.failures = 0
+
+    @property
+    def name(self) -> str:
+        return f"Proces bota (shardy {self.shard_ids[0]}-{self.shard_ids[-1]})"
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "main.py")], cwd=BASE_DIR, env=self.env)
+        self.started_at = time.monotonic()
+        print(f"[LAUNCHER] Uruchomiono: {self.name}, PID {self.process.pid}")
+
+    def check(self):
+        """Uruchamia ponownie proces, który się zakończył (z wykładniczym opóźnieniem)."""
+        now = time.monotonic()
+        if self.process is None:
+            if now >= self.restart_at:
+                self.start()
+            return
+        if self.process.poll() is None:
+            return
+        self.failures = 1 if now - self.started_at > STABLE_RUN_SECONDS else self.failures + 1
+        delay = min(RESTART_MAX_DELAY_SECONDS, RESTART_BASE_DELAY_SECONDS * 2 ** (self.failures - 1))
+        print(f"[LAUNCHER] {self.name} zakończył się (kod {self.process.returncode}), ponowne uruchomienie za {delay} s.")
+        self.process = None
+        self.restart_at = now + delay
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Uruchamia AstroBota w kilku procesach ze wspólnym pisarzem bazy.")
+    parser.add_argument("--processes", type=int, default=int(os.getenv('BOT_PROCESSES', 2)), help="Liczba procesów bota")
+    parser.add_argument("--shards", type=int, default=int(os.getenv('SHARD_COUNT', 0)) or None,
+                        help="Łączna liczba shardów (domyślnie zalecana przez Discorda)")
+    args = parser.parse_args()
+
+    token = os.getenv('DISCORD_BOT_TOKEN')
+    if not token:
+        sys.exit("Błąd: Nie znaleziono tokena bota w pliku .env")
+    shard_count = args.shards or recommended_shard_count(token)
+    groups = split_shards(shard_count, args.processes)
+    print(f"[LAUNCHER] {shard_count} shard(ów) w {len(groups)} procesach bota.")
+
+    address = ("127.0.0.1", _free_port())
+    authkey = secrets.token_bytes(32)
+    env = {**os.environ,
+           "DB_WRITER_ADDRESS": f"{address[0]}:{address[1]}",
+           "DB_WRITER_AUTHKEY": authkey.hex(),
+           "SHARD_COUNT": str(shard_count)}
+    writer = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "db_writer.py")], cwd=BASE_DIR, env=env)
+    _wait_for_writer(address, authkey, writer)
+
+    stopping = False
+    def _request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    workers = [_Worker(shard_ids, env) for shard_ids in groups]
+    try:
+        while not stopping:
+            if writer.poll() is not None:
+                # Procesy bota ponawiają połączenie z pisarzem, więc wystarczy go wznowić
+                print(f"[LAUNCHER] Proces pisarza bazy zakończył się (kod {writer.returncode}) - uruchamiam ponownie.")
+                writer = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "db_writer.py")], cwd=BASE_DIR, env=env)
+                _wait_for_writer(address, authkey, writer)
+            for worker in workers:
+                worker.check()
+            time.sleep(1)
+    finally:
+        print("[LAUNCHER] Zamykanie: procesy bota, potem pisarz bazy.")
+        for worker in workers:
+            if worker.process is not None:
+                _interrupt(worker.process)
+        for worker in workers:
+            if worker.process is not None:
+                _stop(worker.process, worker.name)
+        _stop(writer, "Proces pisarza bazy")
+
+if __name__ == "__main__":
+    main()
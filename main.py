@@ -4,23 +4,40 @@ from discord.ext import commands, tasks # Możemy użyć Bot zamiast Client dla
 import os
 from dotenv import load_dotenv
 import database # Import naszego modułu bazy danych
+import async_database # Nieblokujące (await) wersje funkcji z modułu database
 import leveling # Import modułu systemu poziomowania
+import xp_buffer # Bufor zapisu XP i liczby wiadomości
+import ranking # Rankingi XP w pamięci (/rank)
+import product_scheduler # Adaptacyjny harmonogram skanowania produktów
+import report_scheduler # Harmonogram dziennych raportów produktowych
+import expiry_engine # Wygasanie ról czasowych, kar, ankiet i losowań
+import role_actions # Kolejka zmian ról (łączenie per członek, limity Discorda)
+import automod # Potok reguł auto-moderacji
+import metrics # Histogramy czasu i liczniki (eksport w formacie Prometheusa)
 import random # Do losowania XP
 import time # Do cooldownu XP i timestampów
 import sqlite3 # Dla IntegrityError
-import json # Dla parsowania embedów z niestandardowych komend
 import asyncio # Dla asyncio.sleep
+import hashlib # Skrót definicji komend (synchronizacja tylko po zmianie)
+import json
 
 load_dotenv()
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
+STARTUP_CLOCK = time.perf_counter() # Początek pomiaru startu (po imporcie bibliotek)
+startup_timings = {} # etap -> sekundy; raport w pierwszym on_ready
 
-last_xp_gain_timestamp = {}
 import collections
-user_recent_messages = collections.defaultdict(lambda: collections.deque(maxlen=3))
 import re
 from utils import time_parser
-from datetime import datetime, timedelta, time as dt_time
-from scrapers import xkom_scraper
+from utils.state_store import CooldownTable, SpamRing
+try:
+    import resource # Tylko Unix - szczytowe zużycie pamięci procesu w /bot_memory_stats
+except ImportError:
+    resource = None
+from datetime import datetime, timedelta, timezone, time as dt_time
+from scrapers import registry as shop_registry
+from scrapers.http_fetcher import AsyncFetcher
+from concurrent.futures import ProcessPoolExecutor
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -28,9 +45,118 @@ intents.guilds = True
 intents.members = True
 intents.reactions = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Okno trwałości bufora XP: co ile sekund (lub po ilu zmienionych użytkownikach) zapisujemy do bazy
+XP_FLUSH_INTERVAL_SECONDS = float(os.getenv('XP_FLUSH_INTERVAL_SECONDS', xp_buffer.DEFAULT_FLUSH_INTERVAL_SECONDS))
+XP_FLUSH_MAX_PENDING = int(os.getenv('XP_FLUSH_MAX_PENDING', xp_buffer.DEFAULT_MAX_PENDING))
+activity_buffer = xp_buffer.XpWriteBuffer(flush_interval=XP_FLUSH_INTERVAL_SECONDS, max_pending=XP_FLUSH_MAX_PENDING)
+# Stan on_message ograniczony czasem i rozmiarem - pamięć zależy od aktywnych użytkowników, nie od wszystkich widzianych
+xp_cooldowns = CooldownTable(window_seconds=leveling.XP_COOLDOWN_SECONDS)
+recent_messages = SpamRing(size=3) # Skróty 3 ostatnich wiadomości per (serwer, użytkownik)
+# Ranking wczytywany z bazy raz na serwer, z nałożonymi świeższymi sumami z bufora XP
+leaderboards = ranking.RankingIndex(async_database.get_guild_xp_rows, overlay=activity_buffer.guild_totals)
+
+# Skanowanie produktów: limity żądań deklaruje każdy sklep w scrapers/registry.py; tu tylko liczba procesów parsujących HTML
+SCAN_PARSE_WORKERS = int(os.getenv('SCAN_PARSE_WORKERS', 2))
+product_fetcher = AsyncFetcher()
+for shop in shop_registry.SHOPS.values():
+    shop.configure(product_fetcher)
+parse_executor = None # ProcessPoolExecutor tworzony w setup_hook
+# Globalny budżet żądań do sklepów; kolejność i częstotliwość skanów ustala harmonogram
+SCAN_REQUESTS_PER_HOUR = int(os.getenv('SCAN_REQUESTS_PER_HOUR', product_scheduler.DEFAULT_REQUESTS_PER_HOUR))
+scan_scheduler = product_scheduler.ScanScheduler(requests_per_hour=SCAN_REQUESTS_PER_HOUR)
+running_shop_scans = set() # Referencje do zadań skanowania w tle (asyncio trzyma tylko słabe referencje)
+# Zmiany ról wykonywane w tle: łączone per członek w jedno member.edit(roles=...), w tempie poniżej limitów Discorda
+role_action_queue = role_actions.RoleActionQueue()
+
+# Tryb wieloprocesowy (launcher.py): proces obsługuje tylko shardy SHARD_IDS z SHARD_COUNT.
+# Bez tych zmiennych bot działa jak dotąd - jeden proces, liczba shardów wg Discorda.
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+SHARD = (SHARD_COUNT, tuple(SHARD_IDS)) if SHARD_COUNT and SHARD_IDS else None # Filtr zapytań o serwery tego procesu
+# Zadania globalne (skanowanie produktów, retencja historii cen) robi tylko proces z shardem 0.
+# Tam trafiają też DM (quiz weryfikacyjny), więc active_quizzes jest tylko w tym procesie.
+PRIMARY_PROCESS = SHARD is None or 0 in SHARD[1]
+# Globalna synchronizacja komend ma niski limit Discorda - robimy ją tylko po zmianie definicji komend.
+# FORCE_COMMAND_SYNC=1 wymusza synchronizację (np. po ręcznym usunięciu komend w portalu deweloperów).
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '').lower() in ('1', 'true', 'yes')
+# Metryki (metrics.py) są zbierane zawsze; endpoint GET /metrics tylko przy ustawionym METRICS_PORT.
+# W trybie wieloprocesowym każdy proces nasłuchuje na METRICS_PORT + pierwszy z jego shardów.
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_DUMP_INTERVAL_SECONDS = float(os.getenv('METRICS_DUMP_INTERVAL_SECONDS', 0)) # 0 = bez okresowego wydruku
+metrics_runner = None # aiohttp AppRunner endpointu metryk
+
+class AstroBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        # Wywoływane raz na proces, przed połączeniem z gatewayem (w przeciwieństwie do on_ready,
+        # które przychodzi ponownie po każdym zerwanym połączeniu) - tu jest cała jednorazowa inicjalizacja.
+        global parse_executor, metrics_runner
+        startup_timings["login"] = time.perf_counter() - STARTUP_CLOCK
+        try:
+            started_at = time.perf_counter()
+            from_version, to_version = await async_database.init_db()
+            startup_timings["init_db"] = time.perf_counter() - started_at
+            print(f"Baza danych gotowa (schemat w wersji {to_version}" + (f", migracja z wersji {from_version})." if from_version != to_version else ")."))
+        except Exception as e:
+            print(f"Wystąpił błąd podczas inicjalizacji bazy danych: {e}")
+        if PRIMARY_PROCESS: # Komendy globalne są wspólne dla wszystkich procesów - wystarczy jedna synchronizacja
+            try:
+                started_at = time.perf_counter()
+                synced_count = await sync_command_tree_if_changed()
+                startup_timings["command_sync"] = time.perf_counter() - started_at
+                if synced_count is None:
+                    print("Komendy bez zmian - pominięto synchronizację.")
+                else:
+                    print(f"Zsynchronizowano {synced_count} komend(y) globalnie.")
+            except Exception as e:
+                print(f"Wystąpił błąd podczas synchronizacji komend: {e}")
+        activity_buffer.start()
+        role_action_queue.start()
+        # Parsowanie HTML (BeautifulSoup) jest czysto CPU - robimy je poza pętlą zdarzeń i poza GIL
+        parse_executor = ProcessPoolExecutor(max_workers=SCAN_PARSE_WORKERS)
+        if METRICS_PORT:
+            metrics_port = METRICS_PORT + (SHARD[1][0] if SHARD else 0)
+            try:
+                metrics_runner = await metrics.start_http_server(METRICS_HOST, metrics_port)
+                print(f"Metryki dostępne pod http://{METRICS_HOST}:{metrics_port}/metrics")
+            except OSError as e:
+                print(f"Nie udało się uruchomić endpointu metryk na porcie {metrics_port}: {e}")
+        startup_timings["setup_hook"] = time.perf_counter() - STARTUP_CLOCK
+
+    async def close(self):
+        # Przy normalnym zamknięciu zapisujemy wszystkie zbuforowane XP/wiadomości
+        try:
+            await activity_buffer.close()
+        except Exception as e:
+            print(f"Błąd zapisu bufora XP przy zamykaniu: {e}")
+        await expiry.close()
+        await role_action_queue.close()
+        await product_report_scheduler.close()
+        await product_fetcher.close()
+        if parse_executor is not None:
+            parse_executor.shutdown(wait=False, cancel_futures=True)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await super().close()
+
+bot = AstroBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
 active_quizzes = {}
-last_report_sent_date = {}
+
+def command_tree_hash() -> str:
+    """Skrót definicji wszystkich komend globalnych (nazwy, opisy, parametry, uprawnienia) w postaci wysyłanej do Discorda."""
+    payload = sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands()),
+                     key=lambda command: (command.get("type", 1), command["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+async def sync_command_tree_if_changed() -> int | None:
+    """Globalny tree.sync(), tylko gdy skrót komend różni się od zapisanego po ostatniej synchronizacji. Zwraca liczbę komend albo None."""
+    state_key = f"command_tree_hash:{bot.application_id}" # Inna aplikacja (token) = osobny stan
+    tree_hash = command_tree_hash()
+    if not FORCE_COMMAND_SYNC and await async_database.get_bot_state(state_key) == tree_hash:
+        return None
+    synced = await bot.tree.sync()
+    await async_database.set_bot_state(state_key, tree_hash)
+    return len(synced)
 
 # --- Funkcje Pomocnicze (jeśli nie ma ich w osobnych plikach) ---
 # Zakładam, że funkcje takie jak send_quiz_question_dm, process_quiz_results,
@@ -46,27 +172,174 @@ async def log_moderation_action(*args, **kwargs): # Placeholder
 async def _handle_giveaway_end_logic(*args, **kwargs): # Placeholder
     pass
 
+# --- Wygasanie: role czasowe, kary, ankiety, losowania ---
+# Jeden kopiec terminów i jedno zadanie (expiry_engine.py) zamiast osobnych pętli odpytujących bazę.
+expiry = expiry_engine.ExpiryEngine(lambda: async_database.get_pending_expiry_deadlines(shard=SHARD))
+# Zapis roli czasowej/kary/ankiety/losowania przez async_database od razu dokłada jego termin do silnika
+async_database.set_expiry_scheduler(expiry.schedule)
+
+def _role_change_failed(timed_id: int, outcome) -> bool:
+    """Wynik Future z role_actions: True gdy zmianę trzeba ponowić później (błąd przejściowy)."""
+    if isinstance(outcome, (discord.Forbidden, discord.NotFound)):
+        print(f"[EXPIRY] Nie można zdjąć roli (wpis {timed_id}): {outcome}")
+        return False
+    if isinstance(outcome, Exception):
+        print(f"[EXPIRY] Błąd zdejmowania roli (wpis {timed_id}): {outcome}")
+        return True
+    return False
+
+@metrics.timed("expiry")
+async def _expire_timed_roles(now: int):
+    expired = await async_database.get_expired_roles(now, shard=SHARD)
+    changes = [] # (timed_role_id, Future) - zmiany ról idą przez wspólną kolejkę, łączone per członek
+    done_ids = []
+    for timed_role_id, guild_id, user_id, role_id, _ in expired:
+        guild = bot.get_guild(guild_id)
+        member = guild.get_member(user_id) if guild else None
+        role = guild.get_role(role_id) if guild else None
+        if member and role and role in member.roles:
+            changes.append((timed_role_id, role_action_queue.remove_role(member, role, reason="Rola czasowa wygasła")))
+        else:
+            done_ids.append(timed_role_id)
+    outcomes = await asyncio.gather(*(future for _, future in changes), return_exceptions=True)
+    failed = 0
+    for (timed_role_id, _), outcome in zip(changes, outcomes):
+        if _role_change_failed(timed_role_id, outcome):
+            failed += 1 # Zostaje w bazie - ponowimy
+        else:
+            done_ids.append(timed_role_id)
+    if done_ids:
+        await async_database.remove_timed_roles(done_ids)
+    if failed:
+        raise RuntimeError(f"nie udało się zdjąć {failed} ról czasowych")
+
+@metrics.timed("expiry")
+async def _expire_punishments(now: int):
+    expired = await async_database.get_expired_active_punishments(now, shard=SHARD)
+    done_ids, failed, changes = [], 0, []
+    muted_roles = {} # guild_id -> rola wyciszenia (konfiguracja czytana raz na serwer w paczce)
+    for punishment in expired:
+        guild = bot.get_guild(punishment["guild_id"])
+        if guild:
+            try:
+                if punishment["type"] == "ban":
+                    await guild.unban(discord.Object(id=punishment["user_id"]), reason="Ban czasowy wygasł")
+                elif punishment["type"] == "mute":
+                    if guild.id not in muted_roles:
+                        config = await async_database.get_server_config(guild.id)
+                        muted_roles[guild.id] = guild.get_role(config.muted_role_id) if config and config.muted_role_id else None
+                    member = guild.get_member(punishment["user_id"])
+                    muted_role = muted_roles[guild.id]
+                    if member and muted_role and muted_role in member.roles:
+                        changes.append((punishment, role_action_queue.remove_role(member, muted_role, reason="Wyciszenie wygasło")))
+                        continue
+                await log_moderation_action(guild, punishment, "expired")
+            except (discord.NotFound, discord.Forbidden) as e:
+                print(f"[EXPIRY] Nie można zdjąć kary {punishment['id']} ({punishment['type']}) na {guild.name}: {e}")
+            except discord.HTTPException as e:
+                print(f"[EXPIRY] Błąd zdejmowania kary {punishment['id']}: {e}")
+                failed += 1
+                continue
+        done_ids.append(punishment["id"])
+    outcomes = await asyncio.gather(*(future for _, future in changes), return_exceptions=True)
+    for (punishment, _), outcome in zip(changes, outcomes):
+        if _role_change_failed(punishment["id"], outcome):
+            failed += 1
+            continue
+        if outcome is True:
+            await log_moderation_action(bot.get_guild(punishment["guild_id"]), punishment, "expired")
+        done_ids.append(punishment["id"])
+    if done_ids:
+        await async_database.deactivate_punishments(done_ids)
+    if failed:
+        raise RuntimeError(f"nie udało się zdjąć {failed} kar")
+
+@metrics.timed("expiry")
+async def _close_expired_polls(now: int):
+    for poll in await async_database.get_active_polls_to_close(now, shard=SHARD):
+        results_message_id = None
+        channel = bot.get_channel(poll["channel_id"])
+        if isinstance(channel, discord.TextChannel) and poll["message_id"]:
+            try:
+                message = await channel.fetch_message(poll["message_id"])
+                counts = {str(reaction.emoji): reaction.count - (1 if reaction.me else 0) for reaction in message.reactions}
+                options = await async_database.get_poll_options(poll["id"])
+                results = sorted(((counts.get(option["reaction_emoji"], 0), option) for option in options), key=lambda item: item[0], reverse=True)
+                embed = discord.Embed(title=f"📊 Wyniki ankiety: {poll['question']}", color=discord.Color.green())
+                embed.description = "\n".join(f"{option['reaction_emoji']} {option['option_text']} - **{votes}**" for votes, option in results) or "Brak opcji."
+                results_message = await channel.send(embed=embed, reference=message)
+                results_message_id = results_message.id
+            except (discord.NotFound, discord.Forbidden) as e:
+                print(f"[EXPIRY] Nie można ogłosić wyników ankiety {poll['id']}: {e}")
+        await async_database.close_poll(poll["id"], results_message_id)
+
+@metrics.timed("expiry")
+async def _end_expired_giveaways(now: int):
+    for giveaway in await async_database.get_active_giveaways_to_end(now, shard=SHARD):
+        await _handle_giveaway_end_logic(giveaway)
+
+expiry.register("timed_roles", _expire_timed_roles)
+expiry.register("punishments", _expire_punishments)
+expiry.register("polls", _close_expired_polls)
+expiry.register("giveaways", _end_expired_giveaways)
+
+async def _log_automod_action(message: discord.Message, verdict: automod.Verdict, server_config):
+    await log_moderation_action(message.guild, message.author, message.content, verdict.detail, message.channel, server_config.moderator_actions_log_channel_id)
+
+moderation = automod.default_pipeline(recent_messages, log_action=_log_automod_action)
+
 # --- Główny Event On Ready ---
+def format_startup_report() -> str:
+    """Czasy etapów zimnego startu: logowanie, baza danych, synchronizacja komend, gateway do pierwszego READY."""
+    parts = [f"logowanie {startup_timings.get('login', 0) * 1000:.0f} ms"]
+    if "init_db" in startup_timings:
+        parts.append(f"baza danych {startup_timings['init_db'] * 1000:.0f} ms")
+    if "command_sync" in startup_timings:
+        parts.append(f"komendy {startup_timings['command_sync'] * 1000:.0f} ms")
+    if "setup_hook" in startup_timings:
+        parts.append(f"gateway i cache serwerów {(startup_timings['ready'] - startup_timings['setup_hook']) * 1000:.0f} ms")
+    return f"[STARTUP] Gotowy po {startup_timings['ready']:.2f} s ({', '.join(parts)})."
+
+# READY przychodzi po każdym ponownym połączeniu z gatewayem - tu już tylko (idempotentne) uruchomienie zadań.
+# Inicjalizacja bazy i synchronizacja komend są w setup_hook.
+last_disconnect_at = None
+
 @bot.event
+@metrics.timed("event")
+async def on_disconnect():
+    global last_disconnect_at
+    if last_disconnect_at is None:
+        last_disconnect_at = time.perf_counter()
+
+@bot.event
+@metrics.timed("event")
+async def on_resumed():
+    global last_disconnect_at
+    last_disconnect_at = None # Sesja wznowiona bez ponownego READY
+
+@bot.event
+@metrics.timed("event")
 async def on_ready():
-    print(f'Zalogowano jako {bot.user}')
-    try:
-        database.init_db()
-        print("Baza danych zainicjalizowana.")
-        synced = await bot.tree.sync()
-        print(f"Zsynchronizowano {len(synced)} komend(y) globalnie.")
-    except Exception as e:
-        print(f"Wystąpił błąd podczas inicjalizacji lub synchronizacji komend: {e}")
+    global last_disconnect_at
+    if "ready" not in startup_timings:
+        startup_timings["ready"] = time.perf_counter() - STARTUP_CLOCK
+        print(f'Zalogowano jako {bot.user}')
+        print(format_startup_report())
+    else:
+        offline = f" po {time.perf_counter() - last_disconnect_at:.1f} s bez połączenia" if last_disconnect_at is not None else ""
+        print(f"[STARTUP] Ponowne READY{offline} - bez inicjalizacji bazy i synchronizacji komend.")
+    last_disconnect_at = None
 
     # Uruchamianie zadań w tle
     task_map = {
-        "check_expired_roles": check_expired_roles,
-        "check_expired_punishments_task": check_expired_punishments_task,
-        "check_expired_polls_task": check_expired_polls_task,
-        "check_ended_giveaways_task": check_ended_giveaways_task,
-        "scan_products_task": scan_products_task,
-        "daily_product_report_task": daily_product_report_task
+        "expiry": expiry,
+        "product_report_scheduler": product_report_scheduler,
     }
+    if PRIMARY_PROCESS:
+        task_map["scan_products_task"] = scan_products_task
+        task_map["price_history_retention_task"] = price_history_retention_task
+    if METRICS_DUMP_INTERVAL_SECONDS:
+        task_map["metrics_dump_task"] = metrics_dump_task
     for task_name_str, task_obj in task_map.items():
         if task_obj and hasattr(task_obj, 'start') and not task_obj.is_running():
             try:
@@ -78,6 +351,7 @@ async def on_ready():
 
 # --- Event `on_message` ---
 @bot.event
+@metrics.timed("event")
 async def on_message(message: discord.Message):
     if isinstance(message.channel, discord.DMChannel) and message.author.id in active_quizzes and not message.author.bot:
         user_id_quiz = message.author.id
@@ -91,181 +365,187 @@ async def on_message(message: discord.Message):
     if message.author.bot or not message.guild:
         return
 
-    message_deleted_by_moderation = False
-    server_config = database.get_server_config(message.guild.id)
+    server_config = await async_database.get_server_config(message.guild.id)
 
     if server_config:
-        # Logika Moderacji
-        if server_config.get("filter_profanity_enabled", True):
-            banned_words_list = database.get_banned_words(message.guild.id)
-            if banned_words_list:
-                for banned_word in banned_words_list:
-                    pattern = r"(?i)\b" + re.escape(banned_word) + r"\b"
-                    if re.search(pattern, message.content):
-                        try:
-                            await message.delete()
-                            # await log_moderation_action(message.guild, message.author, message.content, f"Wykryto zakazane słowo: '{banned_word}'", message.channel, server_config.get("moderation_log_channel_id"))
-                            message_deleted_by_moderation = True
-                            try: await message.author.send(f"Twoja wiadomość na **{message.guild.name}** została usunięta (niedozwolone słownictwo).")
-                            except: pass
-                        except Exception as e: print(f"Błąd auto-moderacji (profanity): {e}")
-                        break
-        if not message_deleted_by_moderation and server_config.get("filter_invites_enabled", True):
-            invite_pattern = r"(discord\.(gg|me|io|com\/invite)\/[a-zA-Z0-9]+)"
-            if re.search(invite_pattern, message.content, re.IGNORECASE):
-                try:
-                    await message.delete()
-                    # await log_moderation_action(message.guild, message.author, message.content, "Wykryto link zapraszający Discord.", message.channel, server_config.get("moderation_log_channel_id"))
-                    message_deleted_by_moderation = True
-                    try: await message.author.send(f"Twoja wiadomość na **{message.guild.name}** została usunięta (linki zapraszające).")
-                    except: pass
-                except Exception as e: print(f"Błąd auto-moderacji (invites): {e}")
-        if not message_deleted_by_moderation and server_config.get("filter_spam_enabled", True):
-            user_msgs = user_recent_messages[message.author.id]
-            user_msgs.append(message.content)
-            if len(user_msgs) == user_msgs.maxlen and len(set(user_msgs)) == 1:
-                try:
-                    await message.delete()
-                    # await log_moderation_action(message.guild, message.author, message.content, "Wykryto powtarzające się wiadomości (spam).", message.channel, server_config.get("moderation_log_channel_id"))
-                    message_deleted_by_moderation = True
-                    try: await message.author.send(f"Twoja wiadomość na **{message.guild.name}** została usunięta (spam).")
-                    except: pass
-                except Exception as e: print(f"Błąd auto-moderacji (spam-repeat): {e}")
-            if not message_deleted_by_moderation and (len(message.mentions) + len(message.role_mentions) > 5) :
-                try:
-                    await message.delete()
-                    # await log_moderation_action(message.guild, message.author, message.content, "Wykryto nadmierną liczbę wzmianek (spam).", message.channel, server_config.get("moderation_log_channel_id"))
-                    message_deleted_by_moderation = True
-                    try: await message.author.send(f"Twoja wiadomość na **{message.guild.name}** została usunięta (nadmierne wzmianki).")
-                    except: pass
-                except Exception as e: print(f"Błąd auto-moderacji (spam-mentions): {e}")
-
-    if message_deleted_by_moderation:
-        return
+        # Logika Moderacji - jeden potok reguł (automod.py), od najtańszej, z jednym przejściem regexa po treści
+        guild_patterns = {}
+        if server_config.filter_profanity_enabled:
+            guild_patterns["profanity"] = (await async_database.get_banned_word_matcher(message.guild.id)).pattern
+        with metrics.timer("on_message_stage", "automod"):
+            verdict = moderation.evaluate(message, server_config, guild_patterns)
+            if verdict and await moderation.enforce(message, verdict, server_config):
+                return
 
     if server_config:
-        prefix = server_config.get("custom_command_prefix", "!")
+        prefix = server_config.custom_command_prefix
         if message.content.startswith(prefix):
             command_full = message.content[len(prefix):]
             command_name = command_full.split(" ")[0].lower()
             if command_name:
-                custom_command_data = database.get_custom_command(message.guild.id, command_name)
-                if custom_command_data:
-                    response_type = custom_command_data["response_type"]
-                    response_content = custom_command_data["response_content"]
+                custom_command = (await async_database.get_custom_command_index(message.guild.id)).get(command_name)
+                if custom_command and custom_command.response_type == "embed" and custom_command.embed_data is None:
+                    print(f"Błąd (custom command): Niepoprawny JSON dla '{prefix}{command_name}'")
+                elif custom_command:
                     try:
-                        if response_type == "text":
-                            await message.channel.send(response_content)
-                        elif response_type == "embed":
-                            embed_data = json.loads(response_content)
-                            if 'timestamp' in embed_data: del embed_data['timestamp']
-                            embed_to_send = discord.Embed.from_dict(embed_data)
-                            await message.channel.send(embed=embed_to_send)
+                        if custom_command.response_type == "text":
+                            await message.channel.send(custom_command.response_content)
+                        elif custom_command.response_type == "embed":
+                            if custom_command.embed is None: # Budowany raz, potem wysyłany z indeksu
+                                custom_command.embed = discord.Embed.from_dict(custom_command.embed_data)
+                            await message.channel.send(embed=custom_command.embed)
                         print(f"Wykonano niestandardową komendę '{prefix}{command_name}' przez {message.author.name}")
                         return
-                    except json.JSONDecodeError:
-                        print(f"Błąd (custom command): Niepoprawny JSON dla '{prefix}{command_name}'")
                     except Exception as e_custom:
                         print(f"Błąd wykonania custom command '{prefix}{command_name}': {e_custom}")
 
     guild_id = message.guild.id
     user_id = message.author.id
-    current_time = time.time()
-    user_cooldown_key = (guild_id, user_id)
-    last_gain = last_xp_gain_timestamp.get(user_cooldown_key, 0)
-
-    if current_time - last_gain > leveling.XP_COOLDOWN_SECONDS:
+    xp_to_add = 0
+    if xp_cooldowns.try_acquire((guild_id, user_id)):
         xp_to_add = random.randint(leveling.XP_PER_MESSAGE_MIN, leveling.XP_PER_MESSAGE_MAX)
-        new_total_xp = database.add_xp(guild_id, user_id, xp_to_add)
-        last_xp_gain_timestamp[user_cooldown_key] = current_time
 
-        user_stats_xp = database.get_user_stats(guild_id, user_id)
-        current_level_db_xp = user_stats_xp['level']
-        calculated_level_xp = leveling.get_level_from_xp(new_total_xp)
+    # Liczba wiadomości i XP trafiają do bufora; zapis do bazy odbywa się zbiorczo w tle
+    with metrics.timer("on_message_stage", "xp"):
+        _, new_total_xp, previous_level, calculated_level_xp = await activity_buffer.record_message(guild_id, user_id, xp_to_add)
 
-        if calculated_level_xp > current_level_db_xp:
-            database.set_user_level(guild_id, user_id, calculated_level_xp)
-            try:
-                level_up_message_parts = [f"🎉 Gratulacje {message.author.mention}! Osiągnąłeś/aś **Poziom {calculated_level_xp}**!"]
-                level_rewards = database.get_rewards_for_level(guild_id, calculated_level_xp)
-                awarded_roles_mentions = []
-
-                if level_rewards:
-                    member_obj = message.author
-                    for reward in level_rewards:
-                        if reward.get("role_id_to_grant"):
-                            role_to_grant = message.guild.get_role(reward["role_id_to_grant"])
-                            if role_to_grant and role_to_grant not in member_obj.roles:
-                                if message.guild.me.top_role > role_to_grant and message.guild.me.guild_permissions.manage_roles:
-                                    try:
-                                        await member_obj.add_roles(role_to_grant, reason=f"Nagroda za osiągnięcie poziomu {calculated_level_xp}")
-                                        awarded_roles_mentions.append(role_to_grant.mention)
-                                        print(f"Przyznano rolę '{role_to_grant.name}' użytkownikowi {member_obj.name} za poziom {calculated_level_xp}.")
-                                    except Exception as e_role:
-                                        print(f"Błąd przyznawania roli-nagrody '{role_to_grant.name}' użytkownikowi {member_obj.name}: {e_role}")
-                                else:
-                                    print(f"Bot nie może przyznać roli-nagrody '{role_to_grant.name}' (problem z hierarchią lub uprawnieniami) użytkownikowi {member_obj.name}.")
-
-                        if reward.get("custom_message_on_level_up"):
-                            try:
-                                formatted_msg = reward["custom_message_on_level_up"].format(user=member_obj.mention, level=calculated_level_xp, guild_name=message.guild.name)
-                                level_up_message_parts.append(formatted_msg)
-                            except KeyError as e_format:
-                                print(f"Błąd formatowania wiadomości nagrody za poziom: Nieznany placeholder {e_format}. Wiadomość: {reward['custom_message_on_level_up']}")
-                                level_up_message_parts.append(reward["custom_message_on_level_up"])
-                            except Exception as e_msg_format:
-                                print(f"Inny błąd formatowania wiadomości nagrody: {e_msg_format}")
-                                level_up_message_parts.append(reward["custom_message_on_level_up"])
-
-                if awarded_roles_mentions:
-                    level_up_message_parts.append(f"Otrzymujesz nowe role: {', '.join(awarded_roles_mentions)}!")
-
-                final_level_up_message = "\n".join(level_up_message_parts)
-                await message.channel.send(final_level_up_message)
-                print(f"User {message.author.name} leveled up to {calculated_level_xp} on server {message.guild.name}. Nagrody przetworzone.")
-
-            except discord.Forbidden:
-                print(f"Nie udało się wysłać wiadomości o awansie/nagrodach na kanale {message.channel.name} (brak uprawnień).")
-            except Exception as e_lvl_up:
-                print(f"Błąd podczas przetwarzania awansu i nagród dla {message.author.name}: {e_lvl_up}")
+    if xp_to_add:
+        leaderboards.update(guild_id, user_id, new_total_xp, calculated_level_xp)
+        if calculated_level_xp > previous_level:
+            with metrics.timer("on_message_stage", "level_up"): # Nagrody, role (kolejka), wiadomość o awansie
+                try:
+                    level_up_message_parts = [f"🎉 Gratulacje {message.author.mention}! Osiągnąłeś/aś **Poziom {calculated_level_xp}**!"]
+                    level_rewards = await async_database.get_rewards_for_level(guild_id, calculated_level_xp)
+                    awarded_roles_mentions = []
+
+                    if level_rewards:
+                        member_obj = message.author
+                        role_grants = [] # Wszystkie role-nagrody trafiają do kolejki razem -> jedna edycja członka
+                        for reward in level_rewards:
+                            if reward.get("role_id_to_grant"):
+                                role_to_grant = message.guild.get_role(reward["role_id_to_grant"])
+                                if role_to_grant and role_to_grant not in member_obj.roles:
+                                    if message.guild.me.top_role > role_to_grant and message.guild.me.guild_permissions.manage_roles:
+                                        role_grants.append((role_to_grant, role_action_queue.add_role(member_obj, role_to_grant, reason=f"Nagroda za osiągnięcie poziomu {calculated_level_xp}")))
+                                    else:
+                                        print(f"Bot nie może przyznać roli-nagrody '{role_to_grant.name}' (problem z hierarchią lub uprawnieniami) użytkownikowi {member_obj.name}.")
+
+                            if reward.get("custom_message_on_level_up"):
+                                try:
+                                    formatted_msg = reward["custom_message_on_level_up"].format(user=member_obj.mention, level=calculated_level_xp, guild_name=message.guild.name)
+                                    level_up_message_parts.append(formatted_msg)
+                                except KeyError as e_format:
+                                    print(f"Błąd formatowania wiadomości nagrody za poziom: Nieznany placeholder {e_format}. Wiadomość: {reward['custom_message_on_level_up']}")
+                                    level_up_message_parts.append(reward["custom_message_on_level_up"])
+                                except Exception as e_msg_format:
+                                    print(f"Inny błąd formatowania wiadomości nagrody: {e_msg_format}")
+                                    level_up_message_parts.append(reward["custom_message_on_level_up"])
+
+                        for (role_to_grant, _), outcome in zip(role_grants, await asyncio.gather(*(future for _, future in role_grants), return_exceptions=True)):
+                            if isinstance(outcome, Exception):
+                                print(f"Błąd przyznawania roli-nagrody '{role_to_grant.name}' użytkownikowi {member_obj.name}: {outcome}")
+                            else:
+                                awarded_roles_mentions.append(role_to_grant.mention)
+                                print(f"Przyznano rolę '{role_to_grant.name}' użytkownikowi {member_obj.name} za poziom {calculated_level_xp}.")
+
+                    if awarded_roles_mentions:
+                        level_up_message_parts.append(f"Otrzymujesz nowe role: {', '.join(awarded_roles_mentions)}!")
+
+                    final_level_up_message = "\n".join(level_up_message_parts)
+                    await message.channel.send(final_level_up_message)
+                    print(f"User {message.author.name} leveled up to {calculated_level_xp} on server {message.guild.name}. Nagrody przetworzone.")
+
+                except discord.Forbidden:
+                    print(f"Nie udało się wysłać wiadomości o awansie/nagrodach na kanale {message.channel.name} (brak uprawnień).")
+                except Exception as e_lvl_up:
+                    print(f"Błąd podczas przetwarzania awansu i nagród dla {message.author.name}: {e_lvl_up}")
     # await bot.process_commands(message)
 
 # --- Komendy Slash ---
 
-# --- Moduł Product Watchlist: Komendy ---
-@bot.tree.command(name="watch_product", description="Dodaje produkt do listy śledzenia.")
-@app_commands.describe(url_produktu="Pełny link URL do strony produktu (obecnie tylko X-Kom).")
-async def watch_product_command(interaction: discord.Interaction, url_produktu: str):
-    if not interaction.guild_id:
+# --- Moduł XP: Komendy ---
+@bot.tree.command(name="rank", description="Wyświetla Twój poziom, XP i miejsce w rankingu serwera.")
+@app_commands.describe(uzytkownik="Użytkownik, którego ranking chcesz sprawdzić (domyślnie Ty).")
+async def rank_command(interaction: discord.Interaction, uzytkownik: discord.Member = None):
+    if not interaction.guild_id or not interaction.guild:
+        await interaction.response.send_message("Ta komenda musi być użyta na serwerze.", ephemeral=True)
+        return
+
+    target = uzytkownik or interaction.user
+    guild_ranking = await leaderboards.get(interaction.guild_id)
+    rank_info = guild_ranking.rank(target.id)
+    if not rank_info:
+        await interaction.response.send_message(f"{target.display_name} nie ma jeszcze XP na tym serwerze.", ephemeral=True)
+        return
+
+    position, total_ranked = rank_info
+    xp, level = guild_ranking.stats(target.id)
+    xp_needed, next_gate = leveling.xp_to_next_level(xp, level)
+
+    embed = discord.Embed(title=f"Ranking: {target.display_name}", color=discord.Color.gold())
+    embed.add_field(name="Miejsce", value=f"#{position} / {total_ranked}", inline=True)
+    embed.add_field(name="Poziom", value=str(level), inline=True)
+    embed.add_field(name="XP", value=f"{xp} (do poziomu {level + 1}: {xp_needed})", inline=False)
+    await interaction.response.send_message(embed=embed)
+
+LEADERBOARD_PAGE_SIZE = 10
+
+@bot.tree.command(name="leaderboard", description="Wyświetla ranking XP serwera.")
+@app_commands.describe(strona="Numer strony rankingu (domyślnie 1).")
+async def leaderboard_command(interaction: discord.Interaction, strona: app_commands.Range[int, 1, None] = 1):
+    if not interaction.guild_id or not interaction.guild:
         await interaction.response.send_message("Ta komenda musi być użyta na serwerze.", ephemeral=True)
         return
 
-    shop_name = None
-    if "x-kom.pl" in url_produktu.lower():
-        shop_name = "xkom"
-    # TODO: Rozbudować o inne sklepy
+    # Ranking z pamięci: pierwsze strony idą z gotowego top-100, bez zapytań do bazy
+    guild_ranking = await leaderboards.get(interaction.guild_id)
+    offset = (strona - 1) * LEADERBOARD_PAGE_SIZE
+    entries = guild_ranking.page(LEADERBOARD_PAGE_SIZE, offset)
+    if not entries:
+        await interaction.response.send_message("Brak wpisów na tej stronie rankingu.", ephemeral=True)
+        return
+
+    total_pages = (len(guild_ranking) + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+    description = ""
+    for position, entry in enumerate(entries, start=offset + 1):
+        member = interaction.guild.get_member(entry["user_id"])
+        name = member.display_name if member else f"Użytkownik {entry['user_id']}"
+        description += f"**#{position}** {name} - Poziom {entry['level']} ({entry['xp']} XP)\n"
+
+    embed = discord.Embed(title=f"Ranking XP - {interaction.guild.name}", description=description, color=discord.Color.gold())
+    embed.set_footer(text=f"Strona {strona}/{total_pages}")
+    await interaction.response.send_message(embed=embed)
 
-    if not shop_name:
-        await interaction.response.send_message("Nie rozpoznano wspieranego sklepu dla podanego URL. Obecnie tylko X-Kom.", ephemeral=True)
+# --- Moduł Product Watchlist: Komendy ---
+@bot.tree.command(name="watch_product", description="Dodaje produkt do listy śledzenia.")
+@app_commands.describe(url_produktu="Pełny link URL do strony produktu z obsługiwanego sklepu (np. X-Kom).",
+                       cena_docelowa="Opcjonalnie: wyślę Ci DM, gdy cena spadnie do tej kwoty (w zł) lub niżej.")
+async def watch_product_command(interaction: discord.Interaction, url_produktu: str, cena_docelowa: app_commands.Range[float, 0.01, None] = None):
+    if not interaction.guild_id:
+        await interaction.response.send_message("Ta komenda musi być użyta na serwerze.", ephemeral=True)
         return
 
-    existing_product = database.get_watched_product_by_url(url_produktu)
-    if existing_product and existing_product["is_active"]:
-        await interaction.response.send_message(f"Ten produkt ({url_produktu}) jest już aktywnie śledzony.", ephemeral=True)
+    shop = shop_registry.match_url(url_produktu)
+    if not shop:
+        await interaction.response.send_message(f"Nie rozpoznano wspieranego sklepu dla podanego URL. Obsługiwane sklepy: {shop_registry.supported_shops_display()}.", ephemeral=True)
         return
 
-    product_id = database.add_watched_product(
+    # Ten sam produkt (niezależnie od wariantu linku) jest skanowany raz - kolejne osoby tylko się na niego zapisują
+    canonical_url = shop.canonical_url(url_produktu)
+    target_price_cents = int(round(cena_docelowa * 100)) if cena_docelowa is not None else None
+    product_id, subscription_id = await async_database.subscribe_to_product(
+        guild_id=interaction.guild_id,
         user_id=interaction.user.id,
-        url=url_produktu,
-        shop_name=shop_name,
-        guild_id=interaction.guild_id
+        url=canonical_url,
+        shop_name=shop.name,
+        target_price_cents=target_price_cents
     )
 
-    if product_id:
-        await interaction.response.send_message(f"Produkt został dodany do listy śledzenia (ID: {product_id}). Pierwsze dane pojawią się po kolejnym skanowaniu.", ephemeral=True)
-        # Można by tu uruchomić jednorazowe skanowanie dla tego produktu
+    if subscription_id: # subscribe_to_product ustawił w bazie termin skanu "teraz" - harmonogram dociągnie go przy tyknięciu
+        target_info = f" Powiadomię Cię, gdy cena spadnie do {target_price_cents / 100:.2f} zł." if target_price_cents is not None else ""
+        await interaction.response.send_message(f"Produkt został dodany do Twojej listy śledzenia (ID: {product_id}).{target_info} Pierwsze dane pojawią się po kolejnym skanowaniu.", ephemeral=True)
     else:
-        await interaction.response.send_message("Nie udało się dodać produktu. Możliwe, że URL jest już śledzony lub wystąpił błąd.", ephemeral=True)
+        await interaction.response.send_message(f"Ten produkt (ID: {product_id}) jest już na Twojej liście śledzenia.", ephemeral=True)
 
 @bot.tree.command(name="unwatch_product", description="Przestaje śledzić produkt.")
 @app_commands.describe(id_produktu="ID produktu z Twojej listy (sprawdź komendą /my_watchlist).")
@@ -274,9 +554,9 @@ async def unwatch_product_command(interaction: discord.Interaction, id_produktu:
         await interaction.response.send_message("Ta komenda musi być użyta na serwerze.", ephemeral=True)
         return
 
-    # TODO: Weryfikacja, czy użytkownik jest właścicielem produktu (user_id_who_added) lub adminem
-    if database.deactivate_watched_product(id_produktu): # Na razie deaktywuje, nie usuwa całkiem
-        await interaction.response.send_message(f"Produkt o ID {id_produktu} został usunięty z aktywnego śledzenia.", ephemeral=True)
+    # Usuwa tylko subskrypcję tego użytkownika; produkt jest dalej skanowany, jeśli śledzi go ktoś inny
+    if await async_database.unsubscribe_from_product(interaction.guild_id, interaction.user.id, id_produktu):
+        await interaction.response.send_message(f"Produkt o ID {id_produktu} został usunięty z Twojej listy śledzenia.", ephemeral=True)
     else:
         await interaction.response.send_message(f"Nie znaleziono produktu o ID {id_produktu} na Twojej liście lub już jest nieaktywny.", ephemeral=True)
 
@@ -286,7 +566,7 @@ async def my_watchlist_command(interaction: discord.Interaction):
         await interaction.response.send_message("Ta komenda musi być użyta tylko na serwerze.", ephemeral=True)
         return
 
-    user_products = database.get_user_watched_products(user_id=interaction.user.id, guild_id=interaction.guild_id)
+    user_products = await async_database.get_user_watched_products(user_id=interaction.user.id, guild_id=interaction.guild_id)
 
     if not user_products:
         await interaction.response.send_message("Nie śledzisz obecnie żadnych produktów na tym serwerze.", ephemeral=True)
@@ -299,9 +579,11 @@ async def my_watchlist_command(interaction: discord.Interaction):
         price_cents = product.get('last_known_price_cents')
         price_display = f"{price_cents / 100:.2f} zł" if price_cents is not None else "Brak danych"
         availability = product.get('last_known_availability_str') or "Brak danych"
+        target_cents = product.get('target_price_cents')
+        target_display = f" | Próg: {target_cents / 100:.2f} zł" if target_cents is not None else ""
 
         description += (f"**ID: {product['id']} | [{name}]({product['product_url']})**\n"
-                        f"Sklep: {product['shop_name'].upper()} | Cena: {price_display} | Dostępność: {availability}\n\n")
+                        f"Sklep: {product['shop_name'].upper()} | Cena: {price_display} | Dostępność: {availability}{target_display}\n\n")
 
     if len(description) > 4000: description = description[:3990] + "\n... (lista zbyt długa)"
     embed.description = description if description else "Brak produktów na liście."
@@ -316,7 +598,8 @@ async def set_product_report_channel_command(interaction: discord.Interaction, k
         await interaction.response.send_message("Ta komenda może być użyta tylko na serwerze.", ephemeral=True)
         return
     try:
-        database.update_server_config(guild_id=interaction.guild_id, product_report_channel_id=kanal.id)
+        await async_database.update_server_config(guild_id=interaction.guild_id, product_report_channel_id=kanal.id)
+        await _schedule_product_report(interaction.guild_id, time_changed=False)
         await interaction.response.send_message(f"Kanał dla codziennych raportów produktowych został ustawiony na {kanal.mention}.", ephemeral=True)
     except Exception as e:
         await interaction.response.send_message(f"Wystąpił błąd: {e}", ephemeral=True)
@@ -343,7 +626,8 @@ async def set_product_report_time_command(interaction: discord.Interaction, godz
         return
 
     try:
-        database.update_server_config(guild_id=interaction.guild_id, product_report_time_utc=godzina_utc)
+        await async_database.update_server_config(guild_id=interaction.guild_id, product_report_time_utc=godzina_utc)
+        await _schedule_product_report(interaction.guild_id, time_changed=True)
         await interaction.response.send_message(f"Godzina codziennych raportów produktowych została ustawiona na {godzina_utc} UTC.", ephemeral=True)
     except Exception as e:
         await interaction.response.send_message(f"Wystąpił błąd: {e}", ephemeral=True)
@@ -363,19 +647,19 @@ async def product_report_settings_command(interaction: discord.Interaction):
         await interaction.response.send_message("Ta komenda może być użyta tylko na serwerze.", ephemeral=True)
         return
 
-    config = database.get_server_config(interaction.guild_id)
-    if not config: # Powinno być obsłużone przez get_server_config, które zwraca None lub dict z defaultami
+    config = await async_database.get_server_config(interaction.guild_id)
+    if not config: # get_server_config zwraca None albo ServerConfig z uzupełnionymi wartościami domyślnymi
         # Jeśli get_server_config zwróci None, to znaczy, że nie ma wpisu dla guild_id, co jest dziwne
         # bo update_server_config powinno go stworzyć. Dla bezpieczeństwa:
-        database.update_server_config(interaction.guild_id) # Spróbuj stworzyć domyślny wpis
-        config = database.get_server_config(interaction.guild_id)
+        await async_database.update_server_config(interaction.guild_id) # Spróbuj stworzyć domyślny wpis
+        config = await async_database.get_server_config(interaction.guild_id)
         if not config: # Jeśli nadal nie ma (błąd krytyczny bazy?)
              await interaction.response.send_message("Błąd odczytu konfiguracji serwera.", ephemeral=True)
              return
 
 
-    channel_id = config.get("product_report_channel_id")
-    report_time = config.get("product_report_time_utc")
+    channel_id = config.product_report_channel_id
+    report_time = config.product_report_time_utc
 
     channel_mention = "Nie ustawiono"
     if channel_id:
@@ -392,148 +676,364 @@ async def product_report_settings_command(interaction: discord.Interaction):
 
 @product_report_settings_command.error
 async def product_report_settings_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
-     if isinstance(error, app_commands.MissingPermissions):
+    if isinstance(error, app_commands.MissingPermissions):
         await interaction.response.send_message("Nie masz uprawnień administratora.", ephemeral=True)
     else:
         if not interaction.response.is_done(): await interaction.response.send_message(f"Błąd: {error}", ephemeral=True)
         else: await interaction.followup.send(f"Błąd: {error}", ephemeral=True)
 
 # --- Zadania w Tle ---
-@tasks.loop(hours=4)
-async def scan_products_task():
-    await bot.wait_until_ready()
-    print("[PRODUCT_SCAN_TASK] Rozpoczynam skanowanie produktów...")
-    active_products = database.get_all_active_watched_products()
-    if not active_products:
-        print("[PRODUCT_SCAN_TASK] Brak aktywnych produktów do skanowania.")
+async def _scan_product(shop: shop_registry.ShopAdapter, product: dict) -> dict:
+    """Skanuje jeden produkt i zwraca wynik w formacie database.record_product_scan_results (plus "status" i "bytes")."""
+    outcome = {"status": "failed", "data": None, "bytes": 0}
+    try:
+        outcome = await shop.scrape(product_fetcher, product['product_url'], parse_executor, validators=product)
+    except Exception as e:
+        print(f"[PRODUCT_SCAN_TASK] Błąd skanowania ID {product['id']} ({product['product_url']}): {e}")
+
+    result = {"product_id": product['id'], "scanned_at": int(time.time()), "status": outcome["status"], "bytes": outcome["bytes"],
+              "previous_price_cents": product['last_known_price_cents'],
+              "previous_availability_str": product['last_known_availability_str']}
+    for key in ("etag", "last_modified", "content_hash"):
+        if key in outcome:
+            result[key] = outcome[key]
+
+    if outcome["status"] in ("not_modified", "unchanged"):
+        # Strona się nie zmieniła od ostatniego udanego skanu - przepisujemy ostatnie znane dane
+        result.update(ok=True, name=None, price_cents=product['last_known_price_cents'],
+                      availability_str=product['last_known_availability_str'])
+    elif outcome["data"]:
+        scraped_data = outcome["data"]
+        result.update(ok=True, name=scraped_data.get("name"),
+                      price_cents=scraped_data.get("price_in_cents"), # Cena w groszach
+                      availability_str=scraped_data.get("availability_str"))
+    else:
+        result.update(ok=False, name=None, price_cents=None, availability_str=None)
+    return result
+
+async def _notify_price_targets(products: list[dict], results: list[dict]):
+    """
+    Rozsyła wyniki skanu do subskrybentów: DM, gdy cena przekroczyła w dół ich próg (target_price_cents).
+    Produkt był pobrany raz, niezależnie od liczby subskrybentów - tutaj wynik trafia do każdego z nich.
+    """
+    changed = {result["product_id"]: result for result in results
+               if result["ok"] and result["price_cents"] is not None and result["price_cents"] != result["previous_price_cents"]}
+    if not changed:
         return
-
-    for product in active_products:
-        print(f"[PRODUCT_SCAN_TASK] Skanuję: {product['product_url']} (ID: {product['id']})")
-        scraped_data = None
-        if product['shop_name'] == 'xkom':
-            await asyncio.sleep(random.randint(5, 15))
-            scraped_data = xkom_scraper.scrape_xkom_product(product['product_url'])
-
-        current_scan_time = int(time.time())
-        if scraped_data:
-            name = scraped_data.get("name")
-            price_cents = scraped_data.get("price_in_cents") # Używamy nowej nazwy klucza
-            availability_str = scraped_data.get("availability_str")
-
-            database.update_watched_product_data(
-                product_id=product['id'],
-                name=name if name else product.get('product_name'),
-                price_cents=price_cents, # Przekazujemy cenę w groszach
-                availability_str=availability_str,
-                scanned_at=current_scan_time
-            )
-            database.add_price_history_entry(
-                watched_product_id=product['id'],
-                scan_date=current_scan_time,
-                price_cents=price_cents, # Zapisujemy cenę w groszach
-                availability_str=availability_str
-            )
+    products_by_id = {product['id']: product for product in products}
+    subscribers = await async_database.get_product_subscribers(list(changed))
+
+    alerts_by_user = collections.defaultdict(dict) # user_id -> {product_id: result}; jeden DM na użytkownika
+    for product_id, product_subscribers in subscribers.items():
+        result = changed[product_id]
+        previous = result["previous_price_cents"]
+        for subscriber in product_subscribers:
+            target = subscriber["target_price_cents"]
+            if target is not None and result["price_cents"] <= target and (previous is None or previous > target):
+                alerts_by_user[subscriber["user_id"]][product_id] = result
+
+    for user_id, user_alerts in alerts_by_user.items():
+        embed = discord.Embed(title="🔔 Cena spadła poniżej Twojego progu", color=discord.Color.green())
+        for product_id, result in list(user_alerts.items())[:25]: # Limit pól embeda
+            product = products_by_id[product_id]
+            name = result["name"] or product.get('product_name') or product['product_url']
+            embed.add_field(name=name[:256], value=f"[{result['price_cents'] / 100:.2f} zł]({product['product_url']})", inline=False)
+        try:
+            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+            await user.send(embed=embed)
+        except (discord.Forbidden, discord.NotFound):
+            pass # Zamknięte DM albo konto usunięte
+        except discord.HTTPException as e:
+            print(f"[PRODUCT_SCAN_TASK] Nie udało się wysłać powiadomienia do {user_id}: {e}")
+
+async def _scan_shop(shop: shop_registry.ShopAdapter, products: list[dict]):
+    """Skanuje produkty jednego sklepu (w jego limitach) i od razu zapisuje wyniki - bez czekania na inne sklepy."""
+    started_at = time.monotonic()
+    results = await asyncio.gather(*(_scan_product(shop, product) for product in products))
+    for result in results:
+        changed = result["status"] == "parsed" and (result["price_cents"] != result["previous_price_cents"]
+                                                    or result["availability_str"] != result["previous_availability_str"])
+        scan_scheduler.reschedule(result, changed)
+    await async_database.record_product_scan_results(results)
+    await _notify_price_targets(products, results)
+
+    failed = 0
+    status_counts = collections.Counter(result["status"] for result in results)
+    for result in results:
+        if result["status"] in ("not_modified", "unchanged"):
+            continue
+        if result["ok"]:
+            price_cents = result["price_cents"]
             price_display = f"{price_cents / 100:.2f} zł" if price_cents is not None else "N/A"
-            print(f"[PRODUCT_SCAN_TASK] Zaktualizowano ID {product['id']}: Cena: {price_display}, Dostępność: {availability_str}")
+            print(f"[PRODUCT_SCAN_TASK] Zaktualizowano ID {result['product_id']}: Cena: {price_display}, Dostępność: {result['availability_str']}")
         else:
-            print(f"[PRODUCT_SCAN_TASK] Nie udało się zeskanować ID {product['id']}. Zapisuję czas skanowania.")
-            database.update_watched_product_data(product_id=product['id'], name=None, price_cents=None, availability_str=None, scanned_at=current_scan_time)
-            database.add_price_history_entry(product_id=product['id'], scan_date=current_scan_time, price_cents=None, availability_str="Błąd skanowania")
-    print("[PRODUCT_SCAN_TASK] Zakończono skanowanie produktów.")
+            failed += 1
+            print(f"[PRODUCT_SCAN_TASK] Nie udało się zeskanować ID {result['product_id']}. Zapisuję czas skanowania.")
+    skipped = status_counts["not_modified"] + status_counts["unchanged"]
+    downloaded_kb = sum(result["bytes"] for result in results) / 1024
+    print(f"[PRODUCT_SCAN_TASK] {shop.display_name}: zeskanowano {len(results)} produktów ({failed} błędów) w {time.monotonic() - started_at:.1f}s. "
+          f"Pominięto parsowanie {skipped} stron (304: {status_counts['not_modified']}, bez zmian: {status_counts['unchanged']}), "
+          f"pobrano {downloaded_kb:.0f} KB.")
+
+async def _run_shop_scan(shop: shop_registry.ShopAdapter, products: list[dict]):
+    try:
+        await _scan_shop(shop, products)
+    except Exception as e:
+        print(f"[PRODUCT_SCAN_TASK] Błąd skanowania sklepu {shop.display_name}: {e}")
+        for product in products:
+            scan_scheduler.release(product['id'])
 
-@tasks.loop(minutes=15)
-async def daily_product_report_task():
+@tasks.loop(seconds=30)
+@metrics.timed("task")
+async def scan_products_task():
     await bot.wait_until_ready()
-    now_utc = datetime.utcnow()
-    guild_configs = database.get_all_guilds_with_product_report_config()
-
-    for config in guild_configs:
-        guild_id = config["guild_id"]
-        report_channel_id = config.get("report_channel_id") # Użyj .get() dla bezpieczeństwa
-        report_time_str = config.get("report_time_utc")
+    if not scan_scheduler.hydrated:
+        active_products = await async_database.get_all_active_watched_products()
+        scan_scheduler.hydrate(active_products)
+        print(f"[PRODUCT_SCAN_TASK] Harmonogram wczytany: {len(active_products)} produktów.")
+    else:
+        # Nowe subskrypcje (także z innych procesów bota) zapisują termin w bazie
+        since, until = scan_scheduler.sync_window()
+        scan_scheduler.merge(await async_database.get_watched_products_due_between(since, until), now=until)
 
-        if not report_channel_id or not report_time_str:
+    due_ids = scan_scheduler.take_due()
+    if not due_ids:
+        return
+    products = await async_database.get_watched_products_by_ids(due_ids)
+    for inactive_id in set(due_ids) - {product['id'] for product in products}:
+        scan_scheduler.remove(inactive_id) # Nikt już nie śledzi - wypada z harmonogramu
+
+    products_by_shop = collections.defaultdict(list)
+    for product in products:
+        shop = shop_registry.get_shop(product['shop_name'])
+        if shop is None:
+            print(f"[PRODUCT_SCAN_TASK] Nieobsługiwany sklep '{product['shop_name']}' dla ID {product['id']} - pomijam.")
+            scan_scheduler.remove(product['id'])
             continue
+        products_by_shop[shop].append(product)
+
+    # Sklepy skanowane równolegle w tle, każdy w swoich limitach - wolny sklep nie wstrzymuje kolejnych tyknięć
+    for shop, shop_products in products_by_shop.items():
+        task = asyncio.create_task(_run_shop_scan(shop, shop_products))
+        running_shop_scans.add(task)
+        task.add_done_callback(running_shop_scans.discard)
+
+def _format_duration(seconds: int | None) -> str:
+    if seconds is None:
+        return "brak"
+    if seconds < 3600:
+        return f"{seconds // 60} min"
+    return f"{seconds / 3600:.1f} h"
+
+@bot.tree.command(name="product_scan_stats", description="Pokazuje, jak świeże są dane śledzonych produktów.")
+@app_commands.checks.has_permissions(administrator=True)
+async def product_scan_stats_command(interaction: discord.Interaction):
+    if not interaction.guild_id:
+        await interaction.response.send_message("Ta komenda może być użyta tylko na serwerze.", ephemeral=True)
+        return
 
-        today_date_str = now_utc.strftime("%Y-%m-%d")
-        if last_report_sent_date.get(guild_id) == today_date_str:
+    # Z bazy, a nie z harmonogramu w pamięci - ten działa tylko w procesie z shardem 0
+    freshness = product_scheduler.freshness(await async_database.get_all_active_watched_products(), scan_scheduler.requests_per_hour)
+    summary = freshness["summary"]
+    embed = discord.Embed(title="Świeżość danych produktów", color=discord.Color.blue())
+    embed.add_field(name="Wszystkie produkty bota", inline=False, value=(
+        f"Produktów: {summary['products']} (nigdy nie skanowanych: {summary['never_scanned']}, z błędami: {summary['failing']})\n"
+        f"Wiek danych - mediana: {_format_duration(summary['age_p50_seconds'])}, p95: {_format_duration(summary['age_p95_seconds'])}\n"
+        f"Spóźnione względem harmonogramu: {summary['overdue']}\n"
+        f"Zapotrzebowanie: {summary['demand_per_hour']} żądań/h przy budżecie {summary['budget_per_hour']} żądań/h"))
+
+    guild_products = await async_database.get_guild_watched_products(interaction.guild_id)
+    lines = []
+    for product in guild_products:
+        stats = freshness["products"].get(product['id'])
+        if stats is None:
             continue
+        name = (product.get('product_name') or product['product_url'])[:60]
+        lines.append((stats["age_seconds"] or 0,
+                      f"**{product['id']}** {name} - wiek: {_format_duration(stats['age_seconds'])}, "
+                      f"interwał: {_format_duration(stats['interval_seconds'])}"
+                      + (f", błędy: {stats['failures']}" if stats['failures'] else "")))
+    lines.sort(reverse=True) # Najstarsze dane na górze
+    description = "\n".join(line for _, line in lines[:15])
+    embed.add_field(name="Produkty tego serwera (najstarsze dane)", value=description[:1024] or "Brak śledzonych produktów.", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
-        try:
-            report_hour, report_minute = map(int, report_time_str.split(':'))
-            if now_utc.hour == report_hour and now_utc.minute >= report_minute and now_utc.minute < report_minute + 15: # 15-minutowe okno
-                guild = bot.get_guild(guild_id)
-                if not guild: continue
-                report_channel = guild.get_channel(report_channel_id)
-                if not report_channel or not isinstance(report_channel, discord.TextChannel):
-                    print(f"[REPORT_TASK] Nie znaleziono kanału raportów (ID: {report_channel_id}) na {guild.name}")
-                    continue
-                print(f"[REPORT_TASK] Generowanie raportu dla {guild.name} (ID: {guild_id})")
-
-                product_changes = database.get_product_changes_for_report(guild_id, hours_ago=24)
-                top_drops = database.get_top_price_drops(guild_id, hours_ago=24, limit=5)
-
-                embed = discord.Embed(title=f"📊 Dzienny Raport Produktowy - {now_utc.strftime('%Y-%m-%d')}", color=discord.Color.blue(), timestamp=now_utc)
-                embed.set_footer(text=f"Serwer: {guild.name}")
-                changes_desc = ""
-                if product_changes:
-                    for change in product_changes[:10]:
-                        name = change.get('product_name', 'Produkt')
-                        url = change.get('product_url', '#')
-                        old_p_cents = change.get('old_price_cents')
-                        new_p_cents = change.get('new_price_cents')
-                        old_a = change.get('old_availability_str', 'N/A')
-                        new_a = change.get('new_availability_str', 'N/A')
-
-                        old_p_display = f"{old_p_cents / 100:.2f} zł" if old_p_cents is not None else "N/A"
-                        new_p_display = f"{new_p_cents / 100:.2f} zł" if new_p_cents is not None else "N/A"
-
-                        price_changed = old_p_cents != new_p_cents and old_p_cents is not None and new_p_cents is not None
-                        avail_changed = old_a != new_a and old_a is not None and new_a is not None
-
-                        if price_changed or avail_changed:
-                            changes_desc += f"[{name}]({url})\n"
-                            if price_changed: changes_desc += f"  Cena: `{old_p_display}` -> `{new_p_display}`\n"
-                            if avail_changed: changes_desc += f"  Dostępność: `{old_a}` -> `{new_a}`\n"
-                            changes_desc += "\n"
-                else: changes_desc = "Brak znaczących zmian cen/dostępności w ciągu ostatnich 24h."
-                if len(changes_desc) > 1020: changes_desc = changes_desc[:1017] + "..."
-                embed.add_field(name="🔍 Zmiany Cen i Dostępności (24h)", value=changes_desc if changes_desc else "Brak zmian.", inline=False)
-
-                drops_desc = ""
-                if top_drops:
-                    for i, drop in enumerate(top_drops):
-                        name = drop.get('product_name', 'Produkt')
-                        url = drop.get('product_url', '#')
-                        old_p_cents = drop.get('old_price_cents')
-                        new_p_cents = drop.get('new_price_cents')
-                        percent = drop.get('drop_percentage', 0)
-                        old_p_display = f"{old_p_cents / 100:.2f} zł" if old_p_cents is not None else "N/A"
-                        new_p_display = f"{new_p_cents / 100:.2f} zł" if new_p_cents is not None else "N/A"
-                        drops_desc += f"{i+1}. [{name}]({url})\n   `{old_p_display}` -> `{new_p_display}` (**-{percent:.1f}%**)\n"
-                else: drops_desc = "Brak znaczących spadków cen w ciągu ostatnich 24h."
-                if len(drops_desc) > 1020: drops_desc = drops_desc[:1017] + "..."
-                embed.add_field(name="📉 Największe Spadki Cen (24h)", value=drops_desc, inline=False)
-                embed.add_field(name="📈 Trendy Ogólne", value="Analiza trendów wkrótce!", inline=False)
+@product_scan_stats_command.error
+async def product_scan_stats_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("Nie masz uprawnień administratora.", ephemeral=True)
+    else:
+        if not interaction.response.is_done(): await interaction.response.send_message(f"Błąd: {error}", ephemeral=True)
+        else: await interaction.followup.send(f"Błąd: {error}", ephemeral=True)
 
-                try:
-                    await report_channel.send(embed=embed)
-                    last_report_sent_date[guild_id] = today_date_str
-                    print(f"[REPORT_TASK] Wyslano raport dla serwera {guild.name}")
-                except discord.Forbidden: print(f"[REPORT_TASK] Brak uprawnień do wysłania raportu na {report_channel.name} ({guild.name})")
-                except Exception as e_send: print(f"[REPORT_TASK] Błąd wysyłania raportu dla {guild.name}: {e_send}")
-        except ValueError:
-            print(f"[REPORT_TASK] Nieprawidłowy format czasu raportu dla serwera ID {guild_id}: '{report_time_str}'")
-        except Exception as e_outer:
-            print(f"[REPORT_TASK] Ogólny błąd przetwarzania raportu dla serwera ID {guild_id}: {e_outer}")
+def _format_bytes(size: int) -> str:
+    return f"{size / 1024:.0f} KB" if size < 1024 * 1024 else f"{size / 1024 / 1024:.1f} MB"
+
+@bot.tree.command(name="bot_memory_stats", description="Pokazuje rozmiar stanu trzymanego przez bota w pamięci.")
+@app_commands.checks.has_permissions(administrator=True)
+async def bot_memory_stats_command(interaction: discord.Interaction):
+    embed = discord.Embed(title="Pamięć bota", color=discord.Color.blue())
+    for name, store in (("Cooldown XP", xp_cooldowns), ("Wykrywanie powtórzeń (spam)", recent_messages)):
+        stats = store.memory_stats()
+        embed.add_field(name=name, inline=False,
+                        value=f"Wpisów: {stats['entries']}, usuniętych (wygasłe/limit): {stats['evicted']}, ok. {_format_bytes(stats['approx_bytes'])}")
+    embed.add_field(name="Cache", inline=False, value=(
+        f"Sumy XP w buforze: {activity_buffer.cached_count} (do zapisu: {activity_buffer.pending_count})\n"
+        f"Konfiguracje serwerów: {len(database.server_config_cache)}, matchery zakazanych słów: {len(database.banned_word_matcher_cache)}, "
+        f"indeksy komend: {len(database.custom_command_index_cache)}"))
+    if resource is not None:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # Linux: KB
+        embed.add_field(name="Proces", value=f"Szczytowe RSS: {_format_bytes(peak_kb * 1024)}", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot_memory_stats_command.error
+async def bot_memory_stats_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("Nie masz uprawnień administratora.", ephemeral=True)
+    else:
+        if not interaction.response.is_done(): await interaction.response.send_message(f"Błąd: {error}", ephemeral=True)
+        else: await interaction.followup.send(f"Błąd: {error}", ephemeral=True)
+
+@bot.tree.command(name="automod_stats", description="Pokazuje trafienia i czasy reguł auto-moderacji.")
+@app_commands.checks.has_permissions(administrator=True)
+async def automod_stats_command(interaction: discord.Interaction):
+    embed = discord.Embed(title="Auto-moderacja", description=f"Sprawdzonych wiadomości: {moderation.evaluated}", color=discord.Color.blue())
+    for row in moderation.stats():
+        embed.add_field(name=row["rule"], inline=False, value=(
+            f"Trafień: {row['hits']} | pomiarów: {row['count']} | p50: {row['p50'] * 1e6:.0f} µs, "
+            f"p99: {row['p99'] * 1e6:.0f} µs, max: {row['max'] * 1e6:.0f} µs"))
+    embed.set_footer(text="Reguły-wzorce dzielą jedno przejście po treści wiadomości - czasy są wspólne.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@automod_stats_command.error
+async def automod_stats_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("Nie masz uprawnień administratora.", ephemeral=True)
+    else:
+        if not interaction.response.is_done(): await interaction.response.send_message(f"Błąd: {error}", ephemeral=True)
+        else: await interaction.followup.send(f"Błąd: {error}", ephemeral=True)
+
+@tasks.loop(hours=24)
+@metrics.timed("task")
+async def price_history_retention_task():
+    await bot.wait_until_ready()
+    points, hours = await async_database.downsample_price_history()
+    if points or hours:
+        print(f"[PRICE_HISTORY] Zagregowano {points} starych punktów zmiany ceny do godzin i {hours} godzin do dni.")
+
+@tasks.loop(seconds=METRICS_DUMP_INTERVAL_SECONDS or 3600)
+@metrics.timed("task")
+async def metrics_dump_task():
+    report = metrics.REGISTRY.format_top()
+    if report:
+        print(f"[METRICS] Najwięcej czasu od startu:\n{report}")
+
+REPORT_EMBED_TITLE = "📊 Dzienny Raport Produktowy"
+
+async def _report_already_sent(channel: discord.TextChannel, scheduled_for: int) -> bool:
+    """Czy raport za ten termin jest już na kanale (bot padł między wysłaniem a zapisem w bazie)."""
+    after = datetime.fromtimestamp(scheduled_for, tz=timezone.utc) - timedelta(minutes=1)
+    async for message in channel.history(limit=50, after=after):
+        if message.author.id == bot.user.id and any((embed.title or "").startswith(REPORT_EMBED_TITLE) for embed in message.embeds):
+            return True
+    return False
+
+@metrics.timed("task")
+async def send_product_report(guild_id: int, scheduled_for: int, possibly_sent: bool) -> bool:
+    """
+    Wysyła dzienny raport serwera (wywoływane przez product_report_scheduler w zaplanowanym terminie).
+    True = raport jest na kanale; False = nie da się go wysłać (np. brak kanału) - termin jest pomijany; wyjątek = ponowienie za kilka minut.
+    """
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        return False
+    config = await async_database.get_server_config(guild_id)
+    report_channel = guild.get_channel(config.product_report_channel_id) if config else None
+    if not report_channel or not isinstance(report_channel, discord.TextChannel):
+        print(f"[REPORT_TASK] Nie znaleziono kanału raportów na {guild.name}")
+        return False
+    if possibly_sent and await _report_already_sent(report_channel, scheduled_for):
+        print(f"[REPORT_TASK] Raport dla {guild.name} został już wysłany przed restartem - pomijam.")
+        return True
+    print(f"[REPORT_TASK] Generowanie raportu dla {guild.name} (ID: {guild_id})")
+
+    now_utc = datetime.now(timezone.utc)
+    product_changes = await async_database.get_product_changes_for_report(guild_id, hours_ago=24)
+    top_drops = await async_database.get_top_price_drops(guild_id, hours_ago=24, limit=5)
+
+    embed = discord.Embed(title=f"{REPORT_EMBED_TITLE} - {now_utc.strftime('%Y-%m-%d')}", color=discord.Color.blue(), timestamp=now_utc)
+    embed.set_footer(text=f"Serwer: {guild.name}")
+    changes_desc = ""
+    if product_changes:
+        for change in product_changes[:10]:
+            name = change.get('product_name', 'Produkt')
+            url = change.get('product_url', '#')
+            old_p_cents = change.get('old_price_cents')
+            new_p_cents = change.get('new_price_cents')
+            old_a = change.get('old_availability_str', 'N/A')
+            new_a = change.get('new_availability_str', 'N/A')
+
+            old_p_display = f"{old_p_cents / 100:.2f} zł" if old_p_cents is not None else "N/A"
+            new_p_display = f"{new_p_cents / 100:.2f} zł" if new_p_cents is not None else "N/A"
+
+            price_changed = old_p_cents != new_p_cents and old_p_cents is not None and new_p_cents is not None
+            avail_changed = old_a != new_a and old_a is not None and new_a is not None
+
+            if price_changed or avail_changed:
+                changes_desc += f"[{name}]({url})\n"
+                if price_changed: changes_desc += f"  Cena: `{old_p_display}` -> `{new_p_display}`\n"
+                if avail_changed: changes_desc += f"  Dostępność: `{old_a}` -> `{new_a}`\n"
+                changes_desc += "\n"
+    else: changes_desc = "Brak znaczących zmian cen/dostępności w ciągu ostatnich 24h."
+    if len(changes_desc) > 1020: changes_desc = changes_desc[:1017] + "..."
+    embed.add_field(name="🔍 Zmiany Cen i Dostępności (24h)", value=changes_desc if changes_desc else "Brak zmian.", inline=False)
+
+    drops_desc = ""
+    if top_drops:
+        for i, drop in enumerate(top_drops):
+            name = drop.get('product_name', 'Produkt')
+            url = drop.get('product_url', '#')
+            old_p_cents = drop.get('old_price_cents')
+            new_p_cents = drop.get('new_price_cents')
+            percent = drop.get('drop_percentage', 0)
+            old_p_display = f"{old_p_cents / 100:.2f} zł" if old_p_cents is not None else "N/A"
+            new_p_display = f"{new_p_cents / 100:.2f} zł" if new_p_cents is not None else "N/A"
+            drops_desc += f"{i+1}. [{name}]({url})\n   `{old_p_display}` -> `{new_p_display}` (**-{percent:.1f}%**)\n"
+    else: drops_desc = "Brak znaczących spadków cen w ciągu ostatnich 24h."
+    if len(drops_desc) > 1020: drops_desc = drops_desc[:1017] + "..."
+    embed.add_field(name="📉 Największe Spadki Cen (24h)", value=drops_desc, inline=False)
+    embed.add_field(name="📈 Trendy Ogólne", value="Analiza trendów wkrótce!", inline=False)
+
+    try:
+        await report_channel.send(embed=embed)
+        print(f"[REPORT_TASK] Wyslano raport dla serwera {guild.name}")
+        return True
+    except discord.Forbidden:
+        print(f"[REPORT_TASK] Brak uprawnień do wysłania raportu na {report_channel.name} ({guild.name})") # Ponowienie nic nie da
+        return False
+
+# Jedno zadanie śpiące do najbliższego terminu raportu (terminy i stan wysyłki w tabeli product_report_schedule)
+product_report_scheduler = report_scheduler.ReportScheduler(send_product_report, shard=SHARD)
+
+async def _schedule_product_report(guild_id: int, time_changed: bool):
+    """Po zmianie ustawień raportu: wylicza termin kolejnego raportu i budzi harmonogram."""
+    config = await async_database.get_server_config(guild_id)
+    if config and config.product_report_channel_id and config.product_report_time_utc:
+        scheduled_for = report_scheduler.next_fire_time(config.product_report_time_utc, time.time())
+        # Sama zmiana kanału nie przesuwa już zaplanowanego (np. właśnie ponawianego) raportu
+        await async_database.set_product_report_schedule(guild_id, scheduled_for, replace=time_changed)
+    else:
+        await async_database.remove_product_report_schedule(guild_id)
+    product_report_scheduler.wake()
 
 # (Reszta kodu, definicje innych komend i funkcji pomocniczych)
 # ...
 
 if TOKEN:
-    bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        async_database.shutdown()
 else:
     print("Błąd: Nie znaleziono tokena bota w pliku .env")
 
-[end of main.py]
@@ -0,0 +1,200 @@
+"""
+Lekkie metryki czasu wykonania.
+
+LatencyHistogram to histogram w stylu HDR: kubełki log-liniowe (8 podkubełków na każdą potęgę dwójki),
+więc błąd względny percentyla to najwyżej ~12%, a zapis próbki to kilka operacji na intach
+i jedna inkrementacja listy - bez alokacji, tanio nawet na gorącej ścieżce (on_message).
+Wartości przechowujemy w mikrosekundach; zakres do ~12 dni.
+
+REGISTRY trzyma nazwane histogramy i liczniki: timed() (dekorator funkcji i korutyn - wywołania bazy,
+handlery zdarzeń, pętle tasks.loop) i timer() (menedżer kontekstu - etapy wewnątrz handlera).
+Koszt pomiaru to dwa perf_counter() i jeden record() - ok. 1 us, więc metryki są zawsze włączone.
+Eksport: tekst w formacie Prometheusa (render_prometheus, serwer HTTP start_http_server) albo okresowy wydruk (format_top).
+Zapisy idą tylko z wątku pętli zdarzeń, więc liczniki nie potrzebują blokad.
+"""
+import functools
+import inspect
+import time
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS # 8
+_LINEAR_LIMIT = SUB_BUCKETS * 2 # Wartości < 16 us mają własne kubełki
+_BUCKET_COUNT = _LINEAR_LIMIT + 40 * SUB_BUCKETS
+
+def _bucket_index(value: int) -> int:
+    if value < _LINEAR_LIMIT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return min(_BUCKET_COUNT - 1, _LINEAR_LIMIT + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS)
+
+def _bucket_upper_bound(index: int) -> int:
+    if index < _LINEAR_LIMIT:
+        return index
+    shift = (index - _LINEAR_LIMIT) // SUB_BUCKETS + 1
+    mantissa = (index - _LINEAR_LIMIT) % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total_us", "max_us")
+
+    def __init__(self):
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record(self, seconds: float):
+        value = int(seconds * 1_000_000)
+        if value < 0:
+            value = 0
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total_us += value
+        if value > self.max_us:
+            self.max_us = value
+
+    def percentile(self, percent: float) -> float:
+        """Górna granica kubełka, w którym wypada percentyl (sekundy). 0.0 dla pustego histogramu."""
+        if not self.count:
+            return 0.0
+        threshold = max(1, -(-self.count * percent // 100)) # Zaokrąglenie w górę
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= threshold:
+                return min(_bucket_upper_bound(index), self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+    def mean(self) -> float:
+        return self.total_us / self.count / 1_000_000 if self.count else 0.0
+
+    def summary(self) -> dict:
+        return {"count": self.count, "mean": self.mean(), "p50": self.percentile(50),
+                "p99": self.percentile(99), "max": self.max_us / 1_000_000}
+
+class Registry:
+    def __init__(self, prefix: str = "astrobot"):
+        self.prefix = prefix
+        self.histograms = {} # (metryka, nazwa) -> LatencyHistogram
+        self.counters = {} # (metryka, nazwa) -> int
+        self.started_at = time.time()
+
+    def histogram(self, metric: str, name: str = "") -> LatencyHistogram:
+        key = (metric, name)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        return histogram
+
+    def inc(self, metric: str, name: str = "", value: int = 1):
+        key = (metric, name)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def render_prometheus(self) -> str:
+        """Histogramy jako summary (kwantyle 0.5/0.9/0.99, _sum, _count), liczniki jako counter."""
+        lines = []
+        used = sorted(item for item in self.histograms.items() if item[1].count) # Np. nigdy niewołane funkcje bazy pomijamy
+        for metric in sorted({metric for (metric, _), _ in used}):
+            full_name = f"{self.prefix}_{metric}_seconds"
+            lines.append(f"# TYPE {full_name} summary")
+            for (histogram_metric, name), histogram in used:
+                if histogram_metric != metric:
+                    continue
+                label = _escape_label(name)
+                for quantile in (0.5, 0.9, 0.99):
+                    lines.append(f'{full_name}{{name="{label}",quantile="{quantile}"}} {histogram.percentile(quantile * 100):.6f}')
+                lines.append(f'{full_name}_sum{{name="{label}"}} {histogram.total_us / 1_000_000:.6f}')
+                lines.append(f'{full_name}_count{{name="{label}"}} {histogram.count}')
+        for metric in sorted({metric for metric, _ in self.counters}):
+            full_name = f"{self.prefix}_{metric}_total"
+            lines.append(f"# TYPE {full_name} counter")
+            for (counter_metric, name), value in sorted(self.counters.items()):
+                if counter_metric == metric:
+                    lines.append(f'{full_name}{{name="{_escape_label(name)}"}} {value}')
+        lines.append(f"# TYPE {self.prefix}_start_time_seconds gauge")
+        lines.append(f"{self.prefix}_start_time_seconds {self.started_at:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def format_top(self, count: int = 10) -> str:
+        """Pomiary z największym łącznym czasem - gdzie bot spędza czas od startu."""
+        ranked = sorted(self.histograms.items(), key=lambda item: item[1].total_us, reverse=True)[:count]
+        rows = []
+        for (metric, name), histogram in ranked:
+            if not histogram.count:
+                continue
+            summary = histogram.summary()
+            rows.append(f"{metric}:{name} n={summary['count']} suma={histogram.total_us / 1_000_000:.2f}s "
+                        f"p50={summary['p50'] * 1000:.2f}ms p99={summary['p99'] * 1000:.2f}ms max={summary['max'] * 1000:.1f}ms")
+        return "\n".join(rows)
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+REGISTRY = Registry()
+histogram = REGISTRY.histogram
+inc = REGISTRY.inc
+
+class timer:
+    """Menedżer kontekstu: `with metrics.timer("on_message_stage", "automod"):` - czas bloku i licznik błędów."""
+    __slots__ = ("_histogram", "_metric", "_name", "_started_at")
+
+    def __init__(self, metric: str, name: str = ""):
+        self._histogram = REGISTRY.histogram(metric, name)
+        self._metric = metric
+        self._name = name
+
+    def __enter__(self):
+        self._started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._histogram.record(time.perf_counter() - self._started_at)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            REGISTRY.inc(f"{self._metric}_errors", self._name)
+        return False
+
+def timed(metric: str, name: str | None = None):
+    """Dekorator funkcji lub korutyny; `name` domyślnie = nazwa funkcji. Zachowuje __name__ (bot.event, tasks.loop)."""
+    def decorator(func):
+        label = name or func.__name__
+        latency = REGISTRY.histogram(metric, label)
+        error_metric = f"{metric}_errors"
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    REGISTRY.inc(error_metric, label)
+                    raise
+                finally:
+                    latency.record(time.perf_counter() - started_at)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    REGISTRY.inc(error_metric, label)
+                    raise
+                finally:
+                    latency.record(time.perf_counter() - started_at)
+        return wrapper
+    return decorator
+
+async def start_http_server(host: str, port: int, registry: Registry = REGISTRY):
+    """Endpoint GET /metrics (format tekstowy Prometheusa). Zwraca web.AppRunner - zamknięcie: await runner.cleanup()."""
+    from aiohttp import web # aiohttp i tak jest zależnością discord.py
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render_prometheus().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
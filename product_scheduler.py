@@ -0,0 +1,191 @@
+"""
+Adaptacyjny harmonogram skanowania produktów.
+
+Każdy produkt ma własny termin kolejnego skanu (watched_products.next_scan_at) i interwał
+(scan_interval_seconds). Terminy trzymamy w kopcu (heapq) - na każdym "tyknięciu" zdejmujemy
+produkty, których termin minął, od najbardziej spóźnionych, w ramach globalnego budżetu żądań na godzinę.
+Po skanie interwał się dostosowuje:
+- zmiana ceny lub dostępności -> interwał /2 (promocje sprawdzamy częściej, do MIN_INTERVAL),
+- brak zmian -> interwał *1.5 (stabilne produkty coraz rzadziej, do MAX_INTERVAL),
+- błąd skanu -> DEFAULT_INTERVAL * 2^liczba_kolejnych_błędów (do MAX_FAILING_INTERVAL).
+Harmonogram jest zapisywany w bazie razem z wynikami skanu, więc przetrwa restart bota.
+
+Nowy lub ponownie aktywowany produkt dostaje w bazie next_scan_at = teraz (subscribe_to_product) - również
+w procesie bota, który nie skanuje (tryb wieloprocesowy). Harmonogram co tyknięcie dociąga z bazy produkty
+z terminem w oknie od poprzedniej synchronizacji (sync_window/merge) i dokłada brakujące lub przyspieszone.
+"""
+import heapq
+import random
+import time
+
+MIN_INTERVAL_SECONDS = 15 * 60
+DEFAULT_INTERVAL_SECONDS = 4 * 3600 # Dotychczasowy stały cykl skanowania
+MAX_INTERVAL_SECONDS = 24 * 3600
+MAX_FAILING_INTERVAL_SECONDS = 3 * 24 * 3600
+DEFAULT_REQUESTS_PER_HOUR = 600
+BUDGET_BURST_MINUTES = 5 # Ile minut budżetu można wykorzystać naraz (np. po restarcie)
+SYNC_MARGIN_SECONDS = 120 # Zakładka okna synchronizacji z bazą (zegary procesów, zapis w trakcie tyknięcia)
+INTERVAL_JITTER = 0.1 # +-10%, żeby produkty dodane razem nie skanowały się zawsze razem
+
+class _ProductSchedule:
+    __slots__ = ("next_scan_at", "interval", "failures", "last_scanned_at", "last_changed_at", "in_flight")
+
+    def __init__(self, next_scan_at: int, interval: int, failures: int, last_scanned_at: int | None, last_changed_at: int | None):
+        self.next_scan_at = next_scan_at
+        self.interval = interval
+        self.failures = failures
+        self.last_scanned_at = last_scanned_at
+        self.last_changed_at = last_changed_at
+        self.in_flight = False
+
+class ScanScheduler:
+    def __init__(self, requests_per_hour: int = DEFAULT_REQUESTS_PER_HOUR):
+        self.requests_per_hour = requests_per_hour
+        self._products = {} # product_id -> _ProductSchedule
+        self._heap = [] # (next_scan_at, product_id); nieaktualne wpisy pomijamy przy zdejmowaniu
+        self._tokens = requests_per_hour / 60 * BUDGET_BURST_MINUTES
+        self._tokens_updated_at = time.monotonic()
+        self.hydrated = False
+        self.synced_at = 0 # Górna granica ostatniego okna synchronizacji z bazą
+        self.dispatched = 0
+
+    @staticmethod
+    def _from_row(row: dict, now: int) -> _ProductSchedule:
+        return _ProductSchedule(
+            row.get("next_scan_at") or now,
+            row.get("scan_interval_seconds") or DEFAULT_INTERVAL_SECONDS,
+            row.get("consecutive_failures") or 0,
+            row.get("last_scanned_at"),
+            row.get("last_changed_at"))
+
+    def hydrate(self, rows, now: int | None = None):
+        """rows: słowniki watched_products (aktywne) z kolumnami harmonogramu."""
+        now = now or int(time.time())
+        self._products.clear()
+        self._heap = []
+        for row in rows:
+            self._set(row["id"], self._from_row(row, now))
+        self.hydrated = True
+        self.synced_at = now
+
+    def sync_window(self, now: int | None = None) -> tuple[int, int]:
+        """Zakres next_scan_at (od, do), który trzeba dociągnąć z bazy przy tym tyknięciu."""
+        now = now or int(time.time())
+        return self.synced_at - SYNC_MARGIN_SECONDS, now
+
+    def merge(self, rows, now: int | None = None):
+        """
+        Produkty z bazy z terminem w sync_window(): brakujące w harmonogramie dodajemy, a znanym
+        przyspieszamy termin, jeśli w bazie jest wcześniejszy (np. nowa subskrypcja). Reszta to nasze własne wpisy.
+        """
+        now = now or int(time.time())
+        for row in rows:
+            schedule = self._products.get(row["id"])
+            if schedule is None:
+                self._set(row["id"], self._from_row(row, now))
+            elif not schedule.in_flight and row.get("next_scan_at") is not None and row["next_scan_at"] < schedule.next_scan_at:
+                schedule.next_scan_at = row["next_scan_at"]
+                heapq.heappush(self._heap, (schedule.next_scan_at, row["id"]))
+        self.synced_at = now
+
+    def _set(self, product_id: int, schedule: _ProductSchedule):
+        self._products[product_id] = schedule
+        heapq.heappush(self._heap, (schedule.next_scan_at, product_id))
+
+    def remove(self, product_id: int):
+        self._products.pop(product_id, None) # Wpis w kopcu zostanie pominięty przy zdejmowaniu
+
+    def _refill_budget(self):
+        now = time.monotonic()
+        capacity = self.requests_per_hour / 60 * BUDGET_BURST_MINUTES
+        self._tokens = min(capacity, self._tokens + (now - self._tokens_updated_at) * self.requests_per_hour / 3600)
+        self._tokens_updated_at = now
+
+    def take_due(self, now: int | None = None) -> list[int]:
+        """Zdejmuje produkty z minionym terminem (najpierw najbardziej spóźnione), ile pozwala budżet."""
+        now = now or int(time.time())
+        self._refill_budget()
+        due = []
+        while self._heap and self._heap[0][0] <= now and self._tokens >= 1:
+            next_scan_at, product_id = heapq.heappop(self._heap)
+            schedule = self._products.get(product_id)
+            if schedule is None or schedule.in_flight or schedule.next_scan_at != next_scan_at:
+                continue # Usunięty, już skanowany albo przesunięty (nieaktualny wpis)
+            schedule.in_flight = True
+            self._tokens -= 1
+            due.append(product_id)
+        self.dispatched += len(due)
+        return due
+
+    def release(self, product_id: int):
+        """Zwraca produkt do kolejki bez zmiany terminu (np. nie udało się go wczytać)."""
+        schedule = self._products.get(product_id)
+        if schedule is not None and schedule.in_flight:
+            schedule.in_flight = False
+            heapq.heappush(self._heap, (schedule.next_scan_at, product_id))
+
+    def reschedule(self, result: dict, changed: bool) -> dict:
+        """
+        Wylicza nowy interwał po skanie i dopisuje do `result` (format database.record_product_scan_results)
+        klucze next_scan_at, scan_interval_seconds, consecutive_failures i last_changed_at.
+        """
+        product_id = result["product_id"]
+        schedule = self._products.get(product_id)
+        if schedule is None: # Produkt usunięty w trakcie skanu - zapisujemy tylko wynik
+            schedule = _ProductSchedule(0, DEFAULT_INTERVAL_SECONDS, 0, None, None)
+        scanned_at = result["scanned_at"]
+        if not result["ok"]:
+            schedule.failures += 1
+            interval = min(MAX_FAILING_INTERVAL_SECONDS, DEFAULT_INTERVAL_SECONDS * 2 ** min(schedule.failures, 10))
+        else:
+            schedule.failures = 0
+            schedule.last_scanned_at = scanned_at
+            if changed:
+                schedule.last_changed_at = scanned_at
+                interval = max(MIN_INTERVAL_SECONDS, schedule.interval // 2)
+            else:
+                interval = min(MAX_INTERVAL_SECONDS, int(schedule.interval * 1.5))
+        if result["ok"]:
+            schedule.interval = interval # Interwał "zmienności" nie rośnie od błędów sieci
+        jittered = int(interval * random.uniform(1 - INTERVAL_JITTER, 1 + INTERVAL_JITTER))
+        schedule.next_scan_at = scanned_at + jittered
+        schedule.in_flight = False
+        if product_id in self._products:
+            heapq.heappush(self._heap, (schedule.next_scan_at, product_id))
+
+        result["next_scan_at"] = schedule.next_scan_at
+        result["scan_interval_seconds"] = schedule.interval
+        result["consecutive_failures"] = schedule.failures
+        result["last_changed_at"] = schedule.last_changed_at
+        return result
+
+def freshness(rows, requests_per_hour: int, now: int | None = None) -> dict:
+    """
+    Osiągnięta świeżość danych: dla każdego produktu (wiersze watched_products z kolumnami harmonogramu) wiek
+    ostatniego udanego skanu, interwał i spóźnienie względem terminu, plus podsumowanie (mediana/p95 wieku,
+    ile produktów czeka ponad termin). Liczone z bazy, więc wynik jest taki sam w każdym procesie bota.
+    """
+    now = now or int(time.time())
+    products = {}
+    for row in rows:
+        last_scanned_at = row.get("last_scanned_at")
+        products[row["id"]] = {
+            "age_seconds": now - last_scanned_at if last_scanned_at else None,
+            "interval_seconds": row.get("scan_interval_seconds") or DEFAULT_INTERVAL_SECONDS,
+            "overdue_seconds": max(0, now - (row.get("next_scan_at") or now)),
+            "failures": row.get("consecutive_failures") or 0,
+            "last_changed_at": row.get("last_changed_at"),
+        }
+    ages = sorted(p["age_seconds"] for p in products.values() if p["age_seconds"] is not None)
+    summary = {
+        "products": len(products),
+        "never_scanned": len(products) - len(ages),
+        "overdue": sum(1 for p in products.values() if p["overdue_seconds"] > 0),
+        "failing": sum(1 for p in products.values() if p["failures"] > 0),
+        "age_p50_seconds": ages[len(ages) // 2] if ages else None,
+        "age_p95_seconds": ages[min(len(ages) - 1, int(len(ages) * 0.95))] if ages else None,
+        # Ile żądań/h wymagałyby obecne interwały - powyżej budżetu produkty będą się spóźniać
+        "demand_per_hour": round(sum(3600 / p["interval_seconds"] for p in products.values()), 1),
+        "budget_per_hour": requests_per_hour,
+    }
+    return {"summary": summary, "products": products}
@@ -0,0 +1,126 @@
+"""
+Rankingi XP serwerów trzymane w pamięci.
+
+Dla każdego serwera trzymamy posortowaną listę kluczy (-xp, -level, user_id) - ten sam porządek
+co ORDER BY xp DESC, level DESC, user_id ASC w bazie. Pozycja użytkownika to wyszukiwanie
+binarne (O(log n)), a zmiana XP to usunięcie i wstawienie klucza (bisect + przesunięcie
+pamięci w liście - dla 200 tys. członków to ułamek milisekundy). Ranking serwera jest wczytywany
+z bazy raz, przy pierwszym użyciu, a potem aktualizowany na bieżąco przy przyznawaniu XP.
+"""
+import asyncio
+import bisect
+import collections
+
+DEFAULT_MAX_GUILDS = 200
+TOP_SNAPSHOT_SIZE = 100 # Ile pierwszych miejsc trzymamy jako gotową listę dla /leaderboard
+
+class GuildRanking:
+    __slots__ = ("_keys", "_by_user", "_top_snapshot")
+
+    def __init__(self, rows=()):
+        # rows: iterowalne krotki (user_id, xp, level); użytkownicy z 0 XP nie są klasyfikowani
+        self._by_user = {}
+        for user_id, xp, level in rows:
+            if xp > 0:
+                self._by_user[user_id] = (-xp, -level, user_id)
+        self._keys = sorted(self._by_user.values())
+        self._top_snapshot = None
+
+    def update(self, user_id: int, xp: int, level: int):
+        old_key = self._by_user.get(user_id)
+        new_key = (-xp, -level, user_id)
+        if old_key == new_key:
+            return
+        # Gotowe top-N unieważniamy tylko, gdy zmiana dotyka pierwszych N miejsc
+        if self._top_snapshot is not None and len(self._keys) >= TOP_SNAPSHOT_SIZE:
+            cutoff = self._keys[TOP_SNAPSHOT_SIZE - 1]
+            if (old_key is not None and old_key <= cutoff) or new_key <= cutoff:
+                self._top_snapshot = None
+        else:
+            self._top_snapshot = None
+        if old_key is not None:
+            del self._keys[bisect.bisect_left(self._keys, old_key)]
+            del self._by_user[user_id]
+        if xp > 0:
+            bisect.insort(self._keys, new_key)
+            self._by_user[user_id] = new_key
+
+    def rank(self, user_id: int) -> tuple[int, int] | None:
+        """Zwraca (pozycja, liczba sklasyfikowanych) lub None, jeśli użytkownik nie ma XP."""
+        key = self._by_user.get(user_id)
+        if key is None:
+            return None
+        return bisect.bisect_left(self._keys, key) + 1, len(self._keys)
+
+    def stats(self, user_id: int) -> tuple[int, int] | None:
+        """Zwraca (xp, level) użytkownika lub None."""
+        key = self._by_user.get(user_id)
+        if key is None:
+            return None
+        return -key[0], -key[1]
+
+    def top(self) -> list[dict]:
+        """Pierwsze TOP_SNAPSHOT_SIZE miejsc; lista jest budowana ponownie tylko po zmianie w czołówce."""
+        if self._top_snapshot is None:
+            self._top_snapshot = [_entry(key) for key in self._keys[:TOP_SNAPSHOT_SIZE]]
+        return self._top_snapshot
+
+    def page(self, limit: int = 10, offset: int = 0) -> list[dict]:
+        """Strona rankingu w formacie database.get_server_leaderboard; czołówka idzie z gotowego top-N."""
+        if offset + limit <= TOP_SNAPSHOT_SIZE:
+            return self.top()[offset:offset + limit]
+        return [_entry(key) for key in self._keys[offset:offset + limit]]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+def _entry(key: tuple[int, int, int]) -> dict:
+    return {"user_id": key[2], "xp": -key[0], "level": -key[1]}
+
+class RankingIndex:
+    """
+    Rankingi wielu serwerów (LRU po serwerach, żeby ograniczyć pamięć).
+    `load_rows(guild_id)` - korutyna zwracająca wiersze (user_id, xp, level) z bazy,
+    `overlay(guild_id)` - opcjonalnie świeższe wartości spoza bazy (np. z bufora XP).
+    """
+    def __init__(self, load_rows, overlay=None, max_guilds: int = DEFAULT_MAX_GUILDS):
+        self._load_rows = load_rows
+        self._overlay = overlay
+        self.max_guilds = max_guilds
+        self._guilds = collections.OrderedDict()
+        self._loading = {}
+
+    async def get(self, guild_id: int) -> GuildRanking:
+        ranking = self._guilds.get(guild_id)
+        if ranking is not None:
+            self._guilds.move_to_end(guild_id)
+            return ranking
+        # Jedno wczytanie na serwer, nawet jeśli kilka /rank przyjdzie naraz
+        loading = self._loading.get(guild_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._hydrate(guild_id))
+            self._loading[guild_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        return await asyncio.shield(loading)
+
+    async def _hydrate(self, guild_id: int) -> GuildRanking:
+        ranking = GuildRanking(await self._load_rows(guild_id))
+        if self._overlay is not None:
+            for user_id, xp, level in self._overlay(guild_id):
+                ranking.update(user_id, xp, level)
+        self._guilds[guild_id] = ranking
+        while len(self._guilds) > self.max_guilds:
+            self._guilds.popitem(last=False)
+        return ranking
+
+    def update(self, guild_id: int, user_id: int, xp: int, level: int):
+        """Aktualizuje ranking, jeśli serwer jest wczytany (niewczytany i tak pobierze świeże dane)."""
+        ranking = self._guilds.get(guild_id)
+        if ranking is not None:
+            ranking.update(user_id, xp, level)
+
+    def invalidate(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+
+    async def rank(self, guild_id: int, user_id: int) -> tuple[int, int] | None:
+        return (await self.get(guild_id)).rank(user_id)
@@ -0,0 +1,124 @@
+"""
+Harmonogram dziennych raportów produktowych.
+
+Termin kolejnego raportu każdego serwera jest wyliczany raz (przy zmianie ustawień i po wysłaniu)
+i zapisywany w tabeli product_report_schedule. Jedno zadanie w tle śpi do najbliższego terminu
+(albo do wake() po zmianie ustawień), budzi się, wysyła tylko raporty, których termin minął,
+i zapisuje ich wysłanie. Koszt zależy od liczby raportów do wysłania, a nie od liczby serwerów.
+
+Restart bota: terminy i stan wysyłki są w bazie, więc raport nie jest pomijany (zaległy raport
+wysyłamy po starcie, jeśli spóźnienie nie przekracza MAX_LATENESS_SECONDS) ani wysyłany podwójnie
+(przed wysyłką zapisujemy próbę - jeśli bot padł w trakcie, `deliver` dostaje possibly_sent=True
+i może sprawdzić, czy raport już jest na kanale).
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import async_database
+
+MAX_LATENESS_SECONDS = 12 * 3600 # Starszy zaległy raport pomijamy - i tak byłby nieaktualny
+RETRY_DELAY_SECONDS = 5 * 60 # Ponowienie po przejściowym błędzie wysyłki
+MAX_SLEEP_SECONDS = 3600 # Budzimy się co najmniej raz na godzinę (np. po zmianie czasu systemowego)
+
+def next_fire_time(report_time_utc: str, after: float) -> int:
+    """Najbliższy (ściśle po `after`) timestamp godziny "HH:MM" UTC."""
+    hour, minute = map(int, report_time_utc.split(':'))
+    after_dt = datetime.fromtimestamp(after, tz=timezone.utc)
+    fire_dt = after_dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if fire_dt.timestamp() <= after:
+        fire_dt += timedelta(days=1)
+    return int(fire_dt.timestamp())
+
+class ReportScheduler:
+    def __init__(self, deliver, shard: tuple[int, tuple[int, ...]] | None = None):
+        # deliver(guild_id, scheduled_for, possibly_sent) -> bool - korutyna wysyłająca raport.
+        # Wyjątek = błąd przejściowy (ponowimy); True = raport jest na kanale, False = nie da się go wysłać (pomijamy ten termin).
+        self._deliver = deliver
+        self._shard = shard # (liczba shardów, shardy tego procesu) - w trybie wieloprocesowym tylko własne serwery
+        self._wake = asyncio.Event()
+        self._task = None
+        self.sent_count = 0
+
+    def wake(self):
+        """Wywoływane po zmianie harmonogramu - zadanie przelicza, do kiedy spać."""
+        self._wake.set()
+
+    async def _backfill(self):
+        """Terminy dla serwerów skonfigurowanych przed wprowadzeniem harmonogramu (albo bez wiersza z innego powodu)."""
+        now = int(time.time())
+        for config in await async_database.get_unscheduled_product_report_configs(shard=self._shard):
+            try:
+                scheduled_for = next_fire_time(config["report_time_utc"], now)
+            except ValueError:
+                print(f"[REPORT_SCHEDULER] Nieprawidłowa godzina raportu serwera {config['guild_id']}: '{config['report_time_utc']}'")
+                continue
+            await async_database.set_product_report_schedule(config["guild_id"], scheduled_for, replace=False)
+
+    async def _run(self):
+        backfilled = False
+        while True:
+            try:
+                if not backfilled:
+                    await self._backfill()
+                    backfilled = True
+                next_attempt_at = await async_database.get_next_product_report_attempt(shard=self._shard)
+            except Exception as e:
+                # Błąd bazy nie może na stałe zatrzymać raportów tego procesu
+                print(f"[REPORT_SCHEDULER] Błąd odczytu harmonogramu raportów, ponowię za {RETRY_DELAY_SECONDS // 60} min: {e}")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                continue
+            timeout = MAX_SLEEP_SECONDS if next_attempt_at is None else min(MAX_SLEEP_SECONDS, max(0, next_attempt_at - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._fire_due()
+            except Exception as e:
+                print(f"[REPORT_SCHEDULER] Błąd obsługi zaplanowanych raportów: {e}")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+    async def _fire_due(self):
+        now = int(time.time())
+        for due in await async_database.get_due_product_reports(now, shard=self._shard):
+            guild_id, scheduled_for = due["guild_id"], due["scheduled_for"]
+            try:
+                next_scheduled_for = next_fire_time(due["report_time_utc"], max(now, scheduled_for))
+            except ValueError:
+                print(f"[REPORT_SCHEDULER] Nieprawidłowa godzina raportu serwera {guild_id}: '{due['report_time_utc']}' - usuwam z harmonogramu.")
+                await async_database.remove_product_report_schedule(guild_id)
+                continue
+            if now - scheduled_for > MAX_LATENESS_SECONDS:
+                print(f"[REPORT_SCHEDULER] Pomijam raport serwera {guild_id} spóźniony o {(now - scheduled_for) // 60} min.")
+                await async_database.advance_product_report(guild_id, scheduled_for, next_scheduled_for, False, now)
+                continue
+
+            possibly_sent = due["attempt_started_for"] == scheduled_for
+            await async_database.mark_product_report_attempt(guild_id, scheduled_for)
+            try:
+                sent = await self._deliver(guild_id, scheduled_for, possibly_sent)
+            except Exception as e:
+                print(f"[REPORT_SCHEDULER] Błąd wysyłania raportu serwera {guild_id}, ponowię za {RETRY_DELAY_SECONDS // 60} min: {e}")
+                await async_database.retry_product_report(guild_id, scheduled_for, int(time.time()) + RETRY_DELAY_SECONDS)
+                continue
+            await async_database.advance_product_report(guild_id, scheduled_for, next_scheduled_for, sent, int(time.time()))
+            if sent:
+                self.sent_count += 1
+
+    def start(self):
+        if not self.is_running():
+            self._task = asyncio.create_task(self._run())
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
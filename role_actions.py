@@ -0,0 +1,220 @@
+"""
+Kolejka zmian ról wykonywanych w tle (wygasłe role czasowe i wyciszenia, role-nagrody za poziom).
+
+Zmiany ról jednego członka serwera, które czekają w kolejce, są łączone w jedno wywołanie
+member.edit(roles=...) - np. trzy nagrody za poziom albo kilka wygasłych ról to jedno żądanie zamiast kilku.
+member.edit zastępuje całą listę ról, więc przed taką edycją pobieramy aktualne role członka z API (fetch_member);
+pojedyncza zmiana idzie osobnym endpointem jednej roli i nie dotyka pozostałych. Zostaje krótkie okno wyścigu:
+rola nadana lub zdjęta przez kogoś innego między fetch_member a member.edit zostanie cofnięta.
+Endpoint edycji członka ma limit (bucket) per serwer, więc kolejka obsługuje serwery po kolei
+(round-robin, najwyżej jedno żądanie naraz na serwer), a łączne tempo ogranicza token bucket
+poniżej globalnego limitu Discorda (50 żądań/s). Dzięki temu tysiące jednoczesnych wygaśnięć
+rozkładają się w czasie zamiast wywoływać 429. Błędy przejściowe (5xx, sieć) ponawiamy z wykładniczym opóźnieniem.
+
+add_role/remove_role zwracają Future: wynik True - role zmienione, False - nic do zrobienia
+(członek opuścił serwer, rola usunięta albo już w docelowym stanie); wyjątek discord.Forbidden/NotFound
+albo ostatni błąd po wyczerpaniu prób.
+"""
+import asyncio
+import collections
+
+import discord
+
+from utils.token_bucket import TokenBucket
+
+DEFAULT_REQUESTS_PER_SECOND = 20.0 # Zapas względem globalnego limitu - reszta bota też wysyła żądania
+DEFAULT_BURST = 10
+DEFAULT_WORKERS = 4 # Ile serwerów obsługujemy równolegle
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY_SECONDS = 2.0
+
+class _PendingEdit:
+    __slots__ = ("guild", "member_id", "add", "remove", "reasons", "futures", "attempts")
+
+    def __init__(self, guild: discord.Guild, member_id: int):
+        self.guild = guild
+        self.member_id = member_id
+        self.add = set() # role_id
+        self.remove = set()
+        self.reasons = []
+        self.futures = []
+        self.attempts = 0
+
+def _retrieve_exception(future: asyncio.Future):
+    # Wywołujący nie musi czekać na wynik - bez tego asyncio ostrzega o nieodebranym wyjątku
+    if not future.cancelled():
+        future.exception()
+
+class RoleActionQueue:
+    def __init__(self, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND, burst: int = DEFAULT_BURST,
+                 workers: int = DEFAULT_WORKERS):
+        self._bucket = TokenBucket(requests_per_second, burst)
+        self._workers_count = workers
+        self._pending = {} # guild_id -> OrderedDict(member_id -> _PendingEdit), jeszcze nie wysłane
+        self._ready = collections.deque() # Serwery z oczekującymi zmianami, które nie mają żądania w toku
+        self._ready_set = set()
+        self._busy = set() # Serwery z żądaniem w toku lub w oczekiwaniu na ponowienie
+        self._ready_event = asyncio.Event()
+        self._workers = []
+        self.requests = 0
+        self.coalesced = 0 # Ile zmian ról zaoszczędziło osobne żądanie
+        self.retries = 0
+
+    def add_role(self, member: discord.Member, role: discord.Role, reason: str | None = None) -> asyncio.Future:
+        return self._enqueue(member, role.id, True, reason)
+
+    def remove_role(self, member: discord.Member, role: discord.Role, reason: str | None = None) -> asyncio.Future:
+        return self._enqueue(member, role.id, False, reason)
+
+    def _enqueue(self, member: discord.Member, role_id: int, add: bool, reason: str | None) -> asyncio.Future:
+        guild_queue = self._pending.setdefault(member.guild.id, collections.OrderedDict())
+        edit = guild_queue.get(member.id)
+        if edit is None:
+            edit = guild_queue[member.id] = _PendingEdit(member.guild, member.id)
+        else:
+            self.coalesced += 1
+        (edit.add if add else edit.remove).add(role_id)
+        (edit.remove if add else edit.add).discard(role_id) # Późniejsza zmiana tej samej roli wygrywa
+        if reason and reason not in edit.reasons:
+            edit.reasons.append(reason)
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve_exception)
+        edit.futures.append(future)
+        self._mark_ready(member.guild.id)
+        return future
+
+    def _mark_ready(self, guild_id: int):
+        if guild_id not in self._busy and guild_id not in self._ready_set and self._pending.get(guild_id):
+            self._ready.append(guild_id)
+            self._ready_set.add(guild_id)
+            self._ready_event.set()
+
+    def pending(self) -> int:
+        return sum(len(guild_queue) for guild_queue in self._pending.values())
+
+    async def _worker(self):
+        while True:
+            if not self._ready:
+                self._ready_event.clear()
+                await self._ready_event.wait()
+                continue
+            guild_id = self._ready.popleft()
+            self._ready_set.discard(guild_id)
+            guild_queue = self._pending.get(guild_id)
+            if not guild_queue:
+                continue
+            _, edit = guild_queue.popitem(last=False)
+            if not guild_queue:
+                del self._pending[guild_id]
+            self._busy.add(guild_id)
+            retry_delay = None
+            try:
+                await self._bucket.acquire()
+                retry_delay = await self._apply(edit)
+            finally:
+                if retry_delay is None:
+                    self._release(guild_id)
+                else:
+                    # Serwer czeka na ponowienie; zmiany dodane w międzyczasie dołączą do tej samej edycji
+                    self.retries += 1
+                    later = self._pending.setdefault(guild_id, collections.OrderedDict())
+                    merged = later.pop(edit.member_id, None)
+                    if merged is not None:
+                        edit.add = (edit.add - merged.remove) | merged.add
+                        edit.remove = (edit.remove - merged.add) | merged.remove
+                        edit.reasons += [reason for reason in merged.reasons if reason not in edit.reasons]
+                        edit.futures += merged.futures
+                    later[edit.member_id] = edit
+                    later.move_to_end(edit.member_id, last=False)
+                    asyncio.get_running_loop().call_later(retry_delay, self._release, guild_id)
+
+    def _release(self, guild_id: int):
+        self._busy.discard(guild_id)
+        self._mark_ready(guild_id)
+
+    @staticmethod
+    def _changes(member: discord.Member, edit: _PendingEdit) -> tuple[set[int], set[int]]:
+        """Role do dodania i do usunięcia względem obecnych ról członka (pomija role już w docelowym stanie i usunięte z serwera)."""
+        current = {role.id for role in member.roles}
+        add = {role_id for role_id in edit.add - current if edit.guild.get_role(role_id) is not None}
+        remove = edit.remove & current
+        add.discard(edit.guild.id) # @everyone (ID roli = ID serwera) ma każdy i nie da się go zmienić
+        remove.discard(edit.guild.id)
+        return add, remove
+
+    async def _apply(self, edit: _PendingEdit) -> float | None:
+        """Wysyła jedną edycję ról. Zwraca opóźnienie ponowienia albo None, gdy edycja jest zakończona."""
+        member = edit.guild.get_member(edit.member_id)
+        if member is None:
+            self._resolve(edit, result=False)
+            return None
+        try:
+            add, remove = self._changes(member, edit)
+            if len(add) + len(remove) > 1:
+                # member.edit(roles=...) zastępuje wszystkie role członka, więc listę liczymy ze świeżego stanu z API,
+                # a nie z cache - inaczej cofnęlibyśmy zmianę, której cache jeszcze nie widział
+                await self._bucket.acquire()
+                self.requests += 1
+                try:
+                    member = await edit.guild.fetch_member(edit.member_id)
+                except discord.NotFound:
+                    self._resolve(edit, result=False) # Członek opuścił serwer
+                    return None
+                add, remove = self._changes(member, edit)
+            if not add and not remove:
+                self._resolve(edit, result=False)
+                return None
+            reason = "; ".join(edit.reasons)[:512] or None
+            self.requests += 1
+            if len(add) + len(remove) == 1:
+                # Jedna rola: osobny endpoint dodania/usunięcia roli nie dotyka pozostałych ról członka
+                if add:
+                    await member.add_roles(discord.Object(id=add.pop()), reason=reason)
+                else:
+                    await member.remove_roles(discord.Object(id=remove.pop()), reason=reason)
+            else:
+                new_roles = [role for role in member.roles if role.id not in remove and not role.is_default()]
+                new_roles += [edit.guild.get_role(role_id) for role_id in add]
+                await member.edit(roles=new_roles, reason=reason)
+        except (discord.Forbidden, discord.NotFound) as e:
+            self._resolve(edit, error=e)
+        except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+            # 429 ponawia już sam discord.py; tu trafiają błędy serwera i sieci
+            edit.attempts += 1
+            if isinstance(e, discord.HTTPException) and e.status < 500:
+                self._resolve(edit, error=e) # Np. 400 - ponowienie nic nie zmieni
+            elif edit.attempts >= MAX_ATTEMPTS:
+                print(f"[ROLE_ACTIONS] Rezygnuję ze zmiany ról {edit.member_id} na {edit.guild.name} po {edit.attempts} próbach: {e}")
+                self._resolve(edit, error=e)
+            else:
+                return RETRY_BASE_DELAY_SECONDS * 2 ** (edit.attempts - 1)
+        except Exception as e:
+            self._resolve(edit, error=e)
+        else:
+            self._resolve(edit, result=True)
+        return None
+
+    @staticmethod
+    def _resolve(edit: _PendingEdit, result: bool = False, error: Exception | None = None):
+        for future in edit.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+
+    async def close(self, timeout: float = 10.0):
+        """Daje kolejce chwilę na dokończenie zaległych zmian, potem zatrzymuje workery."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._pending or self._busy) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,48 @@
+"""
+Benchmark silników wyciągania danych na zapisanych stronach z scrapers/fixtures/.
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python -m scrapers.benchmark [liczba_powtórzeń]
+
+Dla każdej strony i każdego silnika (oraz domyślnego łańcucha) wypisuje średni czas parsowania
+jednej strony, szczytową ilość zaalokowanej pamięci (tracemalloc) i czy znaleziono nazwę/cenę/dostępność.
+tracemalloc widzi tylko alokacje Pythona - pamięć drzewa budowanego w C przez lxml (libxml2) nie jest wliczana.
+"""
+import pathlib
+import sys
+import time
+import tracemalloc
+
+from scrapers import xkom_scraper
+
+FIXTURES_DIR = pathlib.Path(__file__).parent / "fixtures"
+DEFAULT_REPEAT = 20
+
+def _measure(content: bytes, engines: tuple[str, ...], repeat: int) -> tuple[float, int, dict | None]:
+    result = xkom_scraper.parse_xkom_product(content, engines=engines) # Rozgrzewka (importy, kompilacja regexów)
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        xkom_scraper.parse_xkom_product(content, engines=engines)
+    mean_ms = (time.perf_counter() - started_at) / repeat * 1000
+
+    # Pamięć mierzymy osobno - tracemalloc spowalnia kod kilkukrotnie i zafałszowałby czasy
+    tracemalloc.start()
+    xkom_scraper.parse_xkom_product(content, engines=engines)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return mean_ms, peak_bytes, result
+
+def main(repeat: int = DEFAULT_REPEAT):
+    variants = [(name,) for name in xkom_scraper.ENGINES]
+    variants.append(xkom_scraper.DEFAULT_ENGINE_CHAIN)
+    print(f"{'strona':<28} {'silnik':<18} {'ms/stronę':>10} {'szczyt KB':>10}  nazwa cena dostępność")
+    for fixture in sorted(FIXTURES_DIR.glob("*.html")):
+        content = fixture.read_bytes()
+        for engines in variants:
+            mean_ms, peak_bytes, result = _measure(content, engines, repeat)
+            found = " ".join(("tak " if result and result.get(field) else "nie ").ljust(5)
+                             for field in ("name", "price_in_cents", "availability_str"))
+            print(f"{fixture.name:<28} {'+'.join(engines):<18} {mean_ms:>10.2f} {peak_bytes / 1024:>10.0f}  {found}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPEAT)
@@ -0,0 +1,170 @@
+"""
+Silniki wyciągania danych produktu (nazwa, cena, dostępność) ze strony sklepu.
+
+Silnik to funkcja (content: bytes) -> dict z kluczami FIELDS (brakujące = None).
+run_engines przechodzi po łańcuchu silników od najtańszego i kończy, gdy ma komplet danych,
+więc dopiero strona bez danych strukturalnych płaci za budowanie drzewa DOM.
+
+extract_structured jest wspólny dla wszystkich sklepów: czyta dane schema.org (JSON-LD)
+i meta tagi (product:price:amount, og:title) wyrażeniami regularnymi, bez parsowania całego HTML.
+Silniki oparte o selektory CSS są specyficzne dla sklepu i siedzą w jego scraperze.
+"""
+import hashlib
+import html
+import json
+import re
+
+try:
+    import lxml.html # Opcjonalne: parser w C, kilka razy szybszy od BeautifulSoup(html.parser)
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+FIELDS = ("name", "price_str", "availability_str")
+
+# schema.org/ItemAvailability -> te same etykiety, których używają selektory sklepów
+SCHEMA_AVAILABILITY = {
+    "instock": "Dostępny",
+    "limitedavailability": "Dostępny",
+    "instoreonly": "Dostępny",
+    "onlineonly": "Dostępny",
+    "outofstock": "Niedostępny",
+    "soldout": "Niedostępny",
+    "discontinued": "Niedostępny",
+    "preorder": "Na zamówienie",
+    "presale": "Na zamówienie",
+    "backorder": "Na zamówienie",
+}
+# Wartości meta product:availability (Open Graph)
+META_AVAILABILITY = {
+    "in stock": "Dostępny",
+    "instock": "Dostępny",
+    "out of stock": "Niedostępny",
+    "oos": "Niedostępny",
+    "preorder": "Na zamówienie",
+    "pending": "Na zamówienie",
+}
+
+_JSON_LD_BLOCK = re.compile(rb'<script[^>]*application/ld\+json[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+_META_TAG = re.compile(rb'<meta\s[^>]*>', re.IGNORECASE)
+_TAG_ATTRIBUTE = re.compile(rb'([\w:-]+)\s*=\s*(["\'])(.*?)\2', re.DOTALL)
+_BODY_START = re.compile(rb'<body[\s>]', re.IGNORECASE)
+# Cena w tekście strony: "1 299,99 zł" -> "1 299,99"
+PRICE_IN_TEXT = re.compile(r'(\d{1,3}(?:\s?\d{3})*(?:,\d{2})?)\s*zł')
+
+# Fragmenty strony, których silniki i tak nie czytają (skrypty poza JSON-LD, style, komentarze, białe znaki).
+# Zmieniają się przy każdym pobraniu (nonce, tokeny, znaczniki czasu), więc nie mogą wchodzić do skrótu.
+_VOLATILE_FRAGMENTS = re.compile(
+    rb'<script(?![^>]*application/ld\+json)[^>]*>.*?</script>|<style[^>]*>.*?</style>|<!--.*?-->|\s+',
+    re.IGNORECASE | re.DOTALL)
+
+def page_fingerprint(content: bytes) -> str:
+    """Skrót tej części strony, z której silniki wyciągają dane. Liczenie go jest wielokrotnie tańsze niż parsowanie."""
+    return hashlib.blake2b(_VOLATILE_FRAGMENTS.sub(b'', content), digest_size=16).hexdigest()
+
+def empty_result() -> dict:
+    return dict.fromkeys(FIELDS)
+
+def normalize_price_text(price_text: str) -> str | None:
+    """Wyciąga cenę z tekstu kontenera ceny i normalizuje ją do formatu "1234.56"."""
+    price_match = PRICE_IN_TEXT.search(price_text)
+    if not price_match:
+        return None
+    # Usunięcie spacji jako separatora tysięcy, zamiana przecinka na kropkę
+    return price_match.group(1).replace('\xa0', '').replace(' ', '').replace(',', '.')
+
+def normalize_structured_price(value: str) -> str | None:
+    """
+    Normalizuje cenę z danych strukturalnych (JSON-LD, meta tagi) do formatu "1234.56". Tam separatorem
+    dziesiętnym jest kropka, a przecinek to separator tysięcy ("1,299.00") - zamieniamy go na kropkę
+    tylko wtedy, gdy kropki nie ma (sklep podał polski format "1299,00").
+    """
+    value = value.strip().replace('\xa0', '').replace(' ', '')
+    if '.' in value:
+        value = value.replace(',', '')
+    else:
+        value = value.replace(',', '.')
+    return value or None
+
+def _iter_json_ld_items(node):
+    if isinstance(node, list):
+        for item in node:
+            yield from _iter_json_ld_items(item)
+    elif isinstance(node, dict):
+        yield node
+        if "@graph" in node:
+            yield from _iter_json_ld_items(node["@graph"])
+
+def _is_product(item: dict) -> bool:
+    item_type = item.get("@type")
+    if isinstance(item_type, list):
+        return "Product" in item_type
+    return item_type == "Product"
+
+def _first_offer(offers) -> dict | None:
+    if isinstance(offers, list):
+        offers = offers[0] if offers else None
+    return offers if isinstance(offers, dict) else None
+
+def extract_structured(content: bytes) -> dict:
+    """Dane z JSON-LD (schema.org/Product), a w drugiej kolejności z meta tagów w <head>."""
+    product_data = empty_result()
+
+    for block in _JSON_LD_BLOCK.finditer(content):
+        try:
+            document = json.loads(block.group(1))
+        except ValueError:
+            continue
+        for item in _iter_json_ld_items(document):
+            if not _is_product(item):
+                continue
+            if item.get("name") and not product_data["name"]:
+                product_data["name"] = html.unescape(str(item["name"])).strip()
+            offer = _first_offer(item.get("offers"))
+            if offer:
+                price = offer.get("price", offer.get("lowPrice"))
+                if price is not None and not product_data["price_str"]:
+                    product_data["price_str"] = normalize_structured_price(str(price))
+                availability = offer.get("availability")
+                if availability and not product_data["availability_str"]:
+                    key = str(availability).rstrip("/").rsplit("/", 1)[-1].lower()
+                    product_data["availability_str"] = SCHEMA_AVAILABILITY.get(key)
+        if all(product_data.values()):
+            return product_data
+
+    # Meta tagi są w <head> - nie ma sensu przeszukiwać całego <body>
+    body_start = _BODY_START.search(content)
+    head = content[:body_start.start()] if body_start else content
+    for meta in _META_TAG.finditer(head):
+        attributes = {key.lower(): value for key, _, value in _TAG_ATTRIBUTE.findall(meta.group(0))}
+        meta_name = (attributes.get(b"property") or attributes.get(b"name") or b"").lower()
+        meta_content = attributes.get(b"content")
+        if meta_content is None:
+            continue
+        value = html.unescape(meta_content.decode("utf-8", "replace")).strip()
+        if meta_name == b"product:price:amount" and not product_data["price_str"]:
+            product_data["price_str"] = normalize_structured_price(value)
+        elif meta_name == b"og:title" and not product_data["name"]:
+            product_data["name"] = value or None
+        elif meta_name in (b"product:availability", b"og:availability") and not product_data["availability_str"]:
+            product_data["availability_str"] = META_AVAILABILITY.get(value.lower())
+    return product_data
+
+def run_engines(content: bytes, engines, url: str = "") -> dict:
+    """
+    Uruchamia silniki `engines` (lista funkcji) po kolei, uzupełniając tylko brakujące pola.
+    Kończy po pierwszym silniku, po którym są wszystkie FIELDS.
+    """
+    product_data = empty_result()
+    for engine in engines:
+        try:
+            found = engine(content)
+        except Exception as e:
+            print(f"Błąd silnika {getattr(engine, '__name__', engine)} dla {url}: {e}")
+            continue
+        for field in FIELDS:
+            if product_data[field] is None and found.get(field):
+                product_data[field] = found[field]
+        if all(product_data.values()):
+            break
+    return product_data
@@ -0,0 +1,90 @@
+"""
+Współdzielony, asynchroniczny klient HTTP dla scraperów.
+
+Jedna sesja aiohttp (pula połączeń keep-alive) dla wszystkich skanów, ograniczona liczba
+równoległych żądań oraz "token bucket", żeby nie zalewać sklepu żądaniami. Limity są liczone
+per klucz - domyślnie host, a sklepy z rejestru (scrapers/registry.py) mają własne limity (set_limits).
+"""
+import asyncio
+import random
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.token_bucket import TokenBucket
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "pl-PL,pl;q=0.9",
+}
+DEFAULT_TIMEOUT_SECONDS = 15
+DEFAULT_PER_HOST_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_SECOND = 2.0 # Uprzejmość wobec sklepu: średnio tyle żądań na sekundę na host
+DEFAULT_BURST = 4
+
+class FetchResult:
+    __slots__ = ("url", "status", "body", "headers")
+
+    def __init__(self, url: str, status: int, body: bytes, headers):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+class AsyncFetcher:
+    def __init__(self, per_host_concurrency: int = DEFAULT_PER_HOST_CONCURRENCY,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 burst: int = DEFAULT_BURST,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        self.per_host_concurrency = per_host_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.timeout = timeout
+        self._session = None
+        self._limits = {} # klucz (host lub nazwa sklepu) -> (Semaphore, TokenBucket)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=0, # Równoległość ograniczają semafory z _limits
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=DEFAULT_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def set_limits(self, key: str, concurrency: int, requests_per_second: float, burst: int):
+        """Ustawia własne limity dla klucza (np. sklepu) zamiast domyślnych."""
+        self._limits[key] = (asyncio.Semaphore(concurrency), TokenBucket(requests_per_second, burst))
+
+    def _limits_for(self, key: str) -> tuple[asyncio.Semaphore, TokenBucket]:
+        limits = self._limits.get(key)
+        if limits is None:
+            limits = self._limits[key] = (asyncio.Semaphore(self.per_host_concurrency), TokenBucket(self.requests_per_second, self.burst))
+        return limits
+
+    async def fetch(self, url: str, headers: dict | None = None, limit_key: str | None = None) -> FetchResult:
+        """
+        Pobiera stronę z zachowaniem limitów klucza `limit_key` (domyślnie hosta z URL).
+        Błędy sieci/HTTP >= 400 rzucają wyjątek aiohttp.
+        """
+        semaphore, bucket = self._limits_for(limit_key or urlsplit(url).hostname or "")
+        async with semaphore:
+            await bucket.acquire()
+            # Drobny losowy odstęp, żeby żądania nie szły w idealnie równych odstępach
+            await asyncio.sleep(random.uniform(0, 0.25))
+            async with self._get_session().get(url, headers=headers) as response:
+                if response.status >= 400:
+                    response.raise_for_status()
+                body = await response.read()
+                return FetchResult(str(response.url), response.status, body, response.headers)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,132 @@
+"""
+Rejestr sklepów obsługiwanych przez monitorowanie produktów.
+
+Każdy sklep to ShopAdapter: rozpoznawane domeny, funkcja parsująca z łańcuchem silników
+(scrapers/extraction.py) oraz własne limity - równoległość i tempo żądań (token bucket)
+oraz liczba równoległych zadań w puli parsującej. Limity są osobne dla każdego sklepu,
+więc wolny sklep zajmuje tylko swoje "sloty" i nie blokuje skanowania pozostałych.
+
+Nowy sklep: moduł scrapers/<sklep>_scraper.py z funkcją parse_<sklep>_product(content, url, engines)
+i wywołanie register(ShopAdapter(...)) na dole tego pliku.
+"""
+import asyncio
+import functools
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+
+from scrapers import extraction, xkom_scraper
+
+class ShopAdapter:
+    def __init__(self, name: str, display_name: str, domains: tuple[str, ...], parse, engines: tuple[str, ...],
+                 canonical_host: str | None = None,
+                 concurrency: int = 4, requests_per_second: float = 2.0, burst: int = 4, parse_concurrency: int = 2):
+        self.name = name # Wartość kolumny watched_products.shop_name
+        self.display_name = display_name
+        self.domains = domains
+        self.canonical_host = canonical_host # Np. "www.x-kom.pl" - x-kom.pl i m.x-kom.pl to ta sama strona produktu
+        self.parse = parse # parse(content: bytes, url: str, engines=...) -> dict | None; musi być picklowalna (ProcessPoolExecutor)
+        self.engines = engines
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.parse_concurrency = parse_concurrency
+        self._parse_semaphore = None
+
+    def __repr__(self) -> str:
+        return f"ShopAdapter({self.name!r}, concurrency={self.concurrency}, rps={self.requests_per_second})"
+
+    def matches(self, url: str) -> bool:
+        host = (urlsplit(url).hostname or "").lower()
+        return any(host == domain or host.endswith("." + domain) for domain in self.domains)
+
+    def canonical_url(self, url: str) -> str:
+        """
+        Kanoniczna postać URL produktu (klucz watched_products.product_url): https, jeden host,
+        bez parametrów zapytania (utm_*, śledzenie z porównywarek) i fragmentu, bez końcowego "/".
+        Dzięki temu ten sam produkt dodany z różnych linków jest skanowany tylko raz.
+        """
+        parts = urlsplit(url.strip())
+        host = self.canonical_host or (parts.hostname or "").lower()
+        path = parts.path.rstrip("/") or "/"
+        return urlunsplit(("https", host, path, "", ""))
+
+    def configure(self, fetcher):
+        """Rejestruje limity sklepu we współdzielonym AsyncFetcher."""
+        fetcher.set_limits(self.name, self.concurrency, self.requests_per_second, self.burst)
+
+    async def scrape(self, fetcher, url: str, parse_executor=None, validators: dict | None = None) -> dict:
+        """
+        Pobiera stronę produktu w ramach limitów sklepu, a parsowanie HTML (CPU) wykonuje w puli `parse_executor`.
+
+        `validators` - {"etag", "last_modified", "content_hash"} z poprzedniego udanego skanu. Na ich podstawie
+        wysyłamy zapytanie warunkowe, a parsowanie pomijamy przy 304 lub niezmienionym skrócie strony.
+        Zwraca {"status": "not_modified" | "unchanged" | "parsed" | "failed", "data", "bytes",
+        "etag", "last_modified", "content_hash"}; przy "not_modified"/"unchanged" data to None
+        (dane produktu się nie zmieniły) i brak kluczy walidatorów (zostają poprzednie).
+        """
+        validators = validators or {}
+        request_headers = {}
+        if validators.get("etag"):
+            request_headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            request_headers["If-Modified-Since"] = validators["last_modified"]
+
+        try:
+            result = await fetcher.fetch(url, headers=request_headers or None, limit_key=self.name)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Błąd żądania HTTP dla {url}: {e}")
+            return {"status": "failed", "data": None, "bytes": 0}
+
+        if result.status == 304:
+            return {"status": "not_modified", "data": None, "bytes": 0}
+
+        content_hash = extraction.page_fingerprint(result.body)
+        if validators.get("content_hash") == content_hash:
+            return {"status": "unchanged", "data": None, "bytes": len(result.body)}
+
+        if self._parse_semaphore is None:
+            self._parse_semaphore = asyncio.Semaphore(self.parse_concurrency)
+        async with self._parse_semaphore:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(parse_executor, functools.partial(self.parse, result.body, url, engines=self.engines))
+        outcome = {"status": "parsed" if data else "failed", "data": data, "bytes": len(result.body)}
+        # Walidatory zapisujemy tylko po pełnym odczycie; po nieudanym je czyścimy, żeby następny skan nie został pominięty
+        complete = bool(data) and data.get("name") and data.get("price_in_cents") is not None
+        outcome["etag"] = result.headers.get("ETag") if complete else None
+        outcome["last_modified"] = result.headers.get("Last-Modified") if complete else None
+        outcome["content_hash"] = content_hash if complete else None
+        return outcome
+
+SHOPS: dict[str, ShopAdapter] = {}
+
+def register(adapter: ShopAdapter) -> ShopAdapter:
+    SHOPS[adapter.name] = adapter
+    return adapter
+
+def get_shop(shop_name: str) -> ShopAdapter | None:
+    return SHOPS.get(shop_name)
+
+def match_url(url: str) -> ShopAdapter | None:
+    """Zwraca sklep obsługujący dany URL lub None."""
+    for adapter in SHOPS.values():
+        if adapter.matches(url):
+            return adapter
+    return None
+
+def supported_shops_display() -> str:
+    return ", ".join(adapter.display_name for adapter in SHOPS.values())
+
+# --- Obsługiwane sklepy ---
+register(ShopAdapter(
+    name="xkom",
+    display_name="X-Kom",
+    domains=("x-kom.pl",),
+    parse=xkom_scraper.parse_xkom_product,
+    engines=xkom_scraper.DEFAULT_ENGINE_CHAIN,
+    canonical_host="www.x-kom.pl",
+    concurrency=4,
+    requests_per_second=2.0,
+    burst=4,
+    parse_concurrency=2,
+))
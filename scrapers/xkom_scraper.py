@@ -1,87 +1,147 @@
+import re
+
 import requests
 from bs4 import BeautifulSoup
-import re
+
+from scrapers import extraction
+
+if extraction.HAS_LXML:
+    import lxml.html
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
 
 def scrape_xkom_product(url: str) -> dict | None:
     """
     Scrapuje dane produktu (nazwa, cena, dostępność) ze strony X-Kom.
     Zwraca słownik z danymi lub None w przypadku błędu.
-    UWAGA: Selektory CSS są PRZYKŁADOWE i mogą wymagać aktualizacji!
+    Wersja synchroniczna (requests) - do testów ręcznych; bot skanuje przez scrapers.registry.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = requests.get(url, headers=HEADERS, timeout=10)
         response.raise_for_status() # Rzuci wyjątek dla kodów błędów HTTP 4xx/5xx
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        product_data = {
-            "name": None,
-            "price_str": None,
-            "availability_str": None
-        }
-
-        # --- Przykładowe selektory (DO WERYFIKACJI I DOSTOSOWANIA!) ---
-
-        # Nazwa produktu
-        # Często w tagu <h1> z określoną klasą lub atrybutem data
-        name_tag = soup.find('h1', attrs={'data-name': 'productName'})
-        if not name_tag: # Alternatywny popularny selektor
-            name_tag = soup.find('h1', class_=re.compile(r'product.*name|title', re.IGNORECASE))
-        if name_tag:
-            product_data["name"] = name_tag.get_text(strip=True)
-
-        # Cena produktu
-        # Może być w divie/spanie z klasą typu "price", "product-price" itp.
-        # X-Kom często używa dynamicznego ładowania cen, więc to może być trudne.
-        # Poniżej bardzo ogólny przykład.
-        price_tag = soup.find('div', class_=re.compile(r'price|PriceContainer', re.IGNORECASE))
-        if price_tag:
-            # Próba wyciągnięcia ceny, usuwając "zł" i inne znaki, normalizując do formatu "1234.56"
-            price_text = price_tag.get_text(separator=' ', strip=True)
-            # Prosty regex do wyciągnięcia liczby z groszami
-            price_match = re.search(r'(\d{1,3}(?:\s?\d{3})*(?:,\d{2})?)\s*zł', price_text)
-            if price_match:
-                # Normalizacja: usunięcie spacji jako separatora tysięcy, zamiana przecinka na kropkę
-                normalized_price = price_match.group(1).replace('\xa0', '').replace(' ', '').replace(',', '.')
-                product_data["price_str"] = normalized_price
-            else: # Spróbuj znaleźć cenę w meta tagu, jeśli jest
-                meta_price_tag = soup.find('meta', property='product:price:amount')
-                if meta_price_tag and meta_price_tag.get('content'):
-                    product_data["price_str"] = meta_price_tag.get('content').strip()
-
-
-        # Dostępność produktu
-        # Może być oznaczona klasą, tekstem w specyficznym kontenerze.
-        # Np. "Dostępny", "W magazynie", "Niedostępny", "Na zamówienie"
-        # To jest bardzo specyficzne dla sklepu.
-        availability_tag = soup.find('div', class_=re.compile(r'availability|stock', re.IGNORECASE))
-        if availability_tag:
-            availability_text = availability_tag.get_text(strip=True)
-            product_data["availability_str"] = availability_text
-        else: # Przykładowy fallback - szukanie tekstu
-            if soup.find(string=re.compile(r"Produkt niedostępny", re.IGNORECASE)):
-                product_data["availability_str"] = "Niedostępny"
-            elif soup.find(string=re.compile(r"Dostępny w magazynie|Dostępny od ręki", re.IGNORECASE)):
-                 product_data["availability_str"] = "Dostępny"
-            elif soup.find(string=re.compile(r"Na zamówienie|Sprawdź dostępność", re.IGNORECASE)):
-                 product_data["availability_str"] = "Na zamówienie"
+        return parse_xkom_product(response.content, url)
+    except requests.exceptions.RequestException as e:
+        print(f"Błąd żądania HTTP dla {url}: {e}")
+        return None
 
+# Selektory strony X-Kom - te same dla silnika bs4 i lxml
+# --- Przykładowe selektory (DO WERYFIKACJI I DOSTOSOWANIA!) ---
+_NAME_CLASS = re.compile(r'product.*name|title', re.IGNORECASE)
+_PRICE_CLASS = re.compile(r'price|PriceContainer', re.IGNORECASE)
+_AVAILABILITY_CLASS = re.compile(r'availability|stock', re.IGNORECASE)
+# Przykładowy fallback dostępności - szukanie tekstu na stronie
+_AVAILABILITY_TEXTS = (
+    (re.compile(r"Produkt niedostępny", re.IGNORECASE), "Niedostępny"),
+    (re.compile(r"Dostępny w magazynie|Dostępny od ręki", re.IGNORECASE), "Dostępny"),
+    (re.compile(r"Na zamówienie|Sprawdź dostępność", re.IGNORECASE), "Na zamówienie"),
+)
+
+def extract_with_bs4(content: bytes) -> dict:
+    """
+    Pierwotne selektory BeautifulSoup (html.parser) - najwolniejsze, każde find() przechodzi cały dokument.
+    UWAGA: Selektory CSS są PRZYKŁADOWE i mogą wymagać aktualizacji!
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    product_data = extraction.empty_result()
+
+    # Nazwa produktu
+    # Często w tagu <h1> z określoną klasą lub atrybutem data
+    name_tag = soup.find('h1', attrs={'data-name': 'productName'})
+    if not name_tag: # Alternatywny popularny selektor
+        name_tag = soup.find('h1', class_=_NAME_CLASS)
+    if name_tag:
+        product_data["name"] = name_tag.get_text(strip=True)
+
+    # Cena produktu
+    # Może być w divie/spanie z klasą typu "price", "product-price" itp.
+    # X-Kom często używa dynamicznego ładowania cen, więc to może być trudne.
+    price_tag = soup.find('div', class_=_PRICE_CLASS)
+    if price_tag:
+        product_data["price_str"] = extraction.normalize_price_text(price_tag.get_text(separator=' ', strip=True))
+        if not product_data["price_str"]: # Spróbuj znaleźć cenę w meta tagu, jeśli jest
+            meta_price_tag = soup.find('meta', property='product:price:amount')
+            if meta_price_tag and meta_price_tag.get('content'):
+                product_data["price_str"] = extraction.normalize_structured_price(meta_price_tag.get('content'))
+
+    # Dostępność produktu
+    # Może być oznaczona klasą, tekstem w specyficznym kontenerze.
+    availability_tag = soup.find('div', class_=_AVAILABILITY_CLASS)
+    if availability_tag:
+        product_data["availability_str"] = availability_tag.get_text(strip=True)
+    else:
+        for pattern, label in _AVAILABILITY_TEXTS:
+            if soup.find(string=pattern):
+                product_data["availability_str"] = label
+                break
+    return product_data
+
+def _lxml_text(element, separator: str = "") -> str:
+    # Odpowiednik get_text(separator, strip=True) z BeautifulSoup
+    return separator.join(text.strip() for text in element.itertext() if text.strip())
+
+def _lxml_find_by_class(tree, tag: str, pattern: re.Pattern):
+    for element in tree.iter(tag):
+        class_attr = element.get("class")
+        if class_attr and (pattern.search(class_attr) or any(pattern.search(c) for c in class_attr.split())):
+            return element
+    return None
+
+def extract_with_lxml(content: bytes) -> dict:
+    """Te same selektory co extract_with_bs4, ale na drzewie lxml (parser w C)."""
+    tree = lxml.html.fromstring(content)
+    product_data = extraction.empty_result()
+
+    name_tag = next(iter(tree.xpath('//h1[@data-name="productName"]')), None)
+    if name_tag is None:
+        name_tag = _lxml_find_by_class(tree, 'h1', _NAME_CLASS)
+    if name_tag is not None:
+        product_data["name"] = _lxml_text(name_tag)
+
+    price_tag = _lxml_find_by_class(tree, 'div', _PRICE_CLASS)
+    if price_tag is not None:
+        product_data["price_str"] = extraction.normalize_price_text(_lxml_text(price_tag, ' '))
+        if not product_data["price_str"]:
+            meta_price = tree.xpath('//meta[@property="product:price:amount"]/@content')
+            if meta_price and meta_price[0].strip():
+                product_data["price_str"] = extraction.normalize_structured_price(meta_price[0])
+
+    availability_tag = _lxml_find_by_class(tree, 'div', _AVAILABILITY_CLASS)
+    if availability_tag is not None:
+        product_data["availability_str"] = _lxml_text(availability_tag)
+    else:
+        for pattern, label in _AVAILABILITY_TEXTS:
+            if any(pattern.search(text) for text in tree.itertext()):
+                product_data["availability_str"] = label
+                break
+    return product_data
+
+# Dostępne silniki; łańcuch domyślny: dane strukturalne, a selektory tylko dla brakujących pól
+ENGINES = {"structured": extraction.extract_structured, "bs4": extract_with_bs4}
+if extraction.HAS_LXML:
+    ENGINES["lxml"] = extract_with_lxml
+DEFAULT_ENGINE_CHAIN = ("structured", "lxml" if extraction.HAS_LXML else "bs4")
+
+def parse_xkom_product(content: bytes, url: str = "", engines: tuple[str, ...] = DEFAULT_ENGINE_CHAIN) -> dict | None:
+    """
+    Wyciąga dane produktu z HTML strony X-Kom, używając silników `engines` (nazwy z ENGINES) po kolei.
+    Zwraca słownik z danymi lub None, jeśli nie znaleziono niczego.
+    """
+    try:
+        product_data = extraction.run_engines(content, [ENGINES[engine] for engine in engines], url)
+        product_data["price_in_cents"] = _parse_price_to_cents(product_data["price_str"])
 
         # Jeśli kluczowe dane nie zostały znalezione, możemy uznać scrapowanie za nieudane
-        if not product_data["name"] or product_data.get("price_in_cents") is None: # Sprawdzamy price_in_cents
+        if not product_data["name"] or product_data["price_in_cents"] is None:
             print(f"Scraping X-Kom: Nie udało się znaleźć nazwy lub ceny (price_in_cents) dla {url}")
             # Zwrócenie częściowych danych, jeśli są, lub None, jeśli nic kluczowego nie ma.
-            if product_data["name"] or product_data.get("price_in_cents") is not None or product_data["availability_str"]:
+            if product_data["name"] or product_data["price_in_cents"] is not None or product_data["availability_str"]:
                  return product_data # Zwróć to co masz
             return None
 
         return product_data
 
-    except requests.exceptions.RequestException as e:
-        print(f"Błąd żądania HTTP dla {url}: {e}")
-        return None
     except Exception as e:
         print(f"Nieoczekiwany błąd podczas scrapowania {url}: {e}")
         return None
@@ -94,7 +154,7 @@ def _parse_price_to_cents(price_text: str) -> int | None:
         # Usuń "zł", spacje (w tym non-breaking space \xa0), zamień przecinek na kropkę
         cleaned_price = price_text.lower().replace('zł', '').replace('\xa0', '').replace(' ', '').replace(',', '.')
         price_float = float(cleaned_price)
-        return int(price_float * 100)
+        return int(round(price_float * 100)) # round: 19.99 * 100 == 1998.9999...
     except ValueError:
         print(f"Nie udało się sparsować ceny '{price_text}' na grosze.")
         return None
@@ -133,5 +193,3 @@ if __name__ == '__main__':
     # np. test_url_error = "https://www.x-kom.pl/nieistniejacyprodukt123"
     # data_error = scrape_xkom_product(test_url_error)
     # print(f"Wynik dla błędnego URL: {data_error}")
-
-```
@@ -0,0 +1,11 @@
+import pytest
+
+import database
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Moduł database podpięty pod pustą bazę w katalogu tymczasowym (bez migracji)."""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "bot_config.db"))
+    database.server_config_cache.clear() # Cache jest globalny - bez tego test widziałby konfigurację z poprzedniej bazy
+    yield database
+    database.close_pool()
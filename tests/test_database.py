@@ -0,0 +1,91 @@
+import threading
+
+import database
+import leveling
+
+def _migrate_to(version: int):
+    """Wykonuje migracje do `version` włącznie - baza w stanie sprzed późniejszych zmian schematu."""
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    for migration in database.MIGRATIONS[:version]:
+        migration(cursor)
+    cursor.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    conn.close()
+
+def _execute(sql: str, params=()) -> list[tuple]:
+    conn = database.get_connection()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+def test_subscriptions_migration_merges_legacy_url_variants(db):
+    _migrate_to(3)
+    _execute("""
+    INSERT INTO watched_products (guild_id, user_id_who_added, product_url, shop_name) VALUES
+        (1, 10, 'https://www.x-kom.pl/p/123-karta.html', 'xkom'),
+        (2, 20, 'http://x-kom.pl/p/123-karta.html/?utm_source=ceneo#opis', 'xkom')
+    """)
+    db.init_db()
+
+    products = _execute("SELECT id, product_url FROM watched_products")
+    assert [url for _, url in products] == ["https://www.x-kom.pl/p/123-karta.html"]
+    subscriptions = _execute("SELECT watched_product_id, guild_id, user_id FROM product_subscriptions ORDER BY guild_id")
+    assert subscriptions == [(products[0][0], 1, 10), (products[0][0], 2, 20)]
+
+    # Ponowne śledzenie dowolnym wariantem linku trafia w ten sam produkt
+    product_id, _ = db.subscribe_to_product(3, 30, "https://www.x-kom.pl/p/123-karta.html", "xkom")
+    assert product_id == products[0][0]
+
+def _add_product(url: str = "https://www.x-kom.pl/p/1-produkt.html") -> int:
+    product_id, _ = database.subscribe_to_product(1, 10, url, "xkom")
+    return product_id
+
+def _scan(product_id: int, scanned_at: int, price_cents: int | None, availability_str: str | None) -> dict:
+    return {"product_id": product_id, "scanned_at": scanned_at, "ok": True, "name": "Produkt",
+            "price_cents": price_cents, "availability_str": availability_str}
+
+def test_availability_id_not_cached_after_rollback(db, monkeypatch):
+    db.init_db()
+    product_id = _add_product()
+
+    def failing_summary(*args):
+        raise RuntimeError("przerwany zapis")
+    with monkeypatch.context() as patch:
+        patch.setattr(database, "_update_report_summary", failing_summary)
+        try:
+            db.record_product_scan_results([_scan(product_id, 1000, 100, "Nowy stan")])
+        except RuntimeError:
+            pass
+    assert "Nowy stan" not in database._availability_ids.get(db.DB_NAME, {})
+
+    # ID z wycofanej transakcji dostaje inny tekst - historia musi wskazywać właściwe etykiety
+    db.record_product_scan_results([_scan(product_id, 2000, 100, "Inny stan")])
+    db.record_product_scan_results([_scan(product_id, 3000, 100, "Nowy stan")])
+    labels = _execute("""
+    SELECT a.label FROM price_history p JOIN availability_states a ON a.id = p.availability_id ORDER BY p.scan_date
+    """)
+    assert labels == [("Inny stan",), ("Nowy stan",)]
+
+def test_concurrent_grant_xp_both_land(db):
+    db.init_db()
+    barrier = threading.Barrier(2)
+    results = []
+
+    def grant(xp_amount: int):
+        barrier.wait()
+        results.append(db.grant_xp(1, 10, xp_amount))
+    threads = [threading.Thread(target=grant, args=(xp_amount,)) for xp_amount in (60, 50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert db.get_user_activity(1, 10)["xp"] == 110
+    # Przyznania wykonały się po kolei: drugie widzi jako stary stan wynik pierwszego
+    first, second = sorted(results, key=lambda result: result[0])
+    assert first[0] == 0 and second[0] == first[1] and second[1] == 110
+    assert (first[2], second[3]) == (0, leveling.get_level_from_xp(110)) == (0, 1)
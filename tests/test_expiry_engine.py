@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import expiry_engine
+
+def _run(scenario):
+    asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+
+def test_fires_in_deadline_order_and_wakes_for_earlier_deadline():
+    async def scenario():
+        fired = []
+        async def loader():
+            return {"polls": [time.time() + 0.3]}
+        engine = expiry_engine.ExpiryEngine(loader)
+        for kind in ("polls", "giveaways", "timed_roles"):
+            engine.register(kind, lambda now, kind=kind: _record(fired, kind))
+        engine.start()
+        await asyncio.sleep(0.05) # Silnik śpi już do terminu ankiety
+        engine.schedule("giveaways", time.time() + 0.15)
+        engine.schedule("timed_roles", time.time() + 0.05) # Wcześniejszy termin musi skrócić sen
+        await asyncio.sleep(0.45)
+        await engine.close()
+        assert fired == ["timed_roles", "giveaways", "polls"]
+        assert engine.pending() == 0
+    _run(scenario)
+
+async def _record(fired: list, kind: str):
+    fired.append(kind)
+
+def test_same_deadline_is_one_wakeup():
+    engine = expiry_engine.ExpiryEngine(None)
+    deadline = time.time() + 60
+    for _ in range(3):
+        engine.schedule("punishments", deadline)
+    engine.schedule("polls", deadline)
+    assert engine.pending() == 2 # Handler każdego rodzaju i tak obsługuje wszystkie wygasłe wpisy naraz
+
+def test_failed_handler_is_retried():
+    async def scenario():
+        calls = []
+        async def flaky(now):
+            calls.append(now)
+            if len(calls) == 1:
+                raise RuntimeError("baza niedostępna")
+        async def loader():
+            return {"timed_roles": [time.time()]}
+        engine = expiry_engine.ExpiryEngine(loader)
+        engine.register("timed_roles", flaky)
+        original_delay, expiry_engine.RETRY_DELAY_SECONDS = expiry_engine.RETRY_DELAY_SECONDS, 0.05
+        try:
+            engine.start()
+            await asyncio.sleep(0.2)
+        finally:
+            expiry_engine.RETRY_DELAY_SECONDS = original_delay
+            await engine.close()
+        assert len(calls) == 2 and engine.fired == {"timed_roles": 1}
+    _run(scenario)
+
+def test_close_cancels_pending_deadlines():
+    async def scenario():
+        fired = []
+        async def loader():
+            return {"polls": [time.time() + 0.1]}
+        engine = expiry_engine.ExpiryEngine(loader)
+        engine.register("polls", lambda now: _record(fired, "polls"))
+        engine.start()
+        await asyncio.sleep(0.02)
+        await engine.close()
+        assert not engine.is_running()
+        await asyncio.sleep(0.15)
+        assert fired == []
+    _run(scenario)
+
+def test_cancelled_timed_role_leaves_nothing_to_expire(db):
+    # Termin w kopcu nie jest usuwany przy anulowaniu - handler i tak pyta bazę, więc dostaje pustą listę
+    db.init_db()
+    now = int(time.time())
+    kept = db.add_timed_role(1, 10, 100, now + 60)
+    cancelled = db.add_timed_role(1, 11, 100, now + 30)
+    db.remove_timed_role(cancelled)
+    assert db.get_pending_expiry_deadlines()["timed_roles"] == [now + 60]
+    assert db.get_expired_roles(now + 45) == []
+    assert [row[0] for row in db.get_expired_roles(now + 60)] == [kept]
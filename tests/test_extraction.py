@@ -0,0 +1,27 @@
+import pathlib
+
+import pytest
+
+from scrapers import extraction, xkom_scraper
+
+FIXTURES_DIR = pathlib.Path(__file__).parent.parent / "scrapers" / "fixtures"
+
+@pytest.mark.parametrize("value, expected", [
+    ("2899.00", "2899.00"), ("1,299.00", "1299.00"), ("1,234,567.89", "1234567.89"),
+    ("1299,00", "1299.00"), ("1\xa0299.00", "1299.00"), ("", None),
+])
+def test_normalize_structured_price(value, expected):
+    assert extraction.normalize_structured_price(value) == expected
+
+def test_structured_price_with_thousands_separator():
+    content = (FIXTURES_DIR / "xkom_product_jsonld_thousands.html").read_bytes()
+    assert extraction.extract_structured(content)["price_str"] == "12999.00"
+
+def test_meta_price_with_thousands_separator():
+    content = b'<html><head><meta property="product:price:amount" content="1,299.00"></head><body></body></html>'
+    assert extraction.extract_structured(content)["price_str"] == "1299.00"
+
+@pytest.mark.parametrize("engine", list(xkom_scraper.ENGINES))
+def test_engines_agree_on_thousands_fixture(engine):
+    content = (FIXTURES_DIR / "xkom_product_jsonld_thousands.html").read_bytes()
+    assert xkom_scraper.parse_xkom_product(content, engines=(engine,))["price_in_cents"] == 1299900
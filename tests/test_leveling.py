@@ -0,0 +1,54 @@
+import pytest
+
+import leveling
+
+# Wartości oczekiwane pochodzą z poprzedniej, iteracyjnej implementacji
+# (i zgadzają się z ręcznie wyliczonymi komentarzami w starych testach).
+
+@pytest.mark.parametrize("level, expected", [(0, 0), (1, 100), (2, 255), (3, 475)])
+def test_total_xp_for_level(level, expected):
+    assert leveling.total_xp_for_level(level) == expected
+
+@pytest.mark.parametrize("xp, expected", [
+    (0, 0), (50, 0), (99, 0), (100, 1), (150, 1), (254, 1), (255, 2), (474, 2), (475, 3), (476, 3), (1000, 4),
+])
+def test_get_level_from_xp(xp, expected):
+    assert leveling.get_level_from_xp(xp) == expected
+
+def test_xp_for_level_up():
+    assert [leveling.xp_for_level_up(level) for level in (1, 2, 3)] == [100, 155, 220]
+    assert sum(leveling.xp_for_level_up(level) for level in (1, 2, 3)) == leveling.total_xp_for_level(3)
+
+# (current_xp, current_level) -> (xp_needed, next_gate)
+EXPECTED_TO_NEXT = {
+    (0, 0): (100, 100), (99, 0): (1, 100), (100, 1): (155, 255), (254, 1): (1, 255),
+    (255, 2): (220, 475), (474, 2): (1, 475), (475, 3): (295, 770), (769, 3): (1, 770),
+    (770, 4): (380, 1150), (1149, 4): (1, 1150), (1150, 5): (475, 1625), (1624, 5): (1, 1625),
+    (1625, 6): (580, 2205), (2204, 6): (1, 2205), (2205, 7): (695, 2900), (2899, 7): (1, 2900),
+    (2900, 8): (820, 3720), (3719, 8): (1, 3720), (3720, 9): (955, 4675), (4674, 9): (1, 4675),
+    (4675, 10): (1100, 5775), (5774, 10): (1, 5775), (5775, 11): (1255, 7030), (7029, 11): (1, 7030),
+    (7030, 12): (1420, 8450), (8449, 12): (1, 8450), (8450, 13): (1595, 10045), (10044, 13): (1, 10045),
+    (10045, 14): (1780, 11825), (11824, 14): (1, 11825), (11825, 15): (1975, 13800), (13799, 15): (1, 13800),
+    (13800, 16): (2180, 15980), (15979, 16): (1, 15980), (15980, 17): (2395, 18375), (18374, 17): (1, 18375),
+    (18375, 18): (2620, 20995), (20994, 18): (1, 20995), (20995, 19): (2855, 23850), (23849, 19): (1, 23850),
+    (23850, 20): (3100, 26950),
+}
+
+@pytest.mark.parametrize("xp, level", list(EXPECTED_TO_NEXT))
+def test_xp_to_next_level(xp, level):
+    assert leveling.xp_to_next_level(xp, level) == EXPECTED_TO_NEXT[(xp, level)]
+    assert leveling.get_level_from_xp(xp) == level
+
+def test_closed_form_matches_running_sum():
+    # Postać zamknięta vs. sumowanie poziom po poziomie, także poza tablicą progów
+    running_total = 0
+    for level in range(1, leveling.MAX_PRECOMPUTED_LEVEL + 50):
+        running_total += leveling.xp_for_level_up(level)
+        assert leveling.total_xp_for_level(level) == running_total, level
+        assert leveling.get_level_from_xp(running_total - 1) == level - 1, level
+        assert leveling.get_level_from_xp(running_total) == level, level
+
+def test_levels_for_xp_array_matches_single():
+    top = leveling.LEVEL_THRESHOLDS[-1]
+    sample_xps = [-5, 0, 99, 100, 254, 255, 10**6, top - 1, top, 10**12]
+    assert leveling.levels_for_xp_array(sample_xps) == [leveling.get_level_from_xp(xp) for xp in sample_xps]
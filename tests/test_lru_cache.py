@@ -0,0 +1,42 @@
+from utils.lru_cache import LRUCache
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1 # "a" staje się najświeższe
+    cache.put("c", 3)
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (3, 0)
+
+def test_setdefault_keeps_value_written_during_load():
+    cache = LRUCache(10)
+    cache.put(1, "zapis") # Zapis (write-through) wyprzedził wolniejszy odczyt z bazy
+    assert cache.setdefault(1, "odczyt") == "zapis"
+    assert cache.get(1) == "zapis"
+
+def test_setdefault_skips_load_that_raced_invalidation():
+    cache = LRUCache(10)
+    version = cache.version # Odczyt z bazy zaczyna się...
+    cache.invalidate(1)     # ...a w tym czasie inny proces zapisuje i unieważnia wpis
+    assert cache.setdefault(1, "stary odczyt", version) == "stary odczyt"
+    assert 1 not in cache
+
+    version = cache.version
+    assert cache.setdefault(1, "świeży odczyt", version) == "świeży odczyt"
+    assert cache.get(1) == "świeży odczyt"
+
+def test_clear_also_guards_pending_loads():
+    cache = LRUCache(10)
+    version = cache.version
+    cache.clear()
+    cache.setdefault(1, "stary odczyt", version)
+    assert len(cache) == 0
+
+def test_server_config_write_through_and_invalidation(db):
+    db.init_db()
+    assert db.get_server_config(1) is None # Brak konfiguracji też jest trzymany w cache
+    db.update_server_config(1, welcome_message_content="Witaj")
+    assert db.get_server_config(1).welcome_message_content == "Witaj"
+    db.server_config_cache.invalidate(1) # Zapis z innego procesu tylko unieważnia wpis
+    assert db.get_server_config(1).welcome_message_content == "Witaj"
@@ -0,0 +1,88 @@
+import database
+
+DAY = 86400
+
+def _product(db, url: str = "https://www.x-kom.pl/p/1-produkt.html") -> int:
+    db.init_db()
+    product_id, _ = db.subscribe_to_product(1, 10, url, "xkom")
+    return product_id
+
+def _scan(product_id: int, scanned_at: int, price_cents: int | None, availability_str: str | None = "Dostępny", ok: bool = True) -> dict:
+    return {"product_id": product_id, "scanned_at": scanned_at, "ok": ok, "name": "Produkt",
+            "price_cents": price_cents, "availability_str": availability_str}
+
+def _points(product_id: int) -> list[tuple]:
+    conn = database.get_connection()
+    try:
+        return conn.execute("""
+        SELECT p.scan_date, p.last_seen_at, p.price_cents, a.label FROM price_history p
+        LEFT JOIN availability_states a ON a.id = p.availability_id
+        WHERE p.watched_product_id = ? ORDER BY p.scan_date
+        """, (product_id,)).fetchall()
+    finally:
+        conn.close()
+
+def test_identical_scans_extend_one_change_point(db):
+    product_id = _product(db)
+    for scanned_at in (1000, 2000, 3000, 4000):
+        db.record_product_scan_results([_scan(product_id, scanned_at, 9900)])
+    assert _points(product_id) == [(1000, 4000, 9900, "Dostępny")]
+
+    db.record_product_scan_results([_scan(product_id, 5000, None, ok=False)]) # Błąd skanera to nie stan produktu
+    db.record_product_scan_results([_scan(product_id, 6000, 9900, "Na zamówienie")])
+    db.record_product_scan_results([_scan(product_id, 7000, 9900, "Na zamówienie")])
+    db.record_product_scan_results([_scan(product_id, 8000, 9900)]) # Powrót do poprzedniego stanu to nowy punkt
+    assert _points(product_id) == [
+        (1000, 4000, 9900, "Dostępny"), (6000, 7000, 9900, "Na zamówienie"), (8000, 8000, 9900, "Dostępny"),
+    ]
+
+def _rollups(product_id: int) -> list[tuple]:
+    conn = database.get_connection()
+    try:
+        return conn.execute("""
+        SELECT bucket_seconds, bucket_start, min_price_cents, max_price_cents, last_price_cents, last_seen_at
+        FROM price_history_rollup WHERE watched_product_id = ? ORDER BY bucket_seconds, bucket_start
+        """, (product_id,)).fetchall()
+    finally:
+        conn.close()
+
+def _seed_points(product_id: int, points: list[tuple[int, int, int]]):
+    conn = database.get_connection()
+    try:
+        conn.executemany("INSERT INTO price_history (watched_product_id, scan_date, last_seen_at, price_cents) VALUES (?, ?, ?, ?)",
+                         [(product_id, scan_date, last_seen_at, price) for scan_date, last_seen_at, price in points])
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_rollup_when_point_crosses_retention_boundary(db, tmp_path, monkeypatch):
+    cutoff = 400 * DAY # Granica retencji punktów przy pierwszym uruchomieniu
+    first_run = cutoff + database.PRICE_HISTORY_RAW_RETENTION_DAYS * DAY + 600
+    hour = cutoff - 3600
+    points = [
+        (hour, hour + 600, 10000),           # Starszy niż granica - do agregatu od razu
+        (hour + 1200, cutoff + 500, 8000),   # Ta sama godzina, ale potwierdzany jeszcze po granicy - zostaje
+        (cutoff + 600, cutoff + 5 * DAY, 12000), # Stan bieżący
+    ]
+    product_id = _product(db)
+    _seed_points(product_id, points)
+
+    assert db.downsample_price_history(first_run) == (1, 0)
+    assert _rollups(product_id) == [(3600, hour, 10000, 10000, 10000, hour + 600)]
+    assert db.downsample_price_history(first_run + DAY) == (1, 0) # Drugi punkt przekracza granicę dzień później
+    rolled_in_two_runs = _rollups(product_id)
+    assert rolled_in_two_runs == [(3600, hour, 8000, 10000, 8000, cutoff + 500)]
+    assert [point[0] for point in _points(product_id)] == [cutoff + 600]
+
+    # Ten sam wynik co jednorazowe zagregowanie tych samych punktów
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "jednorazowo.db"))
+    product_id = _product(db)
+    _seed_points(product_id, points)
+    db.downsample_price_history(first_run + DAY)
+    assert _rollups(product_id) == rolled_in_two_runs
+
+    # Po okresie retencji godzin agregat przechodzi do dziennego z tymi samymi wartościami
+    # (stan bieżący też jest już wtedy stary i trafia do agregatu swojego dnia)
+    db.downsample_price_history(first_run + DAY + database.PRICE_HISTORY_HOURLY_RETENTION_DAYS * DAY)
+    assert _rollups(product_id) == [(DAY, hour // DAY * DAY, 8000, 10000, 8000, cutoff + 500),
+                                    (DAY, cutoff, 12000, 12000, 12000, cutoff + 5 * DAY)]
@@ -0,0 +1,64 @@
+import asyncio
+import random
+import sqlite3
+
+import ranking
+
+def _ordered_by_sql(rows: dict) -> list[dict]:
+    """Ranking z tym samym ORDER BY co database.get_server_leaderboard - punkt odniesienia."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE user_activity (user_id INTEGER PRIMARY KEY, xp INTEGER, level INTEGER)")
+    conn.executemany("INSERT INTO user_activity VALUES (?, ?, ?)", [(user_id, xp, level) for user_id, (xp, level) in rows.items()])
+    ordered = conn.execute("SELECT user_id, xp, level FROM user_activity WHERE xp > 0 ORDER BY xp DESC, level DESC, user_id ASC").fetchall()
+    conn.close()
+    return [{"user_id": user_id, "xp": xp, "level": level} for user_id, xp, level in ordered]
+
+def test_incremental_updates_match_order_by():
+    rng = random.Random(7)
+    # Mało różnych wartości XP, żeby było dużo remisów (rozstrzyga poziom, potem user_id)
+    rows = {user_id: (rng.choice([0, 100, 100, 250, 500]), rng.randint(0, 3)) for user_id in range(1, 301)}
+    guild_ranking = ranking.GuildRanking((user_id, xp, level) for user_id, (xp, level) in rows.items())
+    guild_ranking.top() # Gotowe top-N musi się unieważniać przy zmianach w czołówce
+
+    for _ in range(2000):
+        user_id = rng.randint(1, 350) # Także użytkownicy spoza rankingu
+        xp = rng.choice([0, 100, 250, 500, rng.randint(0, 1000)])
+        level = rng.randint(0, 3)
+        rows[user_id] = (xp, level)
+        guild_ranking.update(user_id, xp, level)
+
+    expected = _ordered_by_sql(rows)
+    assert len(guild_ranking) == len(expected)
+    assert guild_ranking.page(len(expected)) == expected
+    assert guild_ranking.top() == expected[:ranking.TOP_SNAPSHOT_SIZE]
+    assert guild_ranking.page(10, 95) == expected[95:105] # Strona na granicy gotowego top-N
+    for position, entry in enumerate(expected, start=1):
+        assert guild_ranking.rank(entry["user_id"]) == (position, len(expected))
+        assert guild_ranking.stats(entry["user_id"]) == (entry["xp"], entry["level"])
+    unranked = next(user_id for user_id, (xp, _) in rows.items() if xp == 0)
+    assert guild_ranking.rank(unranked) is None
+
+def test_tie_order():
+    guild_ranking = ranking.GuildRanking([(3, 100, 1), (1, 100, 1), (2, 100, 2)])
+    assert [entry["user_id"] for entry in guild_ranking.page()] == [2, 1, 3]
+    guild_ranking.update(3, 100, 2)
+    assert [entry["user_id"] for entry in guild_ranking.page()] == [2, 3, 1]
+
+def test_index_loads_once_and_applies_overlay():
+    loads = []
+
+    async def load_rows(guild_id):
+        loads.append(guild_id)
+        await asyncio.sleep(0)
+        return [(1, 100, 1), (2, 50, 0)]
+
+    async def scenario():
+        index = ranking.RankingIndex(load_rows, overlay=lambda guild_id: [(2, 300, 2)], max_guilds=1)
+        first, second = await asyncio.gather(index.get(10), index.get(10))
+        assert first is second and loads == [10]
+        assert first.rank(2) == (1, 2) # Świeższe XP z bufora wygrywa z bazą
+        await index.get(20) # max_guilds=1 - serwer 10 wypada z pamięci
+        await index.get(10)
+        assert loads == [10, 20, 10]
+
+    asyncio.run(scenario())
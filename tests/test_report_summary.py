@@ -0,0 +1,41 @@
+import time
+
+HOUR = 3600
+
+def _scan(product_id: int, scanned_at: int, price_cents: int, availability_str: str = "Dostępny") -> dict:
+    return {"product_id": product_id, "scanned_at": scanned_at, "ok": True, "name": "Produkt",
+            "price_cents": price_cents, "availability_str": availability_str}
+
+def _products(db, count: int) -> list[int]:
+    db.init_db()
+    return [db.subscribe_to_product(1, 10, f"https://www.x-kom.pl/p/{n}-produkt.html", "xkom")[0] for n in range(count)]
+
+def test_summary_tracks_window_open_and_current_state(db):
+    now = int(time.time())
+    dropped, unchanged, restocked = _products(db, 3)
+    for hours_ago, price in ((30, 10000), (20, 9000), (1, 9000)):
+        db.record_product_scan_results([_scan(dropped, now - hours_ago * HOUR, price)])
+    for hours_ago in (30, 20, 1):
+        db.record_product_scan_results([_scan(unchanged, now - hours_ago * HOUR, 5000)])
+    db.record_product_scan_results([_scan(restocked, now - 30 * HOUR, 2000, "Niedostępny")])
+    db.record_product_scan_results([_scan(restocked, now - 2 * HOUR, 2000, "Dostępny")])
+
+    changes = {change["product_id"]: change for change in db.get_product_changes_for_report(1)}
+    assert set(changes) == {dropped, restocked} # Stan na początku okna = stan bieżący - brak zmiany
+    assert (changes[dropped]["old_price_cents"], changes[dropped]["new_price_cents"]) == (10000, 9000)
+    assert changes[dropped]["changed_at"] == now - 20 * HOUR # Skan bez zmian nie przesuwa czasu zmiany
+    assert (changes[restocked]["old_availability_str"], changes[restocked]["new_availability_str"]) == ("Niedostępny", "Dostępny")
+
+    drops = db.get_top_price_drops(1)
+    assert [drop["product_id"] for drop in drops] == [dropped]
+    assert round(drops[0]["drop_percentage"], 1) == 10.0
+    assert db.get_product_changes_for_report(2) == [] # Inny serwer nie śledzi tych produktów
+
+def test_window_moves_past_old_change(db):
+    now = int(time.time())
+    product_id, = _products(db, 1)
+    db.record_product_scan_results([_scan(product_id, now - 50 * HOUR, 10000)])
+    db.record_product_scan_results([_scan(product_id, now - 40 * HOUR, 9000)])
+    db.record_product_scan_results([_scan(product_id, now - HOUR, 9000)])
+    # Zmiana sprzed 40h jest poza oknem 24h - początek okna ma już nową cenę
+    assert db.get_product_changes_for_report(1) == []
@@ -0,0 +1,51 @@
+import collections
+import random
+
+from utils.state_store import CooldownTable, SpamRing
+
+def test_cooldown_matches_unbounded_dict():
+    rng = random.Random(5)
+    table = CooldownTable(window_seconds=60)
+    reference = {} # Dawny, nieograniczony słownik ostatnich akcji
+    now = 0.0
+    for _ in range(5000):
+        now += rng.uniform(0, 3)
+        key = (1, rng.randint(1, 80))
+        expected = key not in reference or now - reference[key] >= 60
+        if expected:
+            reference[key] = now
+        assert table.try_acquire(key, now) == expected
+    # W pamięci zostają tylko klucze aktywne w oknie
+    assert len(table) == sum(1 for last in reference.values() if now - last < 60)
+
+def test_cooldown_max_entries_drops_oldest():
+    table = CooldownTable(window_seconds=60, max_entries=3)
+    for user_id in range(5):
+        assert table.try_acquire(user_id, now=float(user_id))
+    assert len(table) == 3 and table.evicted == 2
+    assert table.try_acquire(0, now=5.0) # Wyrzucony wpis nie blokuje (jak po upływie okna)
+    assert not table.try_acquire(4, now=5.0)
+
+def test_spam_ring_matches_last_messages_reference():
+    rng = random.Random(9)
+    ring = SpamRing(size=3, window_seconds=300)
+    history = {} # klucz -> (ostatnie 3 treści, czas ostatniej wiadomości)
+    now = 0.0
+    for _ in range(5000):
+        now += rng.uniform(0, 40)
+        key = (1, rng.randint(1, 20))
+        content = rng.choice(["hej", "hej", "spam", "co tam"])
+        recent, last_at = history.get(key, (collections.deque(maxlen=3), None))
+        if last_at is not None and now - last_at >= 300:
+            recent = collections.deque(maxlen=3) # Po okresie ciszy historia zaczyna się od nowa
+        recent.append(content)
+        history[key] = (recent, now)
+        assert ring.push(key, content, now) == (len(recent) == 3 and len(set(recent)) == 1)
+
+def test_spam_ring_forgets_inactive_users():
+    ring = SpamRing(size=2, window_seconds=10, max_entries=100)
+    ring.push("a", "x", now=0.0)
+    ring.push("b", "x", now=5.0)
+    ring.push("c", "x", now=12.0) # "a" nieaktywny dłużej niż okno
+    assert len(ring) == 2 and ring.evicted == 1
+    assert not ring.push("a", "x", now=13.0) # Pierwsza wiadomość po przerwie nie jest powtórzeniem
@@ -0,0 +1,42 @@
+import random
+import re
+
+import pytest
+
+from utils.word_filter import BannedWordMatcher
+
+def _baseline_matches(words, text: str) -> set[str]:
+    """Dawna pętla z on_message: osobne re.search(r"(?i)\\bsłowo\\b") dla każdego słowa."""
+    return {word.lower() for word in words if re.search(r"(?i)\b" + re.escape(word) + r"\b", text)}
+
+@pytest.mark.parametrize("text, expected", [
+    ("Mam KOTA", None),         # "kot" nie jest osobnym słowem
+    ("Zjadłem kotlet", "kotlet"), # Słowo będące przedłużeniem innego (kot -> kotlet)
+    ("kot!", "kot"),
+    ("to jest a.b test", "a.b"),
+    ("axb", None),              # Kropka nie jest wildcardem
+    ("PIES i kot", "pies"),
+    ("", None),
+])
+def test_examples(text, expected):
+    assert BannedWordMatcher(["kot", "kotlet", "pies", "a.b"]).search(text) == expected
+
+def test_empty_list_matches_nothing():
+    matcher = BannedWordMatcher([])
+    assert not matcher and matcher.search("cokolwiek") is None
+
+def test_matches_baseline_loop():
+    rng = random.Random(3)
+    alphabet = "akotlśę.-"
+    # Małe alfabety dają dużo słów będących prefiksami innych i dużo trafień w tekście
+    words = {"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 5))) for _ in range(60)}
+    words |= {"kot", "kotlet", "ko", "k"}
+    matcher = BannedWordMatcher(words)
+    for _ in range(3000):
+        text = "".join(rng.choice(alphabet.upper() + alphabet + " !") for _ in range(rng.randint(0, 25)))
+        expected = _baseline_matches(words, text)
+        found = matcher.search(text)
+        if expected:
+            assert found in expected, text
+        else:
+            assert found is None, text
@@ -0,0 +1,72 @@
+import collections
+import threading
+
+class LRUCache:
+    """
+    Ograniczony rozmiarem cache z wyrzucaniem najdawniej używanych wpisów (LRU).
+    Bezpieczny wątkowo - funkcje bazy danych działają w wątkach pisarza i czytelników.
+    """
+    __slots__ = ("maxsize", "hits", "misses", "version", "_data", "_lock")
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.version = 0 # Zwiększane przy każdym invalidate()
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Wstawia lub nadpisuje wpis (używane przez zapisy - write-through)."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def setdefault(self, key, value, version: int | None = None):
+        """
+        Wstawia wpis tylko, jeśli go nie ma, i zwraca wartość z cache.
+        Używane przy wczytywaniu z bazy: jeśli w międzyczasie zapis wstawił świeższą wartość,
+        wynik odczytu (potencjalnie nieaktualny) jej nie nadpisze. Jeśli podano `version`
+        (odczytane przed zapytaniem do bazy), a od tego czasu było invalidate(), wartość nie trafia do cache.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+            if version is not None and version != self.version:
+                return value
+            self._data[key] = value
+            self._evict()
+            return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self.version += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
@@ -0,0 +1,105 @@
+"""
+Ograniczone rozmiarem i czasem magazyny stanu dla on_message (cooldown XP, wykrywanie powtórzeń).
+
+Oba magazyny to zwykły dict w kolejności ostatniego dotknięcia klucza (usunięcie i ponowne wstawienie
+przenosi klucz na koniec), więc najstarsze wpisy są zawsze na początku. Przy każdym zapisie
+zdejmujemy z początku wpisy starsze niż okno - koszt amortyzowany O(1), bez osobnego zadania sprzątającego.
+Twardy limit `max_entries` chroni przed nagłym napływem nowych użytkowników. Pamięć procesu
+zależy więc od liczby aktywnych użytkowników w oknie, a nie od wszystkich kiedykolwiek widzianych.
+"""
+import sys
+import time
+
+class CooldownTable:
+    """Ostatni moment akcji per klucz (np. (guild_id, user_id)) z oknem `window_seconds`."""
+    __slots__ = ("window_seconds", "max_entries", "evicted", "_last")
+
+    def __init__(self, window_seconds: float, max_entries: int = 100000):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.evicted = 0
+        self._last = {} # klucz -> timestamp; kolejność = kolejność ostatniej akcji
+
+    def try_acquire(self, key, now: float | None = None) -> bool:
+        """True i zapis nowego czasu, jeśli od ostatniej akcji minęło okno; inaczej False (cooldown trwa)."""
+        now = time.time() if now is None else now
+        last = self._last.get(key)
+        if last is not None and now - last < self.window_seconds:
+            return False
+        if last is not None:
+            del self._last[key]
+        self._last[key] = now
+        self._evict(now)
+        return True
+
+    def _evict(self, now: float):
+        # Wpis starszy niż okno niczego nie blokuje - jest równoważny brakowi wpisu
+        while self._last:
+            oldest_key = next(iter(self._last))
+            if now - self._last[oldest_key] < self.window_seconds and len(self._last) <= self.max_entries:
+                break
+            del self._last[oldest_key]
+            self.evicted += 1
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def memory_stats(self) -> dict:
+        return {"entries": len(self._last), "evicted": self.evicted,
+                "approx_bytes": sys.getsizeof(self._last) + len(self._last) * _KEY_AND_FLOAT_BYTES}
+
+class _Ring:
+    __slots__ = ("hashes", "position", "filled", "updated_at")
+
+    def __init__(self, size: int):
+        self.hashes = [0] * size
+        self.position = 0
+        self.filled = 0
+        self.updated_at = 0.0
+
+class SpamRing:
+    """
+    Ostatnie `size` wiadomości per (guild_id, user_id) jako skróty treści (hash), nie pełne teksty.
+    Historia użytkownika nieaktywnego dłużej niż `window_seconds` jest zapominana.
+    """
+    __slots__ = ("size", "window_seconds", "max_entries", "evicted", "_rings")
+
+    def __init__(self, size: int = 3, window_seconds: float = 300.0, max_entries: int = 100000):
+        self.size = size
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.evicted = 0
+        self._rings = {}
+
+    def push(self, key, content: str, now: float | None = None) -> bool:
+        """Dopisuje wiadomość. True, jeśli ostatnie `size` wiadomości (w oknie czasu) mają identyczną treść."""
+        now = time.time() if now is None else now
+        ring = self._rings.pop(key, None)
+        if ring is None or now - ring.updated_at >= self.window_seconds:
+            ring = _Ring(self.size)
+        self._rings[key] = ring
+        ring.hashes[ring.position] = hash(content)
+        ring.position = (ring.position + 1) % self.size
+        ring.filled = min(self.size, ring.filled + 1)
+        ring.updated_at = now
+        self._evict(now)
+        return ring.filled == self.size and all(value == ring.hashes[0] for value in ring.hashes)
+
+    def _evict(self, now: float):
+        while self._rings:
+            oldest_key = next(iter(self._rings))
+            if now - self._rings[oldest_key].updated_at < self.window_seconds and len(self._rings) <= self.max_entries:
+                break
+            del self._rings[oldest_key]
+            self.evicted += 1
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def memory_stats(self) -> dict:
+        ring_bytes = sys.getsizeof(_Ring(self.size)) + sys.getsizeof([0] * self.size) + self.size * 32 # 32 B na int-skrót
+        return {"entries": len(self._rings), "evicted": self.evicted,
+                "approx_bytes": sys.getsizeof(self._rings) + len(self._rings) * (_KEY_BYTES + ring_bytes)}
+
+_KEY_BYTES = sys.getsizeof((0, 0)) + 2 * 32 # Krotka (guild_id, user_id) z dwoma dużymi intami (snowflake)
+_KEY_AND_FLOAT_BYTES = _KEY_BYTES + sys.getsizeof(0.0)
@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """Ogranicza tempo żądań: `rate` żetonów na sekundę, maksymalnie `capacity` naraz."""
+    __slots__ = ("rate", "capacity", "_tokens", "_updated_at", "_lock")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
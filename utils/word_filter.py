@@ -0,0 +1,65 @@
+import re
+
+def _build_trie(words) -> dict:
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True # Znacznik końca słowa
+    return trie
+
+def _trie_to_pattern(node: dict) -> str:
+    """
+    Zamienia trie na wyrażenie regularne, w którym wspólne prefiksy występują tylko raz.
+    Silnik `re` nie optymalizuje długich alternatyw sam, więc "a|ab|abc|..." byłoby sprawdzane
+    słowo po słowie na każdej pozycji. Wersja z trie kosztuje tyle, ile długość słowa.
+    """
+    word_ends_here = "" in node
+    branches = [re.escape(char) + _trie_to_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if word_ends_here:
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+class BannedWordMatcher:
+    """
+    Jedno skompilowane wyrażenie dla całej czarnej listy słów serwera.
+    Dopasowanie jest równoważne sprawdzaniu r"(?i)\\b" + re.escape(słowo) + r"\\b" dla każdego słowa,
+    ale wiadomość przechodzimy tylko raz, niezależnie od liczby słów.
+    """
+    __slots__ = ("words", "pattern", "_regex")
+
+    def __init__(self, words):
+        self.words = frozenset(word.lower() for word in words if word)
+        if self.words:
+            # Wzorzec bez grup przechwytujących - można go wkleić do większego wyrażenia (automod.py)
+            self.pattern = r"\b" + _trie_to_pattern(_build_trie(self.words)) + r"\b"
+            self._regex = re.compile(self.pattern, re.IGNORECASE)
+        else:
+            self.pattern = None
+            self._regex = None
+
+    def search(self, text: str) -> str | None:
+        """Zwraca pierwsze znalezione zakazane słowo (małymi literami) lub None."""
+        if self._regex is None or not text:
+            return None
+        match = self._regex.search(text)
+        return match.group(0).lower() if match else None
+
+    def __bool__(self) -> bool:
+        return self._regex is not None
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+if __name__ == '__main__':
+    matcher = BannedWordMatcher(["kot", "kotlet", "pies", "a.b"])
+    print(matcher.search("Mam KOTA"))             # None - "kot" nie jest osobnym słowem
+    print(matcher.search("Zjadłem kotlet"))       # kotlet
+    print(matcher.search("kot!"))                 # kot
+    print(matcher.search("to jest a.b test"))     # a.b
+    print(matcher.search("axb"))                  # None - kropka nie jest wildcardem
+    print(BannedWordMatcher([]).search("cokolwiek")) # None
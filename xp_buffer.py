@@ -0,0 +1,163 @@
+"""
+Bufor zapisu (write-behind) dla XP i liczby wiadomości.
+
+Zamiast UPDATE + COMMIT przy każdej wiadomości, zmiany (delty) dla par (guild_id, user_id)
+zbieramy w pamięci i co `flush_interval` sekund (albo po uzbieraniu `max_pending` wpisów)
+zapisujemy je jedną transakcją przez executemany. Sumy XP/poziomu trzymamy w pamięci,
+więc awans na kolejny poziom wykrywamy od razu, bez czekania na zapis.
+Okno trwałości (ile zmian można stracić przy awarii procesu) = flush_interval;
+przy normalnym zamknięciu close() zapisuje wszystko.
+"""
+import asyncio
+import collections
+
+import async_database
+import leveling
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 10.0
+DEFAULT_MAX_PENDING = 500
+DEFAULT_MAX_CACHED_USERS = 50000
+
+class _UserTotals:
+    __slots__ = ("xp", "level", "message_count", "pending_xp", "pending_messages")
+
+    def __init__(self, xp: int, level: int, message_count: int):
+        self.xp = xp
+        self.level = level
+        self.message_count = message_count
+        self.pending_xp = 0
+        self.pending_messages = 0
+
+class XpWriteBuffer:
+    def __init__(self, flush_interval: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 max_cached_users: int = DEFAULT_MAX_CACHED_USERS):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_cached_users = max_cached_users
+        self._totals = collections.OrderedDict() # (guild_id, user_id) -> _UserTotals, kolejność LRU
+        self._dirty = set()
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.flushed_rows = 0
+        self.flush_count = 0
+
+    async def _get_totals(self, guild_id: int, user_id: int) -> _UserTotals:
+        key = (guild_id, user_id)
+        totals = self._totals.get(key)
+        if totals is None:
+            stats = await async_database.get_user_activity(guild_id, user_id)
+            # W trakcie await inna wiadomość tego użytkownika mogła już załadować sumy
+            totals = self._totals.get(key)
+            if totals is None:
+                if stats:
+                    totals = _UserTotals(stats["xp"], stats["level"], stats["message_count"])
+                else:
+                    totals = _UserTotals(0, 0, 0)
+                self._totals[key] = totals
+        self._totals.move_to_end(key)
+        return totals
+
+    async def record_message(self, guild_id: int, user_id: int, xp_amount: int = 0) -> tuple[int, int, int, int]:
+        """
+        Rejestruje wiadomość (i opcjonalnie przyznane XP). Zwraca (old_xp, new_xp, old_level, new_level)
+        na podstawie sum w pamięci, bez zapisu do bazy (zapis przy opróżnianiu bufora).
+        """
+        totals = await self._get_totals(guild_id, user_id)
+        old_xp, old_level = totals.xp, totals.level
+        totals.message_count += 1
+        totals.pending_messages += 1
+        if xp_amount:
+            totals.xp += xp_amount
+            totals.pending_xp += xp_amount
+            totals.level = max(totals.level, leveling.get_level_from_xp(totals.xp))
+        self._dirty.add((guild_id, user_id))
+        if len(self._dirty) >= self.max_pending:
+            self._flush_requested.set()
+        return old_xp, totals.xp, old_level, totals.level
+
+    def invalidate(self, guild_id: int, user_id: int):
+        """Zapomina sumy użytkownika (np. po ręcznej zmianie XP w bazie). Niezapisane delty zostają."""
+        key = (guild_id, user_id)
+        if key not in self._dirty:
+            self._totals.pop(key, None)
+
+    async def flush(self) -> int:
+        """Zapisuje wszystkie zebrane delty jedną transakcją. Zwraca liczbę zapisanych wierszy."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            rows = []
+            for key in dirty:
+                totals = self._totals[key]
+                rows.append((key[0], key[1], totals.pending_messages, totals.pending_xp, totals.level))
+                totals.pending_messages = 0
+                totals.pending_xp = 0
+            try:
+                await async_database.apply_user_activity_deltas(rows)
+            except Exception:
+                # Nie gubimy zmian - delty wracają do bufora i pójdą przy kolejnym zapisie
+                for guild_id, user_id, message_delta, xp_delta, _ in rows:
+                    totals = self._totals[(guild_id, user_id)]
+                    totals.pending_messages += message_delta
+                    totals.pending_xp += xp_delta
+                    self._dirty.add((guild_id, user_id))
+                raise
+            self.flushed_rows += len(rows)
+            self.flush_count += 1
+            self._evict_clean()
+            return len(rows)
+
+    def _evict_clean(self):
+        # Wyrzucamy najdawniej aktywnych użytkowników, ale tylko tych bez niezapisanych zmian
+        excess = len(self._totals) - self.max_cached_users
+        if excess <= 0:
+            return
+        for key in list(self._totals):
+            if excess <= 0:
+                break
+            if key not in self._dirty:
+                del self._totals[key]
+                excess -= 1
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[XP_BUFFER] Błąd zapisu bufora XP (ponowię przy kolejnej próbie): {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Zatrzymuje cykliczny zapis i zapisuje wszystko, co zostało w buforze."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def guild_totals(self, guild_id: int):
+        """Zwraca (user_id, xp, level) z pamięci dla serwera - świeższe niż baza o okno zapisu."""
+        return [(user_id, totals.xp, totals.level)
+                for (totals_guild_id, user_id), totals in self._totals.items() if totals_guild_id == guild_id]
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._dirty)
+
+    @property
+    def cached_count(self) -> int:
+        return len(self._totals)